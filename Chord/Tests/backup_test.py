@@ -0,0 +1,64 @@
+import sys
+import os
+
+import pandas as pd
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from Chord.client import ChordClient
+from Chord.network import ChordNetwork
+from Chord.simulator import ChordSimulator
+from helper_functions import hash_key
+
+
+def backup_test(node_num=20, rows=100, seed=0):
+    """
+    Insert rows through nodes (routed, then from the key location cache) and through a one-hop
+    client, and check that the successor of every owner stores a backup of each of its rows.
+    """
+    simulator = ChordSimulator(seed=seed)
+    network = ChordNetwork(simulator=simulator)
+    simulator.build(network, node_num)
+
+    # Load dataset
+    dataset_path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "Coffee_Reviews_Dataset", "simplified_coffee.csv"
+    )
+    df = pd.read_csv(dataset_path).head(rows)
+    df["review_date"] = pd.to_datetime(df["review_date"], format="%B %Y").dt.year
+    keys = df["loc_country"].apply(hash_key)
+    points = df[["review_date", "rating", "100g_USD"]].to_numpy()
+    reviews = df["review"].to_numpy()
+    countries = df["loc_country"].to_numpy()
+
+    # Half of the rows through nodes, the other half through the client
+    client = ChordClient(network)
+    for i, (key, point, review, country) in enumerate(zip(keys, points, reviews, countries)):
+        if i % 2 == 0:
+            response = network.insert_key(key, point, review, country)
+        else:
+            response = client.insert_key(key, point, review, country)
+        assert response and response["status"] == "success", f"Insert of key {key} failed."
+
+    stored = 0
+    for node in network.nodes.values():
+        if not node.running or not node.kd_tree:
+            continue
+        successor = network.nodes[node.get_successor()]
+        owned_keys, _ = node.kd_tree.get_unique_country_keys()
+        for key in owned_keys:
+            owned = len(node.kd_tree.get_points(key)[0])
+            backed_up = len(successor.back_up.get_points(key)[0]) if successor.back_up else 0
+            assert backed_up == owned, (
+                f"Node {successor.node_id} backs up {backed_up} of the {owned} rows "
+                f"of key {key} stored at node {node.node_id}."
+            )
+            stored += owned
+
+    assert stored == rows, f"{stored} of the {rows} inserted rows are stored."
+    print(f"All {rows} rows are stored at their owner and backed up at its successor.")
+
+
+if __name__ == "__main__":
+    backup_test()
@@ -0,0 +1,58 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from Chord.client import ChordClient
+from Chord.network import ChordNetwork
+from Chord.simulator import ChordSimulator
+from constants import *
+
+
+def live_ids(network):
+    return sorted(node_id for node_id, node in network.nodes.items() if node.running)
+
+
+def grow(simulator, network, joins):
+    """
+    Join new nodes to the network, one membership change each.
+    """
+    for _ in range(joins):
+        simulator.add_node(network)
+
+
+def membership_test(node_num=10, seed=0):
+    """
+    Check that a one-hop client catches up with deltas after a few membership changes, and with
+    a full snapshot after more changes than the nodes log, and that the logs stay bounded.
+    """
+    simulator = ChordSimulator(seed=seed)
+    network = ChordNetwork(simulator=simulator)
+    simulator.build(network, node_num)
+    client = ChordClient(network)
+    assert client.node_ids == live_ids(network), "The client's initial view is wrong."
+
+    # A few changes are within every log, so they are served as deltas
+    grow(simulator, network, 3)
+    node_id = client.node_ids[0]
+    response = network.nodes[node_id].request_membership(node_id, client.version)
+    assert "changes" in response and len(response["changes"]) == 3, f"Got {response}."
+    assert client.sync_membership(node_id) and client.node_ids == live_ids(network)
+
+    # More changes than the logs keep, so the client's version is older than their tail
+    grow(simulator, network, MEMBERSHIP_LOG_SIZE + 1)
+    response = network.nodes[node_id].request_membership(node_id, client.version)
+    assert "snapshot" in response, f"Got a delta of {len(response['changes'])} changes."
+    assert client.sync_membership(node_id) and client.node_ids == live_ids(network)
+    assert client.version == network.membership_version
+
+    for node in network.nodes.values():
+        assert (
+            len(node.membership_log) <= MEMBERSHIP_LOG_SIZE
+        ), f"Node {node.node_id} logs {len(node.membership_log)} membership changes."
+    print("The client syncs from deltas, then from a snapshot once the logs have moved on.")
+
+
+if __name__ == "__main__":
+    membership_test()
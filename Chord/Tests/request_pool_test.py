@@ -0,0 +1,41 @@
+import sys
+import os
+import threading
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from constants import *
+from request_pool import RequestPool, request_class
+
+
+def control_reserved_test(timeout=2.0):
+    """
+    Flood a node's request pool with routing and data requests that never finish, and check
+    that control requests (GET_STATUS, SWIM_PING) are still served by the reserved workers.
+    """
+    pool = RequestPool()
+    release = threading.Event()
+
+    # More blocking routing and data requests than there are workers
+    for operation in ["FIND_SUCCESSOR", "INSERT_KEY"] * REQUEST_WORKERS:
+        assert pool.submit(request_class(operation), release.wait), f"{operation} was rejected."
+
+    for operation in ["GET_STATUS", "SWIM_PING"]:
+        served = threading.Event()
+        assert pool.submit(request_class(operation), served.set), f"{operation} was rejected."
+        assert served.wait(timeout), f"{operation} was not served within {timeout} seconds."
+
+    stats = pool.stats()
+    busy = stats["routing"]["running"] + stats["data"]["running"]
+    assert (
+        busy <= REQUEST_WORKERS - REQUEST_CONTROL_RESERVED
+    ), f"Routing and data requests occupy {busy} of the {REQUEST_WORKERS} workers."
+
+    release.set()
+    pool.shutdown(wait=True)
+    print("Control requests are served while routing and data requests hold every other worker.")
+
+
+if __name__ == "__main__":
+    control_reserved_test()
@@ -0,0 +1,67 @@
+import sys
+import os
+
+import pandas as pd
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from Chord.network import ChordNetwork
+from Chord.simulator import ChordSimulator
+from helper_functions import hash_key
+
+
+def simulation_test(node_num=1000, seed=0, latency=0.01):
+    """
+    Build a ring in virtual time, replay inserts, churn and lookups, and report hops and messages.
+    """
+    simulator = ChordSimulator(seed=seed, latency=latency)
+    network = ChordNetwork(simulator=simulator)
+
+    print(f"Building a ring of {node_num} nodes...")
+    simulator.build(network, node_num)
+
+    # Load dataset
+    df = pd.read_csv("../../Coffee_Reviews_Dataset/simplified_coffee.csv")
+    df["review_date"] = pd.to_datetime(df["review_date"], format="%B %Y").dt.year
+    keys = df["loc_country"].apply(hash_key)
+    points = df[["review_date", "rating", "100g_USD"]].to_numpy()
+    reviews = df["review"].to_numpy()
+    countries = df["loc_country"].to_numpy()
+
+    # Inserts, then one leave and one join per second, then lookups
+    start = simulator.now
+    trace = [
+        (start + 0.01 * i, "insert", key, point, review, country)
+        for i, (key, point, review, country) in enumerate(zip(keys, points, reviews, countries))
+    ]
+    churn_start = trace[-1][0] + 1
+    node_ids = sorted(network.nodes.keys())
+    for i in range(10):
+        trace.append((churn_start + i, "leave", simulator.random.choice(node_ids)))
+        trace.append((churn_start + i + 0.5, "join"))
+    lookup_start = churn_start + 15
+    for i, key in enumerate(sorted(set(keys))):
+        trace.append((lookup_start + 0.01 * i, "lookup", key, [2018, 0, 0], [2018, 0, 0], 0))
+
+    results = simulator.run_trace(network, trace)
+
+    for operation in ["insert", "join", "leave", "lookup"]:
+        op_results = [r for r in results if r["operation"] == operation]
+        if not op_results:
+            continue
+        hops = [r["hops"] for r in op_results if r["hops"] is not None]
+        avg_hops = sum(hops) / len(hops) if hops else 0
+        avg_messages = sum(r["messages"] for r in op_results) / len(op_results)
+        avg_latency = sum(r["latency"] for r in op_results) / len(op_results)
+        print(
+            f"{operation:<7} | ops: {len(op_results):<5} | hops: {avg_hops:.2f} | "
+            f"messages: {avg_messages:.2f} | latency: {avg_latency:.3f}s"
+        )
+
+    print(f"\nTotal messages: {simulator.messages}, virtual time: {simulator.now:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    simulation_test()
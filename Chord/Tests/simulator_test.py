@@ -0,0 +1,64 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from Chord.network import ChordNetwork
+from Chord.simulator import ChordSimulator
+
+
+def in_flight_test(node_num=10, seed=0, latency=0.01, timeout=1.0):
+    """
+    Check that requests take virtual time: a request to a node that has left is refused after a
+    round trip, and a node that leaves while it routes a request never answers it.
+    """
+    simulator = ChordSimulator(seed=seed, latency=latency)
+    network = ChordNetwork(simulator=simulator)
+    simulator.build(network, node_num)
+    sender, target, departed = [network.nodes[node_id] for node_id in sorted(network.nodes)[:3]]
+
+    # Refused
+    departed.leave()
+    start = simulator.now
+    request = {"operation": "GET_STATUS"}
+    assert sender.send_request(departed, request, max_timeout=timeout) is None
+    assert (
+        abs(simulator.now - start - 2 * latency) < 1e-9
+    ), f"Refused after {simulator.now - start}s."
+
+    # The target leaves after the request has arrived, while it forwards it around the ring
+    simulator.call_later(1.5 * latency, target.leave)
+    start = simulator.now
+    key = (sender.node_id - 1) % network.ring_size  # Owned by the sender, far from the target
+    response = sender.request_find_successor(key, target, [], timeout)
+    assert response is None, f"Got {response} from a node that has left."
+    assert abs(simulator.now - start - timeout) < 1e-9, f"Gave up after {simulator.now - start}s."
+    print("Requests are refused by nodes that have left and lost by nodes that leave meanwhile.")
+
+
+def determinism_test(node_num=20, seed=0):
+    """
+    Replay the same trace twice and check that the runs are identical.
+    """
+    runs = []
+    for _ in range(2):
+        simulator = ChordSimulator(seed=seed, latency=lambda random: random.uniform(0.005, 0.05))
+        network = ChordNetwork(simulator=simulator)
+        simulator.build(network, node_num)
+        node_ids = sorted(network.nodes)
+        trace = [
+            (simulator.now + 0.01 * i, "insert", network.hash_key(str(i)), [2018, 90, 5], "r", "c")
+            for i in range(50)
+        ]
+        trace += [(simulator.now + 0.2, "leave", node_ids[3]), (simulator.now + 0.3, "join")]
+        results = simulator.run_trace(network, trace)
+        runs.append((results, simulator.messages, simulator.now))
+
+    assert runs[0] == runs[1], "Two runs with the same seed differ."
+    print(f"Two runs with the same seed send the same {runs[0][1]} messages.")
+
+
+if __name__ == "__main__":
+    in_flight_test()
+    determinism_test()
@@ -65,10 +65,13 @@ class ChordDashboard(Dashboard):
         self.ax_ring.set_xticks([])
         self.ax_ring.set_yticks([])
 
+    def hash_key(self, country):
+        return self.network.hash_key(country)
+
     def visualize_network(self, threshold=0.3):
         """
         Visualizes the Chord network by placing nodes on a circular ring
-        based on their 4-digit hex ID. Lower values are at the top (12 o'clock),
+        based on their ID. Lower values are at the top (12 o'clock),
         and values increase clockwise.
 
         Nodes that are too close together will be moved slightly.
@@ -80,8 +83,8 @@ class ChordDashboard(Dashboard):
         # Filter nodes that have the 'running' attribute set to True
         filtered_nodes = [node_id for node_id, node in self.network.nodes.items() if node.running]
 
-        # Sort the filtered nodes by their hex ID
-        sorted_nodes = sorted(filtered_nodes, key=lambda x: int(x, 16))
+        # Sort the filtered nodes by their ID
+        sorted_nodes = sorted(filtered_nodes)
 
         self.ax_ring.clear()
         self.ax_ring.set_title("Chord Overlay Network Visualization")
@@ -104,7 +107,7 @@ class ChordDashboard(Dashboard):
 
         # Arrange nodes based on their numerical value
         for node_id in sorted_nodes:
-            angle = 2 * np.pi * (int(node_id, 16) / 0xFFFF)
+            angle = 2 * np.pi * (node_id / self.network.ring_size)
             base_x, base_y = radius * np.sin(angle), radius * np.cos(angle)
 
             # Check for overlap within the threshold distance
@@ -140,7 +143,7 @@ class ChordDashboard(Dashboard):
             self.ax_ring.text(
                 text_x,
                 text_y,
-                node_id,
+                self.network.format_id(node_id),
                 fontsize=10,
                 ha=ha,
                 va=va,
@@ -159,7 +162,11 @@ class ChordDashboard(Dashboard):
         join_window.title("Node Join")
         join_window.geometry("300x150")
 
-        tk.Label(join_window, text="Enter 4-digit hex ID:", font=("Arial", 14)).pack(pady=10)
+        tk.Label(
+            join_window,
+            text=f"Enter {self.network.hash_hex_digits}-digit hex ID:",
+            font=("Arial", 14),
+        ).pack(pady=10)
 
         entry = tk.Entry(join_window, width=20)
         entry.pack(pady=2)
@@ -179,7 +186,9 @@ class ChordDashboard(Dashboard):
             print("\nNode join canceled.")
             return
 
-        if len(new_node_id) != 4 or not all(c in "0123456789abcdefABCDEF" for c in new_node_id):
+        if len(new_node_id) != self.network.hash_hex_digits or not all(
+            c in "0123456789abcdefABCDEF" for c in new_node_id
+        ):
             print("Invalid Node ID.")
             return
 
@@ -0,0 +1,144 @@
+import bisect
+
+from constants import *
+from helper_functions import *
+
+
+class ChordClient:
+    """
+    One-hop client for a Chord network.
+
+    The client keeps the IDs of all the live nodes in a sorted list and sends every key operation
+    straight to the successor of the key. The list is kept up to date with versioned membership
+    deltas pulled from any node (GET_MEMBERSHIP), or with the full list of live nodes when the
+    node no longer logs all the changes since the client's version. The responsible node validates
+    every request, so a stale view only costs a redirect, after which the client syncs and retries,
+    and finally falls back to a routed operation.
+    """
+
+    def __init__(self, network, bootstrap_id=None):
+        """
+        Args:
+            network (ChordNetwork): The network the client talks to.
+            bootstrap_id (int or str, optional): Node to pull the initial membership from.
+                A random running node is used if not provided.
+        """
+        self.network = network
+        self.node_ids = []  # Sorted IDs of the live nodes
+        self.version = 0  # Number of membership changes applied so far
+
+        if bootstrap_id is None:
+            bootstrap_id = network.random.choice(
+                [node_id for node_id, node in network.nodes.items() if node.running]
+            )
+        self.sync_membership(network.to_id(bootstrap_id))
+
+    # Membership
+
+    def sync_membership(self, node_id=None):
+        """
+        Pull the membership changes since the client's version from a node and apply them.
+        Returns True if a node answered.
+        """
+        candidates = [node_id] if node_id is not None else []
+        candidates += self.network.random.sample(self.node_ids, len(self.node_ids))
+
+        for candidate in candidates:
+            response = self._send(
+                candidate, {"operation": "GET_MEMBERSHIP", "version": self.version}
+            )
+            if response is None:
+                continue
+
+            if "snapshot" in response:
+                self.node_ids = sorted(response["snapshot"])
+            for changed_id, joined in response.get("changes", []):
+                index = bisect.bisect_left(self.node_ids, changed_id)
+                present = index < len(self.node_ids) and self.node_ids[index] == changed_id
+                if joined and not present:
+                    self.node_ids.insert(index, changed_id)
+                elif not joined and present:
+                    del self.node_ids[index]
+            self.version = response["version"]
+            return True
+
+        print("Client: No node answered the membership request.")
+        return False
+
+    def get_responsible_node(self, key):
+        """
+        Return the ID of the first node at or after the key on the ring.
+        """
+        index = bisect.bisect_left(self.node_ids, key)
+        return self.node_ids[index % len(self.node_ids)]
+
+    # Key Operations
+
+    def insert_key(self, key, point, review, country):
+        key = self.network.to_id(key)
+        request = {
+            "operation": "INSERT_KEY",
+            "key": key,
+            "point": point,
+            "review": review,
+            "country": country,
+            "choice": True,
+        }
+        return self._execute(request, lambda node: node.insert_key(key, point, review, country))
+
+    def delete_key(self, key):
+        key = self.network.to_id(key)
+        request = {"operation": "DELETE_KEY", "key": key, "choice": True}
+        return self._execute(request, lambda node: node.delete_key(key))
+
+    def update_key(self, key, updated_data, criteria=None):
+        key = self.network.to_id(key)
+        request = {
+            "operation": "UPDATE_KEY",
+            "key": key,
+            "data": updated_data,
+            "criteria": criteria,
+            "choice": True,
+        }
+        return self._execute(request, lambda node: node.update_key(key, updated_data, criteria))
+
+    def lookup(self, key, lower_bounds, upper_bounds, N=5):
+        key = self.network.to_id(key)
+        request = {
+            "operation": "LOOKUP",
+            "key": key,
+            "lower_bounds": lower_bounds,
+            "upper_bounds": upper_bounds,
+            "N": N,
+        }
+        return self._execute(request, lambda node: node.lookup(key, lower_bounds, upper_bounds, N))
+
+    def _execute(self, request, routed_operation):
+        """
+        Send the request straight to the responsible node. On a miss (or an overload response),
+        sync the membership and retry once, then fall back to routing the operation from a live node.
+        """
+        request["hops"] = 0
+        request["cached"] = True  # Ask the receiver to validate that it owns the key
+
+        for attempt in range(2):
+            if not self.node_ids:
+                break
+            response = self._send(self.get_responsible_node(request["key"]), request)
+            if response is not None and response.get("status") not in ("redirect", "overloaded"):
+                return response
+            if attempt == 0 and not self.sync_membership():
+                break
+
+        # Routed fallback
+        for node_id in self.network.random.sample(self.node_ids, len(self.node_ids)):
+            node = self.network.nodes.get(node_id)
+            if node is not None and node.running:
+                return routed_operation(node)
+        return None
+
+    def _send(self, node_id, request):
+        node = self.network.nodes.get(node_id)
+        if node is None:
+            return None
+        return self.network.transport.send_request(node.address[1], request)
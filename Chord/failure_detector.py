@@ -0,0 +1,93 @@
+import threading
+
+from constants import *
+
+
+class FailureDetector:
+    """
+    Local view of which peers of a Chord node are alive.
+
+    Liveness is learned from the replies of the node's own RPCs: a reply marks the peer alive and
+    a failed request marks it suspected. Suspected peers are avoided by routing and are probed in
+    the background with GET_STATUS until they answer, so a peer that was only slow for a while
+    is used again. The probe interval doubles after each failed probe, up to
+    SUSPECT_PROBE_MAX_INTERVAL. A suspect is considered dead once SUSPECT_PROBE_RETRIES probes
+    have failed. A suspect that the node no longer refers to is forgotten.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        # Dictionary. Keys are suspected node IDs, values are failed probe counts
+        self.suspects = {}
+        self.lock = threading.Lock()
+
+    def is_alive(self, node_id):
+        """
+        Return False if the peer is currently suspected to have failed.
+        """
+        return node_id not in self.suspects
+
+    def is_dead(self, node_id):
+        """
+        Return True if the suspicion of the peer has been confirmed by SUSPECT_PROBE_RETRIES
+        failed probes. A failed request alone only makes the peer a suspect.
+        """
+        return self.suspects.get(node_id, 0) >= SUSPECT_PROBE_RETRIES
+
+    def record_reply(self, node_id):
+        """
+        The peer answered a request, clear any suspicion.
+        """
+        if node_id in self.suspects:
+            with self.lock:
+                self.suspects.pop(node_id, None)
+
+    def record_failure(self, node_id):
+        """
+        A request to the peer failed. Suspect it and schedule a probe if it was not suspected already.
+        """
+        if node_id == self.node.node_id:
+            return
+        with self.lock:
+            if node_id in self.suspects:
+                return
+            self.suspects[node_id] = 0
+        self.node.network.scheduler.call_later(SUSPECT_PROBE_INTERVAL, self._probe, node_id)
+
+    def _probe(self, node_id):
+        if not self.node.running or node_id not in self.suspects:
+            return
+
+        if not self._is_referenced(node_id):
+            # Routing no longer uses the peer, a new failed request would suspect it again
+            with self.lock:
+                self.suspects.pop(node_id, None)
+            return
+
+        delay = self.node.peer_stats.retry_delay(node_id)
+        if delay > 0:
+            # The peer's circuit is open and would reject the probe, wait for its trial request
+            self.node.network.scheduler.call_later(delay, self._probe, node_id)
+            return
+
+        # send_request records the outcome, a reply clears the suspicion
+        if self.node.request_status_running(node_id):
+            return
+
+        # No reply, or a reply from a node that has left
+        with self.lock:
+            failed_probes = self.suspects.get(node_id, 0) + 1
+            self.suspects[node_id] = failed_probes
+        interval = min(SUSPECT_PROBE_INTERVAL * 2**failed_probes, SUSPECT_PROBE_MAX_INTERVAL)
+        self.node.network.scheduler.call_later(interval, self._probe, node_id)
+
+    def _is_referenced(self, node_id):
+        """
+        Check if the peer is in the node's successor list, finger table, or is its predecessor.
+        """
+        node = self.node
+        return (
+            node_id == node.predecessor
+            or node_id in node.successors
+            or node_id in node.finger_table
+        )
@@ -1,17 +1,43 @@
 import random
 import pandas as pd
 
+from constants import *
 from helper_functions import *
+from scheduler import get_scheduler
+from transport import SocketTransport
 from .chord_gui import ChordDashboard
 from .node import ChordNode
 
 
 class ChordNetwork:
-    def __init__(self, main_window=None):
-        self.nodes = {}  # Dictionary. Keys are node IDs, values are Node objects
+    def __init__(self, main_window=None, simulator=None, m=M):
+        if not 0 < m <= 160:
+            raise ValueError(
+                "The identifier width m must be between 1 and 160 bits (the width of SHA-1)."
+            )
+        self.m = m  # Bit size of the identifier space
+        self.ring_size = 2**m
+        self.hash_hex_digits = (m + 3) // 4  # Hex digits of the keys handed out by hash_key
+
+        self.nodes = {}  # Dictionary. Keys are integer node IDs, values are Node objects
         self.used_ports = []
-
-        self.gui = ChordDashboard(self, main_window)
+        # Number of membership changes so far. Each node logs the recent ones for the clients
+        self.membership_version = 0
+
+        # Discrete-event simulator driving the network in virtual time (None for real time)
+        self.simulator = simulator
+
+        if simulator is not None:
+            # Simulations run headless, with seeded randomness, simulated messages and virtual timers
+            self.transport = simulator.transport
+            self.scheduler = simulator
+            self.random = simulator.random
+            self.gui = None
+        else:
+            self.transport = SocketTransport()
+            self.scheduler = get_scheduler()  # Shared by every Chord node of the process
+            self.random = random
+            self.gui = ChordDashboard(self, main_window)
 
     def node_join(self, new_node):
         """
@@ -25,16 +51,48 @@ class ChordNetwork:
 
         if len(self.nodes) == 1:
             print(f"The network is empty. This node {node_id} is the first node.")
+            self.record_membership_change(node_id, True)
             return [None]
 
-        random_id = random.choice(list(self.nodes.keys()))
+        random_id = self.random.choice(list(self.nodes.keys()))
         while node_id == random_id or not self.nodes[random_id].running:
-            random_id = random.choice(list(self.nodes.keys()))
+            random_id = self.random.choice(list(self.nodes.keys()))
         successor_id, hops = new_node.request_find_successor(node_id, self.nodes[random_id], [])
         # new_node joins on successor
         new_node.join(self.nodes[successor_id])
+        self.record_membership_change(node_id, True)
         return hops
 
+    def to_id(self, value):
+        """
+        Convert a hex string ID or key to its integer position on the ring. Integers are returned as is.
+        """
+        if isinstance(value, str):
+            return int(value, 16) % self.ring_size
+        return int(value)
+
+    def format_id(self, node_id):
+        """
+        Format an integer ID or key as a zero-padded hex string.
+        """
+        return int_to_hex(node_id, self.hash_hex_digits)
+
+    def hash_key(self, value):
+        """
+        Hash a value (e.g. a country) to a hex key as wide as the identifier space.
+        """
+        return hash_key(value, self.hash_hex_digits)
+
+    def record_membership_change(self, node_id, joined):
+        """
+        Announce a join or leave to the membership logs of the running nodes, which one-hop
+        clients sync from.
+        """
+        self.membership_version += 1
+        for node in list(self.nodes.values()):
+            if node.running:
+                node.record_membership_change(self.membership_version, node_id, joined)
+
     def build(self, predefined_ids=None, node_num=None, dataset_path=None):
         """
         Build the Chord network with the specified number of nodes.
@@ -78,7 +136,7 @@ class ChordNetwork:
         df["review_date"] = pd.to_datetime(df["review_date"], format="%B %Y").dt.year
 
         # Extract loc_country as keys
-        keys = df["loc_country"].apply(hash_key)
+        keys = df["loc_country"].apply(self.hash_key)
 
         # Extract data points (review_date, rating, 100g_USD)
         points = df[["review_date", "rating", "100g_USD"]].to_numpy()
@@ -98,25 +156,25 @@ class ChordNetwork:
             self.insert_key(key, point, review, country)
 
     def insert_key(self, key, point, review, country):
-        random_id = random.choice(list(self.nodes.keys()))
+        random_id = self.random.choice(list(self.nodes.keys()))
         while not self.nodes[random_id].running:
-            random_id = random.choice(list(self.nodes.keys()))
+            random_id = self.random.choice(list(self.nodes.keys()))
         return self.nodes[random_id].insert_key(key, point, review, country)
 
     def delete_key(self, key):
-        random_id = random.choice(list(self.nodes.keys()))
+        random_id = self.random.choice(list(self.nodes.keys()))
         while not self.nodes[random_id].running:
-            random_id = random.choice(list(self.nodes.keys()))
+            random_id = self.random.choice(list(self.nodes.keys()))
         return self.nodes[random_id].delete_key(key)
 
     def update_key(self, key, updated_data, criteria=None):
-        random_id = random.choice(list(self.nodes.keys()))
+        random_id = self.random.choice(list(self.nodes.keys()))
         while not self.nodes[random_id].running:
-            random_id = random.choice(list(self.nodes.keys()))
+            random_id = self.random.choice(list(self.nodes.keys()))
         return self.nodes[random_id].update_key(key, updated_data, criteria)
 
     def lookup(self, key, lower_bounds, upper_bounds, N):
-        random_id = random.choice(list(self.nodes.keys()))
+        random_id = self.random.choice(list(self.nodes.keys()))
         while not self.nodes[random_id].running:
-            random_id = random.choice(list(self.nodes.keys()))
+            random_id = self.random.choice(list(self.nodes.keys()))
         return self.nodes[random_id].lookup(key, lower_bounds, upper_bounds, N)
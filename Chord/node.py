@@ -1,10 +1,9 @@
 import struct
 import threading
+from collections import OrderedDict, deque
 import socket
 import hashlib
 import pickle
-from concurrent.futures import ThreadPoolExecutor
-import time
 import numpy as np
 import subprocess  # for running netsh to get excluded ports on Windows
 import re
@@ -16,32 +15,59 @@ from helper_functions import *
 from Multidimensional_Data_Structures.kd_tree import KDTree
 from Multidimensional_Data_Structures.lsh import LSH
 from sklearn.feature_extraction.text import TfidfVectorizer
+from peer_stats import PeerStats
+from request_server import RequestServer
+from request_pool import is_overloaded
+from .failure_detector import FailureDetector
 
 
-class ChordNode:
+class ChordNode(RequestServer):
 
     def __init__(self, network, node_id=None):
         """
         Initialize a new Chord node with a unique ID, address, and empty data structures.
         """
         self.network = network  # Reference to the DHT network
+        self.m = network.m  # Bit size of the identifier space
+        self.ring_size = network.ring_size
         self.address = self._generate_address()  # (IP, Port)
-        self.node_id = node_id if node_id is not None else self._generate_id(self.address)
+        # Integer position on the ring. A hex string ID is converted here
+        self.node_id = (
+            network.to_id(node_id) if node_id is not None else self._generate_id(self.address)
+        )
         self.kd_tree = None  # Centralized KD-Tree
 
         self.predecessor = self.node_id
-        self.finger_table = [self.node_id] * M
+        self.finger_table = [self.node_id] * self.m
+        self.next_finger = 1  # Next finger to refresh in update_finger_table
 
         self.successors = [self.node_id] * S
         self.running = True
 
         self.back_up = None  # For storing key-value pairs
 
-        self.lock = threading.Lock()  # Lock for thread safety
+        # Lock for thread safety, from the scheduler because handlers hold it across requests
+        self.lock = self.network.scheduler.lock()
 
         # Create a thread pool for handling requests to limit the number of concurrent threads
-        self.thread_pool = ThreadPoolExecutor(max_workers=10)
+        self.thread_pool = self.network.transport.create_thread_pool()
         self.stop_event = threading.Event()  # event to stop while
+        self.timers = []  # Stabilization timers on the network's scheduler
+        self.failure_detector = FailureDetector(self)  # Liveness of peers, learned from RPC replies
+        # Round-trip times, timeouts and circuit breakers of the requests to each peer
+        self.peer_stats = PeerStats(self.network.scheduler.clock)
+
+        # LRU cache of key locations. Keys are responsible node IDs, values are the (exclusive)
+        # start of the key interval they are responsible for
+        self.key_cache = OrderedDict()
+        self.key_cache_lock = threading.Lock()
+
+        # Live node IDs known to this node, and the last MEMBERSHIP_LOG_SIZE changes to them as
+        # (version, node ID, joined). Served to one-hop clients by GET_MEMBERSHIP
+        self.members = set()
+        self.membership_version = 0
+        self.membership_log = deque(maxlen=MEMBERSHIP_LOG_SIZE)
+        self.membership_lock = threading.Lock()
 
     # Initialization Methods
 
@@ -51,9 +77,8 @@ class ChordNode:
         """
         # Simulate unique IPs in a private network range (192.168.x.x)
         ip = f"192.168.{np.random.randint(0, 256)}.{np.random.randint(1, 256)}"
-        port = (
-            port or self._generate_port()
-        )  # np.random.randint(1024, 65535)  # Random port if not provided
+        # Reserve a port through the network's transport if not provided
+        port = port or self.network.transport.allocate_port(self)
         return (ip, port)
 
     def _generate_id(self, address):
@@ -62,7 +87,7 @@ class ChordNode:
         """
         address_str = f"{address[0]}:{address[1]}"
         sha1_hash = hashlib.sha1(address_str.encode()).hexdigest()
-        node_id = sha1_hash[-HASH_HEX_DIGITS:]  # Take the last 128 bits
+        node_id = int(sha1_hash, 16) % self.ring_size  # Keep the last m bits
         return node_id
 
     def get_excluded_ports(self):
@@ -136,44 +161,47 @@ class ChordNode:
         Return a string containing the state of the node (ID, Address, Data Structures).
         """
         state = []
-        state.append(f"Node ID: {self.node_id}")
+        format_id = self.network.format_id
+        state.append(f"Node ID: {format_id(self.node_id)}")
         state.append(f"Port: {self.address[1]}")
-        state.append(f"\nPredecessor: {self.predecessor}")
-        state.append(f"Successors: {self.successors}")
-        state.append(f"\nFinger Table: {self.finger_table}")
+        state.append(f"\nPredecessor: {format_id(self.predecessor)}")
+        state.append(f"Successors: {list(map(format_id, self.successors))}")
+        state.append(f"\nFinger Table: {list(map(format_id, self.finger_table))}")
 
         # KD Tree Information
         state.append("\nKD Tree:\nUnique Country Keys:")
-        if not self.kd_tree or self.kd_tree.country_keys.size == 0:
+        snapshot = self.kd_tree.snapshot() if self.kd_tree else None
+        if not snapshot or snapshot.size == 0:
             state.append("[]")  # Empty KD Tree
         else:
-            unique_keys, counts = np.unique(self.kd_tree.country_keys, return_counts=True)
-            state.append(f"{list(map(str, unique_keys))}")
+            unique_keys, counts = np.unique(snapshot.country_keys, return_counts=True)
+            state.append(f"{list(map(format_id, unique_keys))}")
 
             # Country count table
             state.append("\nNumber of points/reviews for each country:")
             state.append(f"{'Country Key':<12} | {'Country Name':<14} | {'Count':<6}")
             state.append("-" * 38)
 
-            country_map = dict(zip(self.kd_tree.country_keys, self.kd_tree.countries))
+            country_map = dict(zip(snapshot.country_keys, snapshot.countries))
             for key, count in zip(unique_keys, counts):
-                state.append(f"{key:<12} | {country_map[key]:<14} | {count:<6}")
+                state.append(f"{format_id(key):<12} | {country_map[key]:<14} | {count:<6}")
 
         state.append("\nBackup:\nUnique Country Keys:")
-        if not self.back_up or self.back_up.country_keys.size == 0:
+        snapshot = self.back_up.snapshot() if self.back_up else None
+        if not snapshot or snapshot.size == 0:
             state.append("[]")  # Empty Backup
         else:
-            unique_keys, counts = np.unique(self.back_up.country_keys, return_counts=True)
-            state.append(f"{list(map(str, unique_keys))}")
+            unique_keys, counts = np.unique(snapshot.country_keys, return_counts=True)
+            state.append(f"{list(map(format_id, unique_keys))}")
 
             # Country count table
             state.append("\nNumber of points/reviews for each country:")
             state.append(f"{'Country Key':<12} | {'Country Name':<14} | {'Count':<6}")
             state.append("-" * 38)
 
-            country_map = dict(zip(self.back_up.country_keys, self.back_up.countries))
+            country_map = dict(zip(snapshot.country_keys, snapshot.countries))
             for key, count in zip(unique_keys, counts):
-                state.append(f"{key:<12} | {country_map[key]:<14} | {count:<6}")
+                state.append(f"{format_id(key):<12} | {country_map[key]:<14} | {count:<6}")
 
         return "\n".join(state)
 
@@ -181,23 +209,26 @@ class ChordNode:
         """
         Print the state of the node (ID, Address, Data Structures).
         """
+        format_id = self.network.format_id
         print("\n" + "-" * 100)
-        print(f"-- Node ID: {self.node_id} --")
-        print(f"* Predecessor: {self.predecessor}")
-        print(f"* Finger Table: {self.finger_table}")
-        print(f"* Successors: {self.successors}")
+        print(f"-- Node ID: {format_id(self.node_id)} --")
+        print(f"* Predecessor: {format_id(self.predecessor)}")
+        print(f"* Finger Table: {list(map(format_id, self.finger_table))}")
+        print(f"* Successors: {list(map(format_id, self.successors))}")
         if self.kd_tree:
+            snapshot = self.kd_tree.snapshot()
             print("* KDTree Info")
-            print(f"\tUnique Countries: {list(set(self.kd_tree.countries))}")
-            print(f"\tUnique keys: {np.unique(self.kd_tree.country_keys)}")
-            print(f"\tNum of points: {len(self.kd_tree.points)}")
+            print(f"\tUnique Countries: {list(set(snapshot.countries))}")
+            print(f"\tUnique keys: {list(map(format_id, np.unique(snapshot.country_keys)))}")
+            print(f"\tNum of points: {snapshot.size}")
         else:
             print("* KDTree is Empty.")
         if self.back_up:
+            snapshot = self.back_up.snapshot()
             print("* Backup Info")
-            print(f"\tUnique Countries: {list(set(self.back_up.countries))}")
-            print(f"\tUnique keys: {np.unique(self.back_up.country_keys)}")
-            print(f"\tNum of points: {len(self.back_up.points)}")
+            print(f"\tUnique Countries: {list(set(snapshot.countries))}")
+            print(f"\tUnique keys: {list(map(format_id, np.unique(snapshot.country_keys)))}")
+            print(f"\tNum of points: {snapshot.size}")
         else:
             print("* Backup is Empty.")
 
@@ -207,28 +238,13 @@ class ChordNode:
         """
         Start the server thread to listen for incoming requests.
         """
-        self.thread_pool.submit(self._server)
-        self.thread_pool.submit(self._update_successors_scheduler)
-        self.thread_pool.submit(self._update_finger_table_scheduler)
+        self.network.transport.start(self.address[1], self)
 
-    def _update_finger_table_scheduler(self):
-        interval = 1.5  # seconds
-        while True:
-            if not self.running:
-                break
-            time.sleep(interval)
-            self.update_finger_table()
-            # print("Updated Finger Table of Node:", self.node_id)
-
-    def _update_successors_scheduler(self):
-        interval = 0.5  # seconds
-        while True:
-            if not self.running:
-                break
-            time.sleep(interval)
-            self.update_successors_on_join()
-            self.update_successors_on_leave()
-            # print(".", end=" ", flush=True)
+        # Periodic maintenance runs as short tasks on the network's shared scheduler
+        self.timers = [
+            self.network.scheduler.call_every(STABILIZE_INTERVAL, self.stabilize),
+            self.network.scheduler.call_every(FIX_FINGERS_INTERVAL, self.update_finger_table),
+        ]
 
     def _server(self):
         """
@@ -253,118 +269,106 @@ class ChordNode:
             while not self.stop_event.is_set():
                 try:
                     conn, addr = s.accept()  # Accept incoming connection
-                    # Submit the connection to the thread pool for handling
-                    self.thread_pool.submit(self._handle_request, conn)
+                    # Queue the request by class, or shed it if the node is overloaded
+                    self._admit_request(conn)
                 except socket.timeout:
                     continue  # Check stop_event again
                 except RuntimeError as e:
                     print(f"Runtime Error: {e}")
                     return None
 
-    def _handle_request(self, conn):
-        try:
-            # Receive the length of the incoming data (first 4 bytes)
-            length_data = conn.recv(4)
-            if not length_data:
-                return
-            data_length = struct.unpack(">I", length_data)[0]
-
-            # Receive the actual data
-            data = b""
-            while len(data) < data_length:
-                chunk = conn.recv(min(data_length - len(data), 1024 * 1024))
-                if not chunk:
-                    break
-                data += chunk
+    def _process_request(self, request):
+        """
+        Dispatch a deserialized request to its handler and return the response.
+        """
+        operation = request["operation"]
+        response = None
 
-            request = pickle.loads(data)  # Deserialize the request
-            operation = request["operation"]
-            response = None
+        if request.get("cached") and not self.is_responsible(request["key"]):
+            # Sent from a stale key location cache entry, the sender must route the request
+            return {
+                "status": "redirect",
+                "message": f"Node {self.node_id} is not responsible for key {request['key']}.",
+                "hops": request["hops"],
+            }
 
-            if operation == "FIND_SUCCESSOR":
-                response = self._handle_find_successor(request)
-            if operation == "DELETE_SUCCESSOR_KEYS":
-                response = self._handle_delete_successor_keys(request)
-            if operation == "SET_SUCCESSOR":
-                response = self._handle_set_successor(request)
-            if operation == "SET_PREDECESSOR":
-                response = self._handle_set_predecessor(request)
-            if operation == "INSERT_KEY":
-                response = self._handle_insert_key_request(request)
-            if operation == "DELETE_KEY":
-                response = self._handle_delete_key_request(request)
-            if operation == "UPDATE_KEY":
-                response = self._handle_update_key_request(request)
-            if operation == "LOOKUP":
-                response = self._handle_lookup_request(request)
-            if operation == "RESTORATION":
-                response = self._handle_restoration_request(request)
-            if operation == "SET_BACKUP":
-                response = self._handle_set_backup(request)
-            if operation == "GET_SUCCESSOR":
-                response = self._handle_get_successor_request()
-            if operation == "GET_STATUS":
-                response = self._handle_get_status_request()
-
-            # Add more operations here as needed
-
-            # Serialize the response
-            response_data = pickle.dumps(response)
-            # Send the length of the response first (4 bytes)
-            conn.sendall(struct.pack(">I", len(response_data)))
-
-            # Send the actual response
-            conn.sendall(response_data)
-        except Exception as e:
-            print(f"Error handling request: {e}")
-        finally:
-            conn.close()
-
-    def send_request(self, node, request):
+        if operation == "FIND_SUCCESSOR":
+            response = self._handle_find_successor(request)
+        if operation == "DELETE_SUCCESSOR_KEYS":
+            response = self._handle_delete_successor_keys(request)
+        if operation == "SET_SUCCESSOR":
+            response = self._handle_set_successor(request)
+        if operation == "SET_PREDECESSOR":
+            response = self._handle_set_predecessor(request)
+        if operation == "INSERT_KEY":
+            response = self._handle_insert_key_request(request)
+        if operation == "DELETE_KEY":
+            response = self._handle_delete_key_request(request)
+        if operation == "UPDATE_KEY":
+            response = self._handle_update_key_request(request)
+        if operation == "LOOKUP":
+            response = self._handle_lookup_request(request)
+        if operation == "RESTORATION":
+            response = self._handle_restoration_request(request)
+        if operation == "SET_BACKUP":
+            response = self._handle_set_backup(request)
+        if operation == "GET_SUCCESSOR_LIST":
+            response = self._handle_get_successor_list_request()
+        if operation == "GET_STATUS":
+            response = self._handle_get_status_request()
+        if operation == "GET_FINGER_TABLE":
+            response = self._handle_get_finger_table_request()
+        if operation == "GET_MEMBERSHIP":
+            response = self._handle_get_membership_request(request)
+
+        # Add more operations here as needed
+
+        return response
+
+    def send_request(self, node, request, return_overload=False, max_timeout=None):
         """
         Send a request to a node and wait for its response.
+        The timeout is estimated from the node's round-trip times (at most max_timeout seconds,
+        if given), and the request fails fast while the node's circuit is open. The outcome is
+        recorded in the failure detector.
+        A request shed by an overloaded node returns None (or the overload response with
+        return_overload=True), but the node is not suspected.
         """
-        connect_address = ("127.0.0.1", node.address[1])
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(120)  # Timeout to avoid long delays
-                s.connect(connect_address)
-                # Serialize the request
-                data = pickle.dumps(request)
-
-                # Send the length of the data first (4 bytes)
-                s.sendall(struct.pack(">I", len(data)))
-
-                # Send the actual data
-                s.sendall(data)
-
-                # Receive the response length
-                response_length_data = s.recv(4)
-                if not response_length_data:
-                    return None
-                response_length = struct.unpack(">I", response_length_data)[0]
-
-                # Receive the response data
-                response_data = b""
-                while len(response_data) < response_length:
-                    chunk = s.recv(min(response_length - len(response_data), 1024 * 1024))
-                    if not chunk:
-                        break
-                    response_data += chunk
-                return pickle.loads(response_data)
+        if not self.peer_stats.allow(node.node_id):
+            print(f"Node {self.node_id}: Circuit to node {node.node_id} is open. Request not sent.")
+            response = None
+        else:
+            operation = request["operation"]
+            start = self.network.scheduler.clock()
+            timeout = self.peer_stats.timeout(node.node_id, operation)
+            if max_timeout is not None:
+                timeout = min(timeout, max_timeout)
+            response = self.network.transport.send_request(node.address[1], request, timeout)
+            if response is None:
+                self.peer_stats.record_failure(node.node_id)
+            elif is_overloaded(response):
+                print(f"Node {self.node_id}: {response['message']}")
+                self.peer_stats.record_overload(node.node_id)
+                return response if return_overload else None
+            else:
+                rtt = self.network.scheduler.clock() - start
+                self.peer_stats.record_reply(node.node_id, operation, rtt)
 
-        except (socket.error, EOFError, pickle.PickleError) as e:
-            print(f"Network: Failed to send request to node at port {node.address[1]}. Error: {e}")
-            return None  # Return None to indicate failure
+        if response is None:
+            self.failure_detector.record_failure(node.node_id)
+            self.evict_key_locations(node.node_id)
+        else:
+            self.failure_detector.record_reply(node.node_id)
+        return response
 
     #############################
     ######### Requests ##########
     #############################
 
-    def request_find_successor(self, key, node, hops):
+    def request_find_successor(self, key, node, hops, max_timeout=None):
         get_successor_request = {"operation": "FIND_SUCCESSOR", "key": key, "hops": hops}
         # Get the position on the ring
-        return self.send_request(node, get_successor_request)
+        return self.send_request(node, get_successor_request, max_timeout=max_timeout)
 
     def request_delete_successor_keys(self, keys, successor_id):
         node = self.network.nodes[successor_id]
@@ -406,19 +410,28 @@ class ChordNode:
             "sender_id": self.node_id,
             "kdtree": self.kd_tree,
         }
-        status = self.send_request(node, restoration)
+        status = self.send_request(node, restoration, return_overload=True)
         return status
 
-    def request_get_successor(self, node_id):
+    def request_get_successor_list(self, node_id):
         node = self.network.nodes[node_id]
-        get_successor = {"operation": "GET_SUCCESSOR"}
-        status = self.send_request(node, get_successor)
+        get_successor_list = {"operation": "GET_SUCCESSOR_LIST"}
+        # Sent by stabilization, which must not hold a scheduler worker for long
+        status = self.send_request(
+            node, get_successor_list, return_overload=True, max_timeout=MAINTENANCE_TIMEOUT
+        )
         return status
 
+    def request_get_finger_table(self, node_id):
+        node = self.network.nodes[node_id]
+        get_finger_table = {"operation": "GET_FINGER_TABLE"}
+        return self.send_request(node, get_finger_table)
+
     def request_status_running(self, node_id):
         node = self.network.nodes[node_id]
         get_status = {"operation": "GET_STATUS"}
-        status = self.send_request(node, get_status)
+        # Sent by the failure detector's probes, which run on the scheduler
+        status = self.send_request(node, get_status, max_timeout=MAINTENANCE_TIMEOUT)
         return status
 
     def request_set_backup(self, backup, node_id):
@@ -429,8 +442,10 @@ class ChordNode:
 
     def request_backup_update(self, node_id, request):
         node = self.network.nodes[node_id]
-        request["choice"] = False
-        status = self.send_request(node, request)
+        # The successor stores a replica, it does not own the key, so it must not validate it
+        backup_update = {key: value for key, value in request.items() if key != "cached"}
+        backup_update["choice"] = False
+        status = self.send_request(node, backup_update)
         return status
 
     #############################
@@ -442,12 +457,23 @@ class ChordNode:
         request["hops"].append(self.node_id)
         if self.node_id == key:
             return self.node_id, request["hops"]
-        if distance(self.node_id, key) <= distance(self.get_successor(), key):
+        if distance(self.node_id, key, self.ring_size) <= distance(
+            self.get_successor(), key, self.ring_size
+        ):
             return self.get_successor(), request["hops"]
         else:
             closest_preceding_node_id = self.closest_preceding_node(self, key)
             closest_preceding_node = self.network.nodes[closest_preceding_node_id]
-            return self.request_find_successor(key, closest_preceding_node, request["hops"])
+            response = self.request_find_successor(key, closest_preceding_node, request["hops"])
+            if response is None and (
+                not self.failure_detector.is_alive(closest_preceding_node_id)
+                or self.peer_stats.is_busy(closest_preceding_node_id)
+            ):
+                # The next hop is now suspected or overloaded, route once more around it
+                closest_preceding_node_id = self.closest_preceding_node(self, key)
+                closest_preceding_node = self.network.nodes[closest_preceding_node_id]
+                response = self.request_find_successor(key, closest_preceding_node, request["hops"])
+            return response
 
     def _handle_delete_successor_keys(self, request):
         keys = request["keys"]
@@ -458,6 +484,7 @@ class ChordNode:
 
     def _handle_set_successor(self, request):
         successor_id = request["successor"]
+        self.evict_key_locations(successor_id)
         self.finger_table[0] = successor_id
         self.successors[0] = successor_id
         return 0
@@ -465,18 +492,21 @@ class ChordNode:
     def _handle_set_predecessor(self, request):
         predecessor_id = request["predecessor"]
         self.predecessor = predecessor_id
+        self.evict_key_locations(predecessor_id)
         return 0
 
     def _handle_restoration_request(self, request):
         tree = request["kdtree"]
         # Set new predecessor
         self.predecessor = request["sender_id"]
+        self.evict_key_locations(self.predecessor)
         if self.back_up:
             # Merge back up kdtree
-            keys = self.back_up.country_keys.tolist()
-            points = self.back_up.points
-            reviews = self.back_up.reviews.tolist()
-            countries = self.back_up.countries
+            snapshot = self.back_up.snapshot()
+            keys = snapshot.country_keys.tolist()
+            points = snapshot.points
+            reviews = snapshot.reviews.tolist()
+            countries = snapshot.countries
 
             for key, point, review, country in zip(keys, points, reviews, countries):
 
@@ -501,12 +531,55 @@ class ChordNode:
         self.back_up = request["backup"]
         return 0
 
-    def _handle_get_successor_request(self):
-        return self.get_successor()
+    def _handle_get_successor_list_request(self):
+        if not self.running:
+            return None
+        return list(self.successors)
 
     def _handle_get_status_request(self):
         return self.running
 
+    def _handle_get_finger_table_request(self):
+        return list(self.finger_table)
+
+    def _handle_get_membership_request(self, request):
+        """
+        Return the membership changes after the requested version, or the full list of live nodes
+        if the log no longer holds all of them.
+        """
+        version = request["version"]
+        with self.membership_lock:
+            oldest = (
+                self.membership_log[0][0] if self.membership_log else self.membership_version + 1
+            )
+            if not oldest - 1 <= version <= self.membership_version:
+                return {"version": self.membership_version, "snapshot": sorted(self.members)}
+            changes = [
+                (node_id, joined)
+                for change_version, node_id, joined in self.membership_log
+                if change_version > version
+            ]
+            return {"version": self.membership_version, "changes": changes}
+
+    def record_membership_change(self, version, node_id, joined):
+        """
+        Apply a join or leave to this node's view of the membership and log it.
+        """
+        with self.membership_lock:
+            if version <= self.membership_version:
+                return  # Already known, e.g. from the snapshot pulled at join
+            if joined:
+                self.members.add(node_id)
+            else:
+                self.members.discard(node_id)
+            self.membership_version = version
+            self.membership_log.append((version, node_id, joined))
+
+    def request_membership(self, node_id, version):
+        node = self.network.nodes[node_id]
+        get_membership = {"operation": "GET_MEMBERSHIP", "version": version}
+        return self.send_request(node, get_membership)
+
     #############################
     ####### KEY Handlers ########
     #############################
@@ -520,7 +593,6 @@ class ChordNode:
         review = request["review"]
         hops = request["hops"]
         country = request["country"]
-        country_key = hash_key(country)
 
         tree = self.kd_tree if request["choice"] else self.back_up
 
@@ -530,12 +602,12 @@ class ChordNode:
                 tree = KDTree(
                     points=np.array([point]),
                     reviews=np.array([review]),
-                    country_keys=np.array([country_key]),
+                    country_keys=np.array([key]),
                     countries=np.array([country]),
                 )
             else:
                 # Add point to the existing KDTree
-                tree.add_point(point, review, country)
+                tree.add_point(point, review, country, key)
 
             if request["choice"]:
                 self.kd_tree = tree
@@ -559,7 +631,7 @@ class ChordNode:
         tree = self.kd_tree if request["choice"] else self.back_up
 
         with self.lock:
-            if tree and key in tree.country_keys:
+            if tree and key in tree:
                 tree.delete_points(key)
             else:
                 return {"status": "failure", "message": f"No data for key {key}.", "hops": hops}
@@ -584,7 +656,7 @@ class ChordNode:
         tree = self.kd_tree if request["choice"] else self.back_up
 
         with self.lock:
-            if self.kd_tree and key in self.kd_tree.country_keys:
+            if self.kd_tree and key in self.kd_tree:
                 # Update the data in the KDTree
                 self.kd_tree.update_points(
                     country_key=key,
@@ -616,17 +688,15 @@ class ChordNode:
         N = request["N"]
         hops = request.get("hops", [])  # Retrieve the current hops list
 
-        if (
-            key not in self.kd_tree.country_keys
-            or not self.kd_tree
-            or self.kd_tree.points.size == 0
-        ):
+        # Read the current version of the KD-Tree, without waiting for writers
+        snapshot = self.kd_tree.snapshot() if self.kd_tree else None
+        if not snapshot or key not in snapshot:
             print(f"Node {self.node_id}: No data for key {key}.")
 
             return {"status": "failure", "message": f"No data for key {key}.", "hops": hops}
 
         # KDTree Range Search
-        points, reviews = self.kd_tree.search(key, lower_bounds, upper_bounds)
+        points, reviews = snapshot.search(key, lower_bounds, upper_bounds)
         # print(f"Node {self.node_id}: Found {len(points)} matching points.")
 
         if len(reviews) == 0:
@@ -672,6 +742,7 @@ class ChordNode:
         """
         Initiate the INSERT_KEY operation for a given key, point, and review.
         """
+        key = self.network.to_id(key)
         request = {
             "operation": "INSERT_KEY",
             "key": key,
@@ -680,26 +751,21 @@ class ChordNode:
             "country": country,
             "hops": [],  # Initialize hops tracking
         }
-        successor_id, hops = self._handle_find_successor(request)
-        request["hops"] = len(hops) - 1
-        successor = self.network.nodes[successor_id]
         request["choice"] = True
-        return self.send_request(successor, request)
+        return self.send_key_request(request)
 
     def delete_key(self, key):
         """
         Delete a key from the network.
         """
+        key = self.network.to_id(key)
         request = {
             "operation": "DELETE_KEY",
             "key": key,
             "hops": [],  # Initialize hops tracking
         }
-        successor_id, hops = self._handle_find_successor(request)
-        request["hops"] = len(hops) - 1
-        successor = self.network.nodes[successor_id]
         request["choice"] = True
-        return self.send_request(successor, request)
+        return self.send_key_request(request)
 
     def update_key(self, key, updated_data, criteria=None):
         """
@@ -714,6 +780,7 @@ class ChordNode:
         Returns:
             dict: Response from the update operation, indicating success or failure.
         """
+        key = self.network.to_id(key)
         request = {
             "operation": "UPDATE_KEY",
             "key": key,
@@ -721,16 +788,14 @@ class ChordNode:
             "criteria": criteria,  # Optional criteria for filtering
             "hops": [],  # Initialize hops tracking
         }
-        successor_id, hops = self._handle_find_successor(request)
-        request["hops"] = len(hops) - 1
-        successor = self.network.nodes[successor_id]
         request["choice"] = True
-        return self.send_request(successor, request)
+        return self.send_key_request(request)
 
     def lookup(self, key, lower_bounds, upper_bounds, N=5):
         """
         Lookup operation for a given key with KDTree range search and LSH similarity check.
         """
+        key = self.network.to_id(key)
         request = {
             "operation": "LOOKUP",
             "key": key,
@@ -739,55 +804,186 @@ class ChordNode:
             "N": N,
             "hops": [],
         }
+        return self.send_key_request(request)
+
+    def send_key_request(self, request):
+        """
+        Send a key operation to the node responsible for its key.
+        A cached location is tried first. The request is routed if there is none or if it is stale.
+        """
+        key = request["key"]
+        successor_id = self.get_key_location(key)
+        if successor_id is not None:
+            response = self.send_request(
+                self.network.nodes[successor_id], dict(request, hops=0, cached=True)
+            )
+            if response is not None and response.get("status") != "redirect":
+                return response
+            self.evict_key_locations(successor_id)
+
         successor_id, hops = self._handle_find_successor(request)
+        # The last node of the route precedes the responsible node, so it owns (hops[-1], successor_id]
+        self.set_key_location(hops[-1], successor_id)
         request["hops"] = len(hops) - 1
         successor = self.network.nodes[successor_id]
-
         return self.send_request(successor, request)
 
+    #############################
+    #### Key Location Cache #####
+    #############################
+
+    def is_responsible(self, key):
+        """
+        Return True if the key falls in (predecessor, self].
+        """
+        if self.predecessor == self.node_id:
+            return True
+        return (
+            0
+            < distance(self.predecessor, key, self.ring_size)
+            <= distance(self.predecessor, self.node_id, self.ring_size)
+        )
+
+    def get_key_location(self, key):
+        """
+        Return the cached responsible node for the key, or None.
+        """
+        with self.key_cache_lock:
+            for node_id, start in self.key_cache.items():
+                if (
+                    0
+                    < distance(start, key, self.ring_size)
+                    <= distance(start, node_id, self.ring_size)
+                ):
+                    self.key_cache.move_to_end(node_id)
+                    return node_id
+        return None
+
+    def set_key_location(self, start, node_id):
+        """
+        Cache that node_id is responsible for the keys in (start, node_id].
+        """
+        if start == node_id:
+            return
+        with self.key_cache_lock:
+            self.key_cache[node_id] = start
+            self.key_cache.move_to_end(node_id)
+            if len(self.key_cache) > KEY_CACHE_SIZE:
+                self.key_cache.popitem(last=False)  # Evict the least recently used entry
+
+    def evict_key_locations(self, node_id):
+        """
+        Evict the entries of a node that has failed, and the entries whose interval contains a node that has joined.
+        """
+        with self.key_cache_lock:
+            for responsible_id, start in list(self.key_cache.items()):
+                if responsible_id == node_id or 0 < distance(
+                    start, node_id, self.ring_size
+                ) < distance(start, responsible_id, self.ring_size):
+                    del self.key_cache[responsible_id]
+
     #############################
     #### Update Finger Table ####
     #############################
 
-    def update_finger_table(self, hops=[]):
-        self.finger_table[0] = self.get_successor()
-        for i in range(1, len(self.finger_table)):
-            key = int_to_hex((int(self.node_id, 16) + 2**i) % R)
-            temp_node = self.request_find_successor(key, self, hops)[0]
-            for _ in range(len(self.network.nodes)):
-                if self.network.nodes[temp_node].running == True:
-                    break
-                temp_node = self.request_find_successor(
-                    int_to_hex((int(temp_node, 16) + 1) % R), self, hops
-                )[0]
+    def update_finger_table(self):
+        """
+        Refresh the next FINGERS_PER_TICK fingers of the finger table, round robin (fix_fingers).
+        Fingers that fall in the successor interval of an already resolved finger are filled without an RPC.
+        """
+        successor_id = self.get_successor()
+        if successor_id == -1:
+            return
+        self.finger_table[0] = successor_id
 
-            self.finger_table[i] = temp_node
+        routed = 0
+        visited = 0
+        while visited < self.m - 1:
+            i = self.next_finger
+
+            if (
+                2**i > distance(self.node_id, successor_id, self.ring_size)
+                and routed == FINGERS_PER_TICK
+            ):
+                break  # Resume from this finger on the next tick
+
+            self.next_finger = self.next_finger % (self.m - 1) + 1  # Cycle through fingers 1..M-1
+            visited += 1
+
+            if 2**i <= distance(self.node_id, successor_id, self.ring_size):
+                # The start of the finger falls between this node and its successor
+                self.finger_table[i] = successor_id
+                continue
+
+            key = (self.node_id + 2**i) % self.ring_size
+            response = self.request_find_successor(key, self, [], MAINTENANCE_TIMEOUT)
+            routed += 1
+            if response is None:
+                # Routing is failing or slow. Keep the old entries, and do not hold a scheduler
+                # worker with more lookups in this tick
+                break
+            if response[0] not in self.network.nodes:
+                continue  # Keep the old entry, stabilization will fix the successor pointers
+            finger_id = response[0]
+            if not self.failure_detector.is_alive(finger_id):
+                continue  # This node suspects the finger, keep the old entry until it is probed
+            self.finger_table[i] = finger_id
+
+            # Fill the following fingers that have the same successor
+            while (
+                visited < self.m - 1
+                and self.next_finger != 1
+                and 2**self.next_finger <= distance(self.node_id, finger_id, self.ring_size)
+            ):
+                self.finger_table[self.next_finger] = finger_id
+                self.next_finger = self.next_finger % (self.m - 1) + 1
+                visited += 1
+
+    def initialize_finger_table(self, successor_id):
+        """
+        Initialize the finger table of a newly joined node from its successor's finger table.
+        """
+        self.finger_table[0] = successor_id
+        successor_fingers = self.request_get_finger_table(successor_id) or []
+        candidates = set(successor_fingers) | {successor_id}
+        candidates.discard(self.node_id)
+
+        for i in range(1, self.m):
+            if 2**i <= distance(self.node_id, successor_id, self.ring_size):
+                self.finger_table[i] = successor_id
+            else:
+                # The first known node at or after the start of the finger
+                start = (self.node_id + 2**i) % self.ring_size
+                finger_id = min(
+                    candidates, key=lambda node_id: distance(start, node_id, self.ring_size)
+                )
+                if distance(self.node_id, finger_id, self.ring_size) < 2**i:
+                    # No known node between the start and this node, keep the previous finger
+                    finger_id = self.finger_table[i - 1]
+                self.finger_table[i] = finger_id
 
     #############################
     ## Closest Preceding Node ###
     #############################
 
     def closest_preceding_node(self, node, h_key):
-        for i in range(len(node.finger_table) - 1, 0, -1):
-            preceding_node = node.finger_table[i - 1]
-            next_node = node.finger_table[i]
-
-            running_node_found = False
-            for _ in range(i, len(self.finger_table)):
-                if self.network.nodes[node.finger_table[i]].running == True:
-                    next_node = node.finger_table[i]
-                    running_node_found = True
-                    break
-            if not running_node_found:
-                next_node = node.finger_table[-1]
-
-            if distance(node.finger_table[i - 1], h_key) < distance(next_node, h_key):
-                preceding_node = node.finger_table[i - 1]
-                if self.request_status_running(preceding_node):
-                    # if self.network.nodes[preceding_node].running: # skip non-running nodes
-                    return preceding_node  #  -3 |-2| key -1
-
-        return node.finger_table[-1]
+        """
+        Return the finger closest to h_key that precedes it, is not suspected by the failure detector
+        and has not recently shed a request.
+        Liveness comes from the local failure detector, so no RPC is issued while choosing the next hop.
+        """
+        key_distance = distance(node.node_id, h_key, self.ring_size)
+        for finger_id in reversed(node.finger_table):
+            if (
+                finger_id == node.node_id
+                or distance(node.node_id, finger_id, self.ring_size) >= key_distance
+            ):
+                continue  # The finger does not precede the key
+            if self.failure_detector.is_alive(finger_id) and not self.peer_stats.is_busy(finger_id):
+                return finger_id
+
+        # Every preceding finger is suspected, fall back to the first live successor
+        return node.get_successor()
 
     #############################
     ######## Node Join ##########
@@ -806,22 +1002,33 @@ class ChordNode:
         self.successors[0] = suc_id
         self.predecessor = pre_id
 
-        self.update_finger_table()
+        self.initialize_finger_table(suc_id)
+
+        # Start from the successor's view of the membership, served to the one-hop clients
+        response = self.request_membership(suc_id, -1)
+        if response is not None and "snapshot" in response:
+            with self.membership_lock:
+                self.members = set(response["snapshot"])
+                self.membership_version = response["version"]
 
         if successor_node.kd_tree != None:
+            snapshot = successor_node.kd_tree.snapshot()
             # Get keys from successor
             keys = [
                 key
-                for key in np.unique(successor_node.kd_tree.country_keys)
-                if (distance(self.node_id, key) > distance(self.get_successor(), key))
+                for key in np.unique(snapshot.country_keys)
+                if (
+                    distance(self.node_id, key, self.ring_size)
+                    > distance(self.get_successor(), key, self.ring_size)
+                )
             ]
 
             # 1. Insert keys and data to self's kdtree
             for key in keys:
-                indices = np.where(successor_node.kd_tree.country_keys == key)
-                reviews = successor_node.kd_tree.reviews[indices]
-                countries = [successor_node.kd_tree.countries[i] for i in indices[0]]
-                points = successor_node.kd_tree.points[indices]
+                indices = np.where(snapshot.country_keys == key)
+                reviews = snapshot.reviews[indices]
+                countries = [snapshot.countries[i] for i in indices[0]]
+                points = snapshot.points[indices]
                 for review, point, country in zip(reviews, points, countries):
                     request = {
                         "operation": "INSERT_KEY",
@@ -841,7 +1048,11 @@ class ChordNode:
         self.request_set_backup(self.kd_tree, suc_id)
 
         # 4. Update backup from predecessor's kd_tree
-        if (not self.network.nodes[pre_id].running) or (self.network.nodes[pre_id] == self.node_id):
+        if (
+            pre_id == self.node_id
+            or pre_id not in self.network.nodes
+            or not self.failure_detector.is_alive(pre_id)
+        ):
             return
         predecessor_node = self.network.nodes[pre_id]
         self.back_up = predecessor_node.kd_tree
@@ -852,65 +1063,61 @@ class ChordNode:
 
     def leave(self):
         self.running = False
+        self.network.record_membership_change(self.node_id, False)
         self.stop_event.set()
-        self.thread_pool.shutdown(wait=False)
+        for timer in self.timers:
+            self.network.scheduler.cancel(timer)
+        self.timers = []
+        self.network.transport.stop(self.address[1], self)
 
     #############################
     ####### Get Successor #######
     #############################
 
     def get_successor(self):
-        # Get first running successor
-        for i in range(len(self.successors) - 1):
-            if self.network.nodes[self.successors[i]].running:
-                return self.successors[i]
+        """
+        Return the first successor that the failure detector does not suspect. If every successor
+        is suspected, return the first one whose failure is not confirmed yet (it may only be
+        slow, as stabilize assumes), or -1 if all of them are dead.
+        Liveness comes from the local failure detector, so no RPC is issued.
+        """
+        for successor_id in self.successors:
+            if self.failure_detector.is_alive(successor_id):
+                return successor_id
+        for successor_id in self.successors:
+            if not self.failure_detector.is_dead(successor_id):
+                return successor_id
         return -1
 
     #############################
     #### Update Successors ######
     #############################
 
-    def update_successors_on_join(self):
-        # Find node to insert node
-        index_to_insert_node = -1
-        node_id = ""
-
-        for i in range(len(self.successors) - 1):
-            successor_of_successor = self.network.nodes[self.successors[i]].get_successor()
-            if successor_of_successor != self.successors[i + 1]:
-                index_to_insert_node = i + 1
-                node_id = successor_of_successor
-                break
-
-        if index_to_insert_node == -1:
-            return
-
-        # Insert node
-        for i in range(index_to_insert_node, len(self.successors) - 1):
-            self.successors[i + 1] = self.successors[i]
-        self.successors[index_to_insert_node] = node_id
-        self.update_successors_on_join()
-
-    def update_successors_on_leave(self):
-        # Find index of the node that left
-        index_of_node_that_left = -1
-        for i in range(len(self.successors)):
-            if not self.network.nodes[self.successors[i]].running:
-                index_of_node_that_left = i
-                break
-
-        if index_of_node_that_left == -1:
+    def stabilize(self):
+        """
+        Refresh the successor list from the first successor that answers a GET_SUCCESSOR_LIST request.
+        A successor that does not answer is only dropped once the failure detector has confirmed
+        that it is dead. Until then the successor list is kept and the request is sent again in
+        the next round. Confirmed failed successors are dropped in the same round, however many
+        they are.
+        """
+        for index, successor_id in enumerate(self.successors):
+            if successor_id == self.node_id:
+                return  # No other node is known after this one
+
+            successor_list = self.request_get_successor_list(successor_id)
+            if is_overloaded(successor_list):
+                return  # The successor is alive but busy, ask again in the next round
+            if successor_list is None:
+                if self.failure_detector.is_dead(successor_id):
+                    continue  # Failed successor, try the next one
+                return  # Perhaps only slow, ask again in the next round
+
+            if index > 0:
+                # The first successor has failed, the new one takes over its keys from its backup
+                if is_overloaded(self.request_restoration(successor_id)):
+                    return  # Not processed, keep the successor list and try again in the next round
+
+            self.successors = ([successor_id] + successor_list)[:S]
+            self.finger_table[0] = successor_id
             return
-
-        if index_of_node_that_left == 0:
-            new_successor = self.get_successor()
-            self.request_restoration(new_successor)
-
-        # For each index in the successors list
-        for i in range(index_of_node_that_left, len(self.successors) - 1):
-            self.successors[i] = self.successors[i + 1]
-
-        # update last position because its empty
-        self.successors[-1] = self.request_get_successor(self.successors[-2])
-        # Recursively update successors
-        self.update_successors_on_leave()
@@ -0,0 +1,423 @@
+import collections
+import copy
+import heapq
+import itertools
+import random
+import threading
+
+from constants import *
+from helper_functions import *
+from transport import InProcessTransport
+from .node import ChordNode
+
+
+class SimulatedTransport(InProcessTransport):
+    """
+    In-process transport whose messages are events of the simulator.
+
+    A request is delivered one message latency after it is sent and handled in a process of its
+    own, and the response arrives one message latency after the handler returns. The sender waits
+    in virtual time meanwhile, so the events of other operations and timers run while the request
+    is in flight. A request to a node that is down when it arrives is refused, like a connection
+    to a closed port, and the sender learns it when the refusal arrives. A node that leaves while
+    handling a request never answers it, and the sender gives up after its timeout
+    (REQUEST_TIMEOUT if none is given).
+    """
+
+    def __init__(self, simulator):
+        super().__init__(copy_payloads=True)
+        self.simulator = simulator
+
+    def send_request(self, port, request, timeout=None):
+        simulator = self.simulator
+        if self.copy_payloads:
+            request = copy.deepcopy(request)  # The sender may change it while it is in flight
+
+        call = {"done": False, "response": None, "waiter": simulator.current}
+        simulator.count_message()
+        simulator.call_later(simulator.message_latency(), self._deliver, port, request, call)
+        if timeout is None:
+            timeout = REQUEST_TIMEOUT
+        call["timer"] = simulator._call_inline(timeout, self._complete, call, None)
+
+        simulator.wait(lambda: call["done"])
+        return call["response"]
+
+    def _deliver(self, port, request, call):
+        """
+        Handle a request that has arrived and send the response back to the sender.
+        """
+        simulator = self.simulator
+        node = self.nodes.get(port)
+        if node is None or not node.running:
+            print(f"Network: Failed to send request to node at port {port}. Error: node is down")
+            response = None  # Refused
+        else:
+            try:
+                response = node._process_request(request)
+            except Exception as e:
+                print(f"Error handling request: {e}")
+                response = None
+            if not node.running:
+                return  # The node left while handling the request and never answers
+            if self.copy_payloads:
+                response = copy.deepcopy(response)
+
+        simulator.count_message()
+        simulator._call_inline(simulator.message_latency(), self._complete, call, response)
+
+    def _complete(self, call, response):
+        """
+        Hand the response (None on a timeout) to the sender, unless it has one already.
+        """
+        if call["done"]:
+            return
+        call["done"] = True
+        call["response"] = response
+        self.simulator.cancel(call["timer"])
+        if call["waiter"] is not None:
+            self.simulator._switch(call["waiter"])
+
+
+class SimulatedLock:
+    """
+    Lock for the state of a simulated node. A process that finds it held is suspended in virtual
+    time instead of blocking its thread, so that the holder can still be resumed by the response
+    to a request it sent while holding the lock.
+    """
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.locked = False
+        self.waiters = collections.deque()  # Suspended processes, in arrival order
+
+    def acquire(self):
+        simulator = self.simulator
+        if not self.locked:
+            self.locked = True
+        elif simulator.current is None:
+            simulator.wait(lambda: not self.locked)
+            self.locked = True
+        else:
+            # Resumed by release, which hands the lock over
+            self.waiters.append(simulator.current)
+            simulator._suspend()
+        return True
+
+    def release(self):
+        if self.waiters:
+            self.simulator._call_inline(0, self.simulator._switch, self.waiters.popleft())
+        else:
+            self.locked = False
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Process:
+    """
+    Thread that runs the callbacks of simulator events. Only one process runs at a time, and only
+    while the simulator has handed control to it: a process that waits for a response or a lock
+    hands control back and is resumed by a later event. Finished processes are reused.
+    """
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.timer = None  # Timer whose callback is running
+        self.context = None  # Message counter of the operation the process works for, if any
+        self.wake = threading.Semaphore(0)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        simulator = self.simulator
+        while True:
+            self.wake.acquire()
+            timer = self.timer
+            try:
+                timer["callback"](*timer["args"])
+            except Exception as e:
+                # A failed round (e.g. a route through a node that just left) must not stop the run
+                print(
+                    f"Simulator: Event {timer['callback'].__name__} failed at {simulator.now:.2f}s. Error: {e}"
+                )
+
+            # Like the real scheduler, a periodic task is rescheduled once its run has finished
+            if timer["interval"] is not None and not timer["cancelled"]:
+                simulator._push(simulator.now + timer["interval"], timer)
+
+            self.timer = self.context = None
+            simulator._idle.append(self)
+            simulator._control.release()
+
+
+class ChordSimulator:
+    """
+    Discrete-event simulator that drives a Chord network in virtual time.
+
+    Stabilization timers, trace operations and messages are events on a single event queue.
+    The callback of a timer and the handling of a delivered request each run in a process, a
+    thread that the simulator resumes and suspends so that exactly one runs at a time, and a run
+    is fully determined by the seed. Every message takes the configured latency to arrive:
+        - A sender is suspended until the response arrives or its timeout expires, and the other
+          events run meanwhile, so concurrent operations and stabilization rounds interleave.
+        - A request to a node that has left is refused after a round trip, and a node that
+          leaves while it handles a request never answers it.
+        - The latency of an operation is the virtual time from its start to its end.
+    Code that runs outside of the event queue (e.g. building the network) runs the events
+    itself while it waits for a response. Node locks come from `lock()`, so that a handler may
+    hold one while it waits for a response.
+    """
+
+    def __init__(self, seed=0, latency=0.01):
+        """
+        Args:
+            seed (int): Seed for every random choice made during the simulation.
+            latency (float or callable): One-way latency of a message in seconds, or a
+                function that takes the simulator's Random object and returns one.
+        """
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.latency = latency
+
+        self.now = 0.0  # Virtual time in seconds
+        self.events = []  # Heap of (time, sequence, timer) entries
+        self._sequence = itertools.count()
+
+        self.messages = 0  # Number of messages sent so far
+
+        self.current = None  # Process that is running, None while the simulator has control
+        self._idle = []  # Finished processes, ready to run another callback
+        self._control = threading.Semaphore(0)  # Released when the running process stops
+
+        self.transport = SimulatedTransport(self)
+
+    def message_latency(self):
+        """
+        Return the latency of a single message.
+        """
+        if callable(self.latency):
+            return self.latency(self.random)
+        return self.latency
+
+    def count_message(self):
+        """
+        Count a message, also for the operation that the running process works for.
+        """
+        self.messages += 1
+        if self.current is not None and self.current.context is not None:
+            self.current.context["messages"] += 1
+
+    def lock(self):
+        """
+        Return a lock that suspends, rather than blocks, the processes that wait for it.
+        """
+        return SimulatedLock(self)
+
+    # Event Queue
+
+    def clock(self):
+        """
+        Return the current virtual time.
+        """
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedule callback(*args) to run once at virtual time `when`. The callback runs in a
+        process that works for the same operation as the running one.
+        """
+        timer = {
+            "callback": callback,
+            "args": args,
+            "interval": None,
+            "cancelled": False,
+            "inline": False,  # Run by the simulator itself, see _call_inline
+            "context": self.current.context if self.current is not None else None,
+        }
+        self._push(when, timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedule callback(*args) to run once after `delay` virtual seconds.
+        """
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """
+        Schedule callback(*args) to run every `interval` virtual seconds. The next run is
+        scheduled when a run finishes.
+        """
+        timer = self.call_later(interval, callback, *args)
+        timer["interval"] = interval
+        timer["context"] = None
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel a scheduled timer. Cancelled entries are dropped when they reach the top of the queue.
+        """
+        timer["cancelled"] = True
+
+    def _call_inline(self, delay, callback, *args):
+        """
+        Schedule callback(*args) to be run by the simulator itself rather than in a process.
+        For the bookkeeping of messages and locks, whose callbacks never wait.
+        """
+        timer = self.call_later(delay, callback, *args)
+        timer["inline"] = True
+        return timer
+
+    def _push(self, when, timer):
+        heapq.heappush(self.events, (when, next(self._sequence), timer))
+
+    def step(self):
+        """
+        Run the next event. Returns False if the queue is empty.
+        """
+        while self.events:
+            when, _, timer = heapq.heappop(self.events)
+            if timer["cancelled"]:
+                continue
+
+            self.now = when
+            if timer["inline"]:
+                timer["callback"](*timer["args"])
+                return True
+
+            process = self._idle.pop() if self._idle else _Process(self)
+            process.timer = timer
+            process.context = timer["context"]
+            self._switch(process)
+            return True
+        return False
+
+    def run(self, until=None):
+        """
+        Run events in time order until the queue is empty or virtual time passes `until`.
+        """
+        while self.events:
+            if until is not None and self.events[0][0] > until:
+                self.now = max(self.now, until)
+                break
+            self.step()
+
+    def wait(self, condition):
+        """
+        Wait in virtual time until condition() is true. The running process is suspended until
+        an event resumes it. Outside of a process, the events are run meanwhile.
+        """
+        if self.current is None:
+            while not condition() and self.step():
+                pass
+            return
+        while not condition():
+            self._suspend()
+
+    def _switch(self, process):
+        """
+        Hand control to a process and wait until it finishes or waits.
+        """
+        self.current = process
+        process.wake.release()
+        self._control.acquire()
+        self.current = None
+
+    def _suspend(self):
+        """
+        Hand control back to the simulator from the running process, until it is resumed.
+        """
+        process = self.current
+        self._control.release()
+        process.wake.acquire()
+
+    # Network Construction
+
+    def add_node(self, network, node_id=None):
+        """
+        Create a node with a seeded random ID, start it, and join it to the network.
+        """
+        if node_id is None:
+            node_id = self.random.randrange(network.ring_size)
+            while node_id in network.nodes:
+                node_id = self.random.randrange(network.ring_size)
+
+        node = ChordNode(network, node_id=node_id)
+        node.start_server()
+        hops = network.node_join(node)
+        return node, hops
+
+    def build(self, network, node_num, settle_time=5.0):
+        """
+        Join node_num nodes to the network at the current virtual time and let stabilization settle.
+        """
+        for _ in range(node_num):
+            self.add_node(network)
+        self.run(until=self.now + settle_time)
+
+    # Traces
+
+    def run_trace(self, network, trace):
+        """
+        Replay a churn/workload trace and return one result per operation.
+
+        Args:
+            network (ChordNetwork): A network created with this simulator.
+            trace (list): Tuples of (time, operation, *args) where operation is one of
+                "join" ([node_id]), "leave" (node_id), "insert" (key, point, review, country),
+                "delete" (key), "update" (key, updated_data[, criteria]) and
+                "lookup" (key, lower_bounds, upper_bounds[, N]).
+
+        Returns:
+            list: Dictionaries with the time, operation, hops, messages and latency of each operation.
+        """
+        results = []
+        for entry in trace:
+            when, operation, args = entry[0], entry[1], entry[2:]
+            self.call_at(when, self._run_operation, network, operation, args, results)
+
+        # Operations still in flight at the time of the last one are waited for
+        last_time = max((entry[0] for entry in trace), default=self.now)
+        self.run(until=last_time)
+        self.wait(lambda: len(results) == len(trace))
+        return results
+
+    def _run_operation(self, network, operation, args, results):
+        # Count the messages of this operation, also those sent by the processes working for it
+        self.current.context = {"messages": 0}
+        start = self.now
+        hops = None
+
+        if operation == "join":
+            node, join_hops = self.add_node(network, *args)
+            hops = len(join_hops) - 1 if join_hops and join_hops[0] is not None else 0
+        elif operation == "leave":
+            node_id = args[0]
+            if node_id in network.nodes and network.nodes[node_id].running:
+                network.nodes[node_id].leave()
+        else:
+            if operation == "insert":
+                response = network.insert_key(*args)
+            elif operation == "delete":
+                response = network.delete_key(*args)
+            elif operation == "update":
+                response = network.update_key(*args)
+            elif operation == "lookup":
+                response = network.lookup(*args)
+            else:
+                raise ValueError(f"Unknown trace operation: {operation}")
+            hops = response["hops"] if response else None
+
+        results.append(
+            {
+                "time": start,
+                "operation": operation,
+                "hops": hops,
+                "messages": self.current.context["messages"],
+                "latency": self.now - start,
+            }
+        )
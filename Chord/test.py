@@ -163,7 +163,7 @@ def chord_test():
         json.dump(Results, outfile, indent=4)
 
     for node in predefined_ids:
-        node = network.nodes[node]
+        node = network.nodes[network.to_id(node)]
         if node.running:
             node.leave()
 
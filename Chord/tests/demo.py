@@ -242,7 +242,7 @@ def main():
     )
     time.sleep(2)
     for node in predefined_ids:
-        node = network.nodes[node]
+        node = network.nodes[network.to_id(node)]
         if node.running:
             node.leave()
             time.sleep(3)
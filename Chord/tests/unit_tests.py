@@ -18,7 +18,7 @@ def add_node_test():
     node.start_server()
     network.node_join(node)
     assert len(network.nodes) == 1
-    assert sum([1 for node_id in node.finger_table if node_id != "4b12"]) == 0
+    assert sum([1 for node_id in node.finger_table if node_id != node.node_id]) == 0
 
     node2 = ChordNode(network, "fa35")  # 64,053
     node2.start_server()
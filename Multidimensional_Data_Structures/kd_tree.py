@@ -3,6 +3,7 @@ import numpy as np
 from sklearn.neighbors import KDTree as sk_KDTree
 import matplotlib.ticker as ticker
 import tkinter as tk
+import threading
 import sys
 import os
 import hashlib
@@ -11,7 +12,157 @@ import hashlib
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
+def _freeze(array):
+    """Mark an array read-only, so that a published version cannot be changed in place."""
+    array.flags.writeable = False
+    return array
+
+
+class Partition:
+    """
+    The rows of a single country key, with a KD-Tree over their points.
+    A partition is never changed once built, writers build a new one instead.
+    """
+
+    def __init__(self, points, reviews, country_keys, countries, tree=None):
+        self.points = _freeze(np.asarray(points, dtype=float))
+        self.reviews = _freeze(np.asarray(reviews))
+        self.country_keys = _freeze(np.asarray(country_keys))
+        self.countries = _freeze(np.asarray(countries))
+        # Reuse the tree of the previous partition if the points did not change
+        self.tree = tree if tree is not None else sk_KDTree(self.points)
+
+    def append(self, points, reviews, country_keys, countries):
+        """Return a new partition with the given rows added."""
+        return Partition(
+            np.vstack([self.points, points]),
+            np.append(self.reviews, reviews),
+            np.append(self.country_keys, country_keys),
+            np.append(self.countries, countries),
+        )
+
+    def __len__(self):
+        return len(self.points)
+
+
+class KDTreeVersion:
+    """
+    An immutable snapshot of the data of a KDTree.
+
+    Readers get the current version without locking and keep reading it while writers publish
+    newer ones. Versions share the partitions that a write did not touch.
+    """
+
+    def __init__(self, version, partitions, dimensions):
+        """
+        Args:
+            version (int): Number of writes before this version.
+            partitions (dict): Keys are country keys, values are Partition objects.
+            dimensions (int): Number of axes of the points.
+        """
+        self.version = version
+        self.partitions = partitions
+        self.dimensions = dimensions
+        self.size = sum(len(partition) for partition in partitions.values())
+        self._rows = None  # Columns of all the partitions, concatenated on first use
+
+    def rows(self):
+        """
+        Return the columnar data ("points", "reviews", "country_keys", "countries") of every row,
+        grouped by country key.
+        """
+        if self._rows is None:
+            partitions = list(self.partitions.values())
+            if not partitions:
+                rows = {
+                    "points": np.empty((0, self.dimensions)),
+                    "reviews": np.array([]),
+                    "country_keys": np.array([]),
+                    "countries": np.array([]),
+                }
+            else:
+                rows = {
+                    column: np.concatenate([getattr(partition, column) for partition in partitions])
+                    for column in ("points", "reviews", "country_keys", "countries")
+                }
+            self._rows = {column: _freeze(array) for column, array in rows.items()}
+        return self._rows
+
+    @property
+    def points(self):
+        return self.rows()["points"]
+
+    @property
+    def reviews(self):
+        return self.rows()["reviews"]
+
+    @property
+    def country_keys(self):
+        return self.rows()["country_keys"]
+
+    @property
+    def countries(self):
+        return self.rows()["countries"]
+
+    def search(self, country_key, lower_bounds, upper_bounds):
+        """
+        Search for points of a given country key within the given bounds for all axes using the
+        KD-Tree of the key's partition.
+
+        Args:
+            country_key (str): Hashed country key.
+            lower_bounds (list): Lower bounds for each axis [review_date, rating, price].
+                                Use `None` for axes that should not be constrained.
+            upper_bounds (list): Upper bounds for each axis [review_date, rating, price].
+                                Use `None` for axes that should not be constrained.
+
+        Returns:
+            list: Points and their associated reviews within the specified range.
+        """
+        if len(lower_bounds) != 3 or len(upper_bounds) != 3:
+            raise ValueError("Bounds must have exactly three values for the three axes.")
+
+        partition = self.partitions.get(country_key)
+        if partition is None:
+            return np.array([]), np.array([])
+
+        # Copy the bounds, the request may be read by other threads
+        lower_bounds = list(lower_bounds)
+        upper_bounds = list(upper_bounds)
+
+        # Unconstrained axes span all the points of the partition
+        for i in range(3):
+            if lower_bounds[i] is None or upper_bounds[i] is None:
+                lower_bounds[i] = np.min(partition.points[:, i])
+                upper_bounds[i] = np.max(partition.points[:, i])
+        print(f"Searching in KDTree. Query Bounds: {lower_bounds} - {upper_bounds}")
+
+        center = [(lower_bounds[i] + upper_bounds[i]) / 2 for i in range(3)]
+        radius = np.linalg.norm((np.array(upper_bounds) - np.array(lower_bounds)) / 2)
+
+        # Query points within the hypersphere defined by center and radius + a small epsilon
+        indices = np.sort(partition.tree.query_radius([center], r=radius + 1e-8)[0])
+
+        # Filter results within the actual range bounds
+        points = partition.points[indices]
+        in_range = np.all((points >= lower_bounds) & (points <= upper_bounds), axis=1)
+
+        return points[in_range], partition.reviews[indices][in_range]
+
+    def __contains__(self, country_key):
+        return country_key in self.partitions
+
+
 class KDTree:
+    """
+    Store of the points and reviews of a node, partitioned by country key.
+
+    The data is published as immutable versions (KDTreeVersion). Reads take the current version
+    without locking, so lookups neither wait for each other nor for writes, and never see a
+    half-applied write. Writes are serialized: each one copies the partitions it changes, builds
+    their KD-Trees, and then swaps the new version in with a single assignment.
+    """
+
     def __init__(self, points, reviews, country_keys, countries=None):
         """
         Initialize the KDTree with points, reviews, country keys, and a list of original countries.
@@ -20,22 +171,59 @@ class KDTree:
             points (numpy array): Array of data points.
             reviews (numpy array): Array of reviews.
             country_keys (numpy array): Array of hashed country keys.
-            countries (list, optional): List of original country names. Defaults to an empty list.
+            countries (list, optional): List of original country names. Defaults to empty names.
         """
-        self.tree = None
-        self.points = points
-        self.reviews = reviews  # Store reviews for reference
-        self.country_keys = country_keys  # 4-digit hex hash of the country
-        self.countries = countries if countries is not None else []  # Store original country names
-        self.build(points)
-
-    def build(self, points):
+        points = np.asarray(points, dtype=float)
+        reviews = np.asarray(reviews)
+        country_keys = np.asarray(country_keys)
+        countries = np.asarray(countries if countries is not None else [""] * len(points))
+
+        # Group the rows by country key, in order of first appearance
+        rows = {}
+        for idx, key in enumerate(country_keys):
+            rows.setdefault(key, []).append(idx)
+        partitions = {
+            key: Partition(points[idx], reviews[idx], country_keys[idx], countries[idx])
+            for key, idx in rows.items()
+        }
+
+        self.current = KDTreeVersion(0, partitions, points.shape[1])
+        self.write_lock = threading.Lock()  # Serializes the writers
+
+    def snapshot(self):
         """
-        Build the KD-Tree using sklearn.
+        Return the current version of the data. It stays unchanged while newer versions are
+        published, so several reads from it are consistent with each other.
         """
-        self.tree = sk_KDTree(points)
+        return self.current
+
+    def _publish(self, base, partitions):
+        """Swap in the version that follows base. Must be called with the write lock held."""
+        self.current = KDTreeVersion(base.version + 1, partitions, base.dimensions)
+
+    # The columns of the current version
+
+    @property
+    def points(self):
+        return self.current.points
+
+    @property
+    def reviews(self):
+        return self.current.reviews
+
+    @property
+    def country_keys(self):
+        return self.current.country_keys
+
+    @property
+    def countries(self):
+        return self.current.countries
+
+    @property
+    def size(self):
+        return self.current.size
 
-    def add_point(self, new_point, new_review, new_country):
+    def add_point(self, new_point, new_review, new_country, new_country_key=None):
         """
         Add a new point, review, and country to the KD-Tree.
 
@@ -43,20 +231,77 @@ class KDTree:
             new_point (list or array-like): The new point to add [review_date, rating, price].
             new_review (str): The associated review for the new point.
             new_country (str): The country of origin for the new point.
+            new_country_key (optional): Key of the country. Defaults to the 4-digit hex hash of the country.
         """
-        # Append the new point and review to the existing data
-        self.points = np.vstack([self.points, new_point])
-        self.reviews = np.append(self.reviews, new_review)
+        # Hash the country
+        if new_country_key is None:
+            new_country_key = hashlib.sha1(new_country.encode()).hexdigest()[-4:]
 
-        # Hash the country and append to country_keys
-        new_country_key = hashlib.sha1(new_country.encode()).hexdigest()[-4:]
-        self.country_keys = np.append(self.country_keys, new_country_key)
+        self.add_rows([new_point], [new_review], [new_country_key], [new_country])
 
-        # Append the original country to the countries list
-        self.countries = np.append(self.countries, new_country)
+    def add_rows(self, new_points, new_reviews, new_country_keys, new_countries):
+        """
+        Add a batch of rows with a single new version. Only the partitions of the given country
+        keys are rebuilt.
+
+        Args:
+            new_points (numpy array): Array of data points [review_date, rating, price].
+            new_reviews (numpy array): Array of the associated reviews.
+            new_country_keys (numpy array): Array of the keys of the rows, as stored by the node.
+            new_countries (numpy array): Array of the countries of origin.
+        """
+        if len(new_points) == 0:
+            return
+
+        new_points = np.asarray(new_points, dtype=float).reshape(len(new_points), -1)
+        new_reviews = np.asarray(new_reviews)
+        new_country_keys = np.asarray(new_country_keys)
+        new_countries = np.asarray(new_countries)
+
+        rows = {}
+        for idx, key in enumerate(new_country_keys):
+            rows.setdefault(key, []).append(idx)
+
+        with self.write_lock:
+            base = self.current
+            partitions = dict(base.partitions)
+            for key, idx in rows.items():
+                columns = (
+                    new_points[idx],
+                    new_reviews[idx],
+                    new_country_keys[idx],
+                    new_countries[idx],
+                )
+                partition = partitions.get(key)
+                partitions[key] = partition.append(*columns) if partition else Partition(*columns)
+            self._publish(base, partitions)
+
+    def extract_points(self, country_keys):
+        """
+        Remove the points of the given country keys from the KD-Tree and return them.
+
+        Args:
+            country_keys (list): Hashed countries to extract.
+
+        Returns:
+            dict: Columnar data ("points", "reviews", "country_keys", "countries") of the extracted rows.
+        """
+        with self.write_lock:
+            base = self.current
+            extracted = KDTreeVersion(
+                base.version,
+                {key: base.partitions[key] for key in country_keys if key in base.partitions},
+                base.dimensions,
+            )
+            if extracted.partitions:
+                partitions = {
+                    key: partition
+                    for key, partition in base.partitions.items()
+                    if key not in extracted.partitions
+                }
+                self._publish(base, partitions)
 
-        # Rebuild the KD-Tree with the updated points
-        self.build(self.points)
+        return dict(extracted.rows())
 
     def delete_points(self, country_key):
         """
@@ -65,26 +310,17 @@ class KDTree:
         Args:
             country_key (str): Hashed country.
         """
-        # Find the indices of the points to delete
-        indices_to_delete = [idx for idx, key in enumerate(self.country_keys) if key == country_key]
-
-        if not indices_to_delete:
-            print(f"No points found with country key: {country_key}")
-            return
-
-        # Remove the points, reviews, country_keys, and countries
-        self.points = np.delete(self.points, indices_to_delete, axis=0)
-        self.reviews = np.delete(self.reviews, indices_to_delete)
-        self.country_keys = np.delete(self.country_keys, indices_to_delete)
-        self.countries = np.delete(self.countries, indices_to_delete)
+        with self.write_lock:
+            base = self.current
+            if country_key not in base.partitions:
+                print(f"No points found with country key: {country_key}")
+                return
 
-        # Rebuild the KD-Tree with the updated points
-        if self.points.size > 0:
-            self.build(self.points)
-        else:
-            self.tree = None
+            partitions = dict(base.partitions)
+            deleted = partitions.pop(country_key)
+            self._publish(base, partitions)
 
-        print(f"Deleted {len(indices_to_delete)} points with country key: {country_key}\n")
+        print(f"Deleted {len(deleted)} points with country key: {country_key}\n")
 
     def print_countries(self):
         """
@@ -111,54 +347,50 @@ class KDTree:
             print("No update fields provided. Aborting update.")
             return 0
 
-        # Find indices of points to update based on the criteria
-        indices_to_update = []
-        for idx, (point, country_key_entry) in enumerate(zip(self.points, self.country_keys)):
-            # Match country key if provided
-            if country_key and country_key_entry != country_key:
-                continue
-
-            # Match additional criteria if provided
-            if criteria:
-                match = all(
-                    point[CRITERIA_MAPPING[key]] == value for key, value in criteria.items()
-                )
-                if not match:
+        updates_applied = 0
+
+        with self.write_lock:
+            base = self.current
+            partitions = dict(base.partitions)
+            keys = [country_key] if country_key else list(partitions)
+
+            for key in keys:
+                partition = partitions.get(key)
+                if partition is None:
                     continue
 
-            indices_to_update.append(idx)
+                # Find the rows to update based on the criteria
+                match = np.ones(len(partition), dtype=bool)
+                for attr_key, value in (criteria or {}).items():
+                    match &= partition.points[:, CRITERIA_MAPPING[attr_key]] == value
+                if not match.any():
+                    continue
 
-        updates_applied = 0
+                # Copy the columns that change, the current version still shares them
+                points = partition.points
+                if "point" in update_fields or "attributes" in update_fields:
+                    points = points.copy()
+                    if "point" in update_fields:
+                        points[match] = update_fields["point"]
+                    for attr_key, attr_value in update_fields.get("attributes", {}).items():
+                        points[match, CRITERIA_MAPPING[attr_key]] = attr_value
+
+                reviews = partition.reviews
+                if "review" in update_fields:
+                    reviews = np.where(match, update_fields["review"], reviews)
+
+                # Rebuild the partition's KD-Tree only if its points were updated
+                partitions[key] = Partition(
+                    points,
+                    reviews,
+                    partition.country_keys,
+                    partition.countries,
+                    tree=partition.tree if points is partition.points else None,
+                )
+                updates_applied += int(match.sum())
 
-        for idx in indices_to_update:
-            # Update the point if specified
-            if "point" in update_fields:
-                # print(f"Updating point at index {idx}:")
-                # print(f"Old Point: {self.points[idx]}")
-                self.points[idx] = update_fields["point"]
-                # print(f"New Point: {self.points[idx]}")
-
-            # Update specific attributes of the point
-            if "attributes" in update_fields:
-                # print(f"Updating attributes of point at index {idx}:")
-                for attr_key, attr_value in update_fields["attributes"].items():
-                    point_idx = CRITERIA_MAPPING[attr_key]
-                    # print(f" - Old {attr_key}: {self.points[idx][point_idx]}")
-                    self.points[idx][point_idx] = attr_value
-                    # print(f" - New {attr_key}: {self.points[idx][point_idx]}")
-
-            # Update the review if specified
-            if "review" in update_fields:
-                # print(f"Updating review at index {idx}:")
-                # print(f"Old Review: {self.reviews[idx]}")
-                self.reviews[idx] = update_fields["review"]
-                # print(f"New Review: {self.reviews[idx]}")
-
-            updates_applied += 1
-
-        # Rebuild the KD-Tree if any points were updated
-        if updates_applied > 0 and ("point" in update_fields or "attributes" in update_fields):
-            self.build(self.points)
+            if updates_applied > 0:
+                self._publish(base, partitions)
 
         if updates_applied == 0:
             print("No matching points found for the update criteria.")
@@ -169,80 +401,36 @@ class KDTree:
 
     def search(self, country_key, lower_bounds, upper_bounds):
         """
-        Search for points of a given country key within the given bounds for all axes using the KD-Tree.
-
-        Args:
-            country_key (str): Hashed country key.
-            lower_bounds (list): Lower bounds for each axis [review_date, rating, price].
-                                Use `None` for axes that should not be constrained.
-            upper_bounds (list): Upper bounds for each axis [review_date, rating, price].
-                                Use `None` for axes that should not be constrained.
-
-        Returns:
-            list: Points and their associated reviews within the specified range.
+        Search the current version for points of a given country key within the given bounds.
+        See KDTreeVersion.search.
         """
-        if len(lower_bounds) != 3 or len(upper_bounds) != 3:
-            raise ValueError("Bounds must have exactly three values for the three axes.")
-
-        # Compute the midpoint and radius for the search
-        # Only consider axes where both lower and upper bounds are not None
-        valid_axes = [
-            i for i in range(3) if lower_bounds[i] is not None and upper_bounds[i] is not None
-        ]
-
-        # Calculate center and radius only for valid axes
-        for i in range(3):
-            if i not in valid_axes:
-                lower_bounds[i] = np.min(self.points[:, i])
-                upper_bounds[i] = np.max(self.points[:, i])
-        print(f"Searching in KDTree. Query Bounds: {lower_bounds} - {upper_bounds}")
-
-        center = [(lower_bounds[i] + upper_bounds[i]) / 2 for i in range(3)]
-        radius = np.linalg.norm((np.array(upper_bounds) - np.array(lower_bounds)) / 2)
-
-        # Query points within the hypersphere defined by center and radius + a small epsilon
-        indices = self.tree.query_radius([center], r=radius + 1e-8)[0]
-
-        # Filter results within the actual range bounds and matching the country_key
-        matching_points = []
-        matching_reviews = []
-
-        for idx in indices:
-            point = self.points[idx]
-            if self.country_keys[idx] == country_key and all(
-                (lower_bounds[i] is None or lower_bounds[i] <= point[i])
-                and (upper_bounds[i] is None or point[i] <= upper_bounds[i])
-                for i in range(3)
-            ):
-                matching_points.append(point)
-                matching_reviews.append(self.reviews[idx])
-
-        # Convert to NumPy arrays
-        matching_points = np.array(matching_points)
-        matching_reviews = np.array(matching_reviews)
-
-        return matching_points, matching_reviews
+        return self.current.search(country_key, lower_bounds, upper_bounds)
 
     def get_unique_country_keys(self):
         """Return tuple of lists with the unique country keys and their assosiated countries."""
-        unique_country_keys = np.unique(self.country_keys)
-        unique_countries = []
-        for key in unique_country_keys:
-            for country in self.countries:
-                if key == hashlib.sha1(country.encode()).hexdigest()[-4:]:
-                    unique_countries.append(country)
-                    break
-        return list(unique_country_keys), unique_countries
+        # Keys are not always the 4-digit hash of the country (e.g. Chord ring keys), so map them by row
+        partitions = self.current.partitions
+        unique_country_keys = sorted(partitions)
+        unique_countries = [partitions[key].countries[0] for key in unique_country_keys]
+        return unique_country_keys, unique_countries
 
     def get_points(self, country_key):
         """Return the points and reviews for a specific country key."""
-        points = []
-        reviews = []
-        for idx, key in enumerate(self.country_keys):
-            if key == country_key:
-                points.append(self.points[idx].tolist())
-                reviews.append(self.reviews[idx].tolist())
-        return np.array(points), np.array(reviews)
+        partition = self.current.partitions.get(country_key)
+        if partition is None:
+            return np.array([]), np.array([])
+        return partition.points, partition.reviews
+
+    def __contains__(self, country_key):
+        return country_key in self.current
+
+    def __getstate__(self):
+        # Nodes send their KDTree in messages, the lock stays behind
+        return {"current": self.current}
+
+    def __setstate__(self, state):
+        self.current = state["current"]
+        self.write_lock = threading.Lock()
 
     def print_search_results(self, matching_points, matching_reviews):
         """Prints the search results, including the associated country."""
@@ -280,11 +468,12 @@ class KDTree:
         """
         # If to points and reviews are provided, use all stored points and reviews
         if points is None or reviews is None:
-            if self.points is None or self.reviews is None or len(self.points) == 0:
+            snapshot = self.snapshot()
+            if snapshot.size == 0:
                 print("No points available for visualization.")
                 return
-            points = self.points
-            reviews = self.reviews
+            points = snapshot.points
+            reviews = snapshot.reviews
 
         if len(points) > 0:
             # Create a 3D scatter plot if points are available
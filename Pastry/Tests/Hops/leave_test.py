@@ -23,9 +23,17 @@ def leave_test(network=None):
     num_nodes = len(node_ids)  # Original node count
     num_leave_hops = 0
     for node_id in node_ids:
+        node = network.nodes[node_id]
+        timers = list(node.timers)
         response = network.leave(node_id)
         if response and "hops" in response:
             num_leave_hops += len(response["hops"])
+
+        # The departed node's maintenance tasks must not keep running on the shared scheduler
+        assert not node.timers, f"Node {node_id} still has {len(node.timers)} timers."
+        assert all(
+            timer["cancelled"] for timer in timers
+        ), f"A timer of Node {node_id} was not cancelled."
     avg_leave_hops = num_leave_hops / num_nodes
 
     print(f"\nAverage hops for Graceful Node Departures: {avg_leave_hops}")
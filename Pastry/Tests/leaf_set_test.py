@@ -0,0 +1,70 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from Pastry.network import PastryNetwork
+from Pastry.node import PastryNode
+from constants import *
+from helper_functions import hex_distance
+from transport import InProcessTransport
+
+# Node IDs on both sides of 0, so the leaf sets of the nodes next to it wrap around the ring
+WRAP_IDS = ["0010", "0400", "4000", "8000", "c000", "fc00", "fff0"]
+
+# Keys just below and just above 0, and keys far from it
+WRAP_KEYS = ["0000", "0005", "0020", "fff8", "ffff", "fe00", "0300", "8001", "3fff"]
+
+
+def route(network, node_id, key):
+    """
+    Follow the next hops of a key from a node until a node keeps it, and return that node.
+    """
+    hops = [node_id]
+    while True:
+        next_hop = network.nodes[hops[-1]]._find_next_hop(key)
+        if next_hop in (None, hops[-1]):
+            return hops[-1]
+        assert next_hop not in hops, f"Key {key} loops from {node_id}: {hops + [next_hop]}."
+        hops.append(next_hop)
+
+
+def wraparound_test():
+    """
+    Build a network whose IDs surround 0 and check that the leaf sets wrap around the ring:
+    the nodes next to 0 cover the keys on both sides of it, and every key is routed to the
+    node closest to it around the ring from every node.
+    """
+    network = PastryNetwork(transport=InProcessTransport())
+    for node_id in WRAP_IDS:
+        node = PastryNode(network, node_id=node_id)
+        node.start_server()
+        network.node_join(node)
+
+    # fff0 is followed by 0010 and 0400, and 0010 is preceded by fff0 and fc00
+    highest, lowest = network.nodes["fff0"], network.nodes["0010"]
+    assert {"0010", "0400"} <= set(highest.Lmax), f"Lmax of fff0 is {highest.Lmax}."
+    assert {"fff0", "fc00"} <= set(lowest.Lmin), f"Lmin of 0010 is {lowest.Lmin}."
+    for key in ["0000", "0005", "fff8", "ffff"]:
+        assert highest._in_leaf_set(key), f"Key {key} is outside the leaf set of fff0."
+        assert lowest._in_leaf_set(key), f"Key {key} is outside the leaf set of 0010."
+
+    for key in WRAP_KEYS:
+        expected = min(
+            WRAP_IDS,
+            key=lambda node_id: (-hex_distance(node_id, key)[0], hex_distance(node_id, key)[1]),
+        )
+        for node_id in WRAP_IDS:
+            owner = route(network, node_id, key)
+            assert (
+                owner == expected
+            ), f"Key {key} is routed from {node_id} to {owner}, not {expected}."
+
+    for node in network.nodes.values():
+        node.running = False
+    print("Leaf sets wrap around 0 and every key is routed to the node closest to it.")
+
+
+if __name__ == "__main__":
+    wraparound_test()
@@ -0,0 +1,341 @@
+import math
+import random
+import threading
+
+from constants import *
+from .membership_index import MembershipIndex
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+
+
+class SwimMembership:
+    """
+    A Pastry node's own view of the network membership, kept up to date with SWIM-style gossip.
+
+    Every node keeps an address book of the members it knows (ID, port, status, incarnation).
+    Once per protocol period it pings the next of its leaf set, neighborhood set and routing
+    table peers. If the ping is not answered, SWIM_INDIRECT_PROBES other members are asked to
+    ping the peer (SWIM_PING_REQ). A peer that no one can reach becomes a suspect. It is
+    declared dead after SWIM_SUSPECT_TIMEOUT seconds unless it refutes the suspicion with a
+    higher incarnation.
+
+    Joins, suspicions, failures and leaves are disseminated by piggybacking them on the pings
+    and their replies. Each update is retransmitted about GOSSIP_RETRANSMIT_MULT * log2(N)
+    times, at most GOSSIP_MAX_UPDATES per message.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.incarnation = 0  # Incarnation of this node, raised to refute suspicions
+        # Dictionary. Keys are node IDs, values are dictionaries with port, status, incarnation
+        self.members = {}
+        # Sorted IDs of the alive members (and this node), used by repairs and leaf set rebuilds
+        self.index = MembershipIndex(node.id_digits, node.b)
+        self.index.add(node.node_id)
+
+        # Dictionary. Keys are node IDs, values are [update, remaining transmissions]
+        self.updates = {}
+        self.probe_targets = []  # Peers left to ping in the current round
+        self.probing = set()  # Peers with a probe in progress
+        self.lock = threading.Lock()
+
+    # Address Book
+
+    def port(self, node_id):
+        """
+        Return the port of a known member, or None if it is unknown or dead.
+        """
+        if node_id == self.node.node_id:
+            return self.node.port
+        member = self.members.get(node_id)
+        if member is None or member["status"] == DEAD:
+            return None
+        return member["port"]
+
+    def is_alive(self, node_id):
+        """
+        Check if a node is a member that is neither suspected nor dead.
+        Suspects are avoided by routing until they are cleared.
+        """
+        if node_id == self.node.node_id:
+            return True
+        member = self.members.get(node_id)
+        return member is not None and member["status"] == ALIVE
+
+    def alive_members(self):
+        """
+        Return the IDs of the alive members, not including this node.
+        """
+        return [node_id for node_id, member in self.members.items() if member["status"] == ALIVE]
+
+    def known_ports(self, node_ids):
+        """
+        Return the ports of the given live nodes (and this node) to ship along with their IDs.
+        """
+        ports = {self.node.node_id: self.node.port}
+        for node_id in node_ids:
+            if node_id is not None and self.is_alive(node_id):
+                ports[node_id] = self.members[node_id]["port"]
+        return ports
+
+    def learn(self, ports):
+        """
+        Add the nodes of an {ID: port} dictionary received from another node. Nodes that are
+        already known keep their status, a second-hand address does not revive a dead node.
+        """
+        with self.lock:
+            for node_id, port in ports.items():
+                if node_id != self.node.node_id and node_id not in self.members:
+                    self._set(node_id, port, ALIVE, 0)
+
+    def add(self, node_id, port, gossip=False):
+        """
+        Record first-hand evidence that a node is alive (it sent a request, or it is joining).
+        With gossip=True the node's arrival is disseminated to the rest of the network.
+        """
+        if node_id == self.node.node_id:
+            return
+        with self.lock:
+            member = self.members.get(node_id)
+            incarnation = member["incarnation"] if member else 0
+            if member is None or member["status"] != ALIVE:
+                self._set(node_id, port, ALIVE, incarnation)
+                if gossip:
+                    self._queue(node_id)
+
+    def remove(self, node_id):
+        """
+        A node left the network gracefully. Mark it dead and disseminate its departure.
+        """
+        with self.lock:
+            member = self.members.get(node_id)
+            if member is None or member["status"] == DEAD:
+                return
+            self._set(node_id, member["port"], DEAD, member["incarnation"])
+            self._queue(node_id)
+
+    # Failure Detection
+
+    def record_failure(self, node_id):
+        """
+        A request to a node got no reply. Probe the node now instead of waiting for its turn.
+        """
+        if node_id == self.node.node_id or not self.is_alive(node_id):
+            return
+        with self.lock:
+            if node_id in self.probing:
+                return
+            self.probing.add(node_id)
+        self.node.network.scheduler.call_later(0, self._probe, node_id)
+
+    def probe(self):
+        """
+        Periodic task: ping the next peer of this node's state, round robin.
+        """
+        if not self.node.running:
+            return
+
+        if not self.probe_targets:
+            peers = [peer for peer in self.node._referenced_nodes() if self.is_alive(peer)]
+            random.shuffle(peers)
+            self.probe_targets = peers
+        if not self.probe_targets:
+            return
+
+        target = self.probe_targets.pop()
+        with self.lock:
+            if target in self.probing:
+                return
+            self.probing.add(target)
+        self._probe(target)
+
+    def _probe(self, target):
+        try:
+            if not self.node.running or not self.is_alive(target):
+                return
+
+            # Direct ping
+            ping = {"operation": "SWIM_PING"}
+            if self._ping_responses([(target, ping)]):
+                return
+
+            # Indirect pings through other members
+            helpers = [peer for peer in self.alive_members() if peer != target]
+            helpers = random.sample(helpers, min(SWIM_INDIRECT_PROBES, len(helpers)))
+            ping_req = {
+                "operation": "SWIM_PING_REQ",
+                "target": target,
+                "target_port": self.members[target]["port"],
+            }
+            responses = self._ping_responses([(helper, ping_req) for helper in helpers])
+            if any(response.get("ack") for response in responses):
+                return
+
+            self._suspect(target)
+        finally:
+            with self.lock:
+                self.probing.discard(target)
+
+    def _ping_responses(self, messages):
+        """
+        Send pings with piggybacked updates, merge the updates of the replies and return them.
+        """
+        updates = self.gossip()
+        for _, request in messages:
+            request["updates"] = updates
+        responses = [
+            response
+            for response in self.node.fan_out(messages, timeout=SWIM_PING_TIMEOUT)
+            if response is not None
+        ]
+        for response in responses:
+            self.merge(response.get("updates", []))
+        return responses
+
+    def _suspect(self, node_id):
+        with self.lock:
+            member = self.members.get(node_id)
+            if member is None or member["status"] != ALIVE:
+                return
+            incarnation = member["incarnation"]
+            self._set(node_id, member["port"], SUSPECT, incarnation)
+            self._queue(node_id)
+        print(f"Node {self.node.node_id}: Suspecting node {node_id}.")
+        self.node.network.scheduler.call_later(
+            SWIM_SUSPECT_TIMEOUT, self._confirm, node_id, incarnation
+        )
+
+    def _confirm(self, node_id, incarnation):
+        """
+        Declare a suspect dead if it has not refuted the suspicion since.
+        """
+        with self.lock:
+            member = self.members.get(node_id)
+            if (
+                member is None
+                or member["status"] != SUSPECT
+                or member["incarnation"] != incarnation
+            ):
+                return
+            self._set(node_id, member["port"], DEAD, incarnation)
+            self._queue(node_id)
+        print(f"Node {self.node.node_id}: Node {node_id} is declared dead.")
+        if self.node.running:
+            self.node.schedule_repair(node_id)
+
+    # Requests
+
+    def handle_ping(self, request):
+        """
+        Handle a SWIM_PING: merge the piggybacked updates and acknowledge with our own.
+        """
+        self.merge(request.get("updates", []))
+        return {"status": "success", "updates": self.gossip()}
+
+    def handle_ping_req(self, request):
+        """
+        Handle a SWIM_PING_REQ: ping the target on behalf of the requester.
+        """
+        self.merge(request.get("updates", []))
+        target = request["target"]
+        if target not in self.members:
+            self.learn({target: request["target_port"]})
+
+        ping = {"operation": "SWIM_PING", "updates": self.gossip()}
+        response = self.node.send_request(target, ping)
+        if response is not None:
+            self.merge(response.get("updates", []))
+        return {"status": "success", "ack": response is not None, "updates": self.gossip()}
+
+    # Gossip
+
+    def gossip(self):
+        """
+        Return the updates to piggyback on the next message, most recent ones first.
+        """
+        with self.lock:
+            selected = sorted(self.updates.items(), key=lambda item: -item[1][1])
+            selected = selected[:GOSSIP_MAX_UPDATES]
+            updates = []
+            for node_id, entry in selected:
+                updates.append(entry[0])
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.updates[node_id]
+        return updates
+
+    def merge(self, updates):
+        """
+        Apply received updates. An update replaces what we know about a node if it is about
+        a newer incarnation, or if it is a suspicion (or death) of the same incarnation.
+        New information is passed on with our own gossip.
+        """
+        dead = []
+        with self.lock:
+            for update in updates:
+                node_id = update["node_id"]
+                status = update["status"]
+                incarnation = update["incarnation"]
+
+                if node_id == self.node.node_id:
+                    # Refute a suspicion (or a false death) of this node
+                    if status != ALIVE and incarnation >= self.incarnation:
+                        self.incarnation = incarnation + 1
+                        self._queue(node_id)
+                    continue
+
+                member = self.members.get(node_id)
+                if member is None:
+                    newer = True
+                elif member["status"] == DEAD:
+                    newer = False  # Death is final
+                elif status == ALIVE:
+                    newer = incarnation > member["incarnation"]
+                elif status == SUSPECT:
+                    newer = incarnation > member["incarnation"] or (
+                        incarnation == member["incarnation"] and member["status"] == ALIVE
+                    )
+                else:
+                    newer = incarnation >= member["incarnation"]
+
+                if newer:
+                    self._set(node_id, update["port"], status, incarnation)
+                    self._queue(node_id)
+                    if status == DEAD:
+                        dead.append(node_id)
+
+        # Repair the state that refers to the failed nodes
+        if self.node.running:
+            for node_id in dead:
+                self.node.schedule_repair(node_id)
+
+    def _set(self, node_id, port, status, incarnation):
+        self.members[node_id] = {"port": port, "status": status, "incarnation": incarnation}
+        if status == ALIVE:
+            self.index.add(node_id)
+        else:
+            self.index.remove(node_id)
+
+    def _queue(self, node_id):
+        """
+        Queue the current state of a node (or of this node) for dissemination.
+        """
+        if node_id == self.node.node_id:
+            update = {
+                "node_id": node_id,
+                "port": self.node.port,
+                "status": ALIVE,
+                "incarnation": self.incarnation,
+            }
+        else:
+            member = self.members[node_id]
+            update = {
+                "node_id": node_id,
+                "port": member["port"],
+                "status": member["status"],
+                "incarnation": member["incarnation"],
+            }
+        transmissions = GOSSIP_RETRANSMIT_MULT * math.ceil(math.log2(len(self.members) + 2))
+        self.updates[node_id] = [update, transmissions]
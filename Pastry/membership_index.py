@@ -0,0 +1,129 @@
+import bisect
+import threading
+
+from helper_functions import id_int, prefix_length, ring_distance
+
+
+class MembershipIndex:
+    """
+    Sorted index of node IDs, updated incrementally as nodes join and leave.
+
+    The IDs are kept as (integer ID, node ID) pairs in numerical order. The nodes that share a
+    prefix form a contiguous range of that order, so every query is a binary search:
+    the node sharing the longest prefix with a key, the first node with a given prefix and next
+    digit (a routing table entry), and the k nearest nodes on either side of an ID (a leaf set).
+    The IDs form a ring: the highest ID is followed by the lowest one.
+    """
+
+    def __init__(self, digits, bits):
+        self.digits = digits  # Number of digits in an ID
+        self.bits = bits  # Bits per digit
+        self.entries = []  # Sorted (integer ID, node ID) pairs
+        self.lock = threading.Lock()
+
+    def add(self, node_id):
+        entry = (id_int(node_id), node_id)
+        with self.lock:
+            idx = bisect.bisect_left(self.entries, entry)
+            if idx == len(self.entries) or self.entries[idx] != entry:
+                self.entries.insert(idx, entry)
+
+    def remove(self, node_id):
+        entry = (id_int(node_id), node_id)
+        with self.lock:
+            idx = bisect.bisect_left(self.entries, entry)
+            if idx < len(self.entries) and self.entries[idx] == entry:
+                del self.entries[idx]
+
+    def longest_prefix_match(self, key, exclude=()):
+        """
+        Return the node sharing the longest prefix with the key, the closest one around the
+        ring if several do, or None if the index has no other nodes than the excluded ones.
+        """
+        entries = self.entries
+        key_int = id_int(key)
+        idx = bisect.bisect_left(entries, (key_int,))
+
+        # The best match on each side is the nearest node that is not excluded, wrapping around
+        # the ends of the index (only nodes sharing no prefix with the key lie past them)
+        candidates = [
+            entry
+            for entry in (self._nearest(idx - 1, -1, exclude), self._nearest(idx, 1, exclude))
+            if entry is not None
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda entry: (
+                -prefix_length(entry[0], key_int, self.digits, self.bits),
+                ring_distance(entry[0], key_int, self.digits * self.bits),
+            ),
+        )[1]
+
+    def first_with_prefix(self, node_id, length, digit):
+        """
+        Return the first node that shares `length` leading digits with node_id and has `digit`
+        as its next digit, i.e. a candidate for routing table entry (length, digit) of node_id.
+        Returns None if there is no such node.
+        """
+        shift = self.bits * (self.digits - length - 1)
+        prefix = (id_int(node_id) >> (shift + self.bits)) << (shift + self.bits)
+        low = prefix | (digit << shift)
+
+        entries = self.entries
+        idx = bisect.bisect_left(entries, (low,))
+        if idx < len(entries) and entries[idx][0] < low + (1 << shift):
+            return entries[idx][1]
+        return None
+
+    def lower(self, node_id, k):
+        """
+        Return up to k other nodes below node_id, closest first, continuing from the highest
+        ID after the lowest one.
+        """
+        idx = bisect.bisect_left(self.entries, (id_int(node_id),))
+        return self._walk(idx - 1, -1, node_id, k)
+
+    def higher(self, node_id, k):
+        """
+        Return up to k other nodes above node_id, closest first, continuing from the lowest
+        ID after the highest one.
+        """
+        idx = bisect.bisect_right(self.entries, (id_int(node_id), node_id))
+        return self._walk(idx, 1, node_id, k)
+
+    def _walk(self, start, step, node_id, k):
+        """
+        Return up to k node IDs other than node_id, from position start in the direction of
+        step (1 or -1) around the ring.
+        """
+        entries = self.entries
+        nodes = []
+        for offset in range(len(entries)):
+            if len(nodes) == k:
+                break
+            other = entries[(start + step * offset) % len(entries)][1]
+            if other != node_id:
+                nodes.append(other)
+        return nodes
+
+    def _nearest(self, start, step, exclude):
+        """
+        Return the first entry that is not excluded, from position start in the direction of
+        step (1 or -1) around the ring, or None if every entry is excluded.
+        """
+        entries = self.entries
+        for offset in range(len(entries)):
+            entry = entries[(start + step * offset) % len(entries)]
+            if entry[1] not in exclude:
+                return entry
+        return None
+
+    def __contains__(self, node_id):
+        entry = (id_int(node_id), node_id)
+        idx = bisect.bisect_left(self.entries, entry)
+        return idx < len(self.entries) and self.entries[idx] == entry
+
+    def __len__(self):
+        return len(self.entries)
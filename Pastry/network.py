@@ -1,29 +1,91 @@
+import bisect
 import numpy as np
 import pandas as pd
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from .node import PastryNode
 from constants import *
 from helper_functions import *
+from scheduler import get_scheduler
+from request_pool import is_overloaded
+from transport import SocketTransport
 from .pastry_gui import PastryDashboard
 
 
 class PastryNetwork:
-    def __init__(self, main_window=None):
+    def __init__(self, main_window=None, transport=None, id_digits=HASH_HEX_DIGITS, b=b):
+        if not 1 <= b <= 8:
+            raise ValueError("The routing base b must be between 1 and 8 bits per digit.")
+        if not 0 < id_digits * b <= 160:
+            raise ValueError("Node IDs must be between 1 and 160 bits long (the width of SHA-1).")
+        self.b = b  # Bits per digit. Each routing table row has 2^b columns
+        self.id_digits = id_digits  # Number of base 2^b digits in a node ID
+        self.id_bits = id_digits * b
+        self.hash_hex_digits = (self.id_bits + 3) // 4  # Hex digits of node IDs and keys
+
         self.nodes = {}  # Dictionary. Keys are node IDs, values are Node objects
-        self.node_ports = {}  # Dictionary. Keys are node IDs, values are ports
+        # Dictionary. Keys are node IDs, values are ports. Only used to bootstrap joining nodes,
+        # the nodes keep their own address books
+        self.node_ports = {}
         self.used_ports = []
 
+        # How the nodes deliver requests to each other (loopback sockets by default)
+        self.transport = transport if transport is not None else SocketTransport()
+        self.scheduler = get_scheduler()  # Shared by every node of the process
+        # Sends the concurrent requests of every node's fan-outs
+        self.fan_out_pool = ThreadPoolExecutor(max_workers=4 * FAN_OUT_PARALLELISM)
+        # Sends the forwarded requests that may be hedged, a free slot is taken before each submit
+        self.hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_THREADS)
+        self.hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_THREADS)
+
         EVENLY_SPACED_NODES = 16
         # Generates evenly spaced points
         self.positions = np.linspace(0, 1, EVENLY_SPACED_NODES)
 
         self.used_positions = list(self.positions)
+        # Sorted (position, node ID) pairs of the nodes in the network, searched with bisect on joins
+        self.position_index = []
 
         self.gui = PastryDashboard(self, main_window=main_window)  # Initialize the Pastry GUI
 
         self.lock = threading.Lock()
 
+    def format_id(self, id_int):
+        """
+        Format an integer ID or key as a zero-padded hex string.
+        """
+        return int_to_hex(id_int, self.hash_hex_digits)
+
+    def hash_key(self, value):
+        """
+        Hash a value (e.g. a country) to a hex key as wide as the node IDs.
+        """
+        return self.format_id(int(hash_key(value, self.hash_hex_digits), 16) % 2**self.id_bits)
+
+    def common_prefix_length(self, id1, id2):
+        """
+        Number of leading base 2^b digits shared by two hex IDs.
+        """
+        return prefix_length(id_int(id1), id_int(id2), self.id_digits, self.b)
+
+    def digit(self, node_id, idx):
+        """
+        Return the base 2^b digit at position idx of a hex ID (the routing table column).
+        """
+        return digit_at(id_int(node_id), idx, self.id_digits, self.b)
+
+    def id_distance(self, id1, id2):
+        """
+        Return the common prefix length and the numerical distance (around the ID ring)
+        between two hex IDs.
+        """
+        int1 = id_int(id1)
+        int2 = id_int(id2)
+        return prefix_length(int1, int2, self.id_digits, self.b), ring_distance(
+            int1, int2, self.id_bits
+        )
+
     def node_join(self, new_node):
         """
         Handles a new node joining the Pastry network.
@@ -48,19 +110,38 @@ class PastryNetwork:
             # Add the node's port to the node_ports dictionary
             self.node_ports[new_node_id] = new_node.port
 
-            # Snapshot of the existing node keys
-            existing_nodes = [nid for nid in self.nodes.keys() if nid != new_node_id]
-            # Snapshot of the node ports
-            # node_ports_snapshot = dict(self.node_ports)
+            # Find the closest nodes before indexing the new node's position
+            bootstrap_ids = self._find_topologically_closest_nodes(
+                new_node.position, JOIN_BOOTSTRAP_CANDIDATES
+            )
+            bisect.insort(self.position_index, (new_node.position, new_node_id))
 
-        if len(self.nodes) == 1:
+        if not bootstrap_ids:
             print("The network is empty. The new node is the first node.")
             return
 
-        # Find closest node from the snapshot we took while holding the lock
-        closest_node_id, closest_neighborhood_set = self._find_topologically_closest_node(
-            new_node, existing_nodes
-        )
+        # The closest node that answers is the new node's first contact. Get its neighborhood
+        # set, along with the positions and ports it knows
+        response = None
+        for closest_node_id in bootstrap_ids:
+            new_node.membership.add(closest_node_id, self.node_ports[closest_node_id])
+            response = new_node.send_request(closest_node_id, {"operation": "GET_NEIGHBORHOOD_SET"})
+            if response is not None:
+                break
+            print(f"Node {closest_node_id} did not answer. Trying the next closest node...")
+
+        if response is None:
+            print(f"No bootstrap node answered. Node {new_node_id} could not join the network.")
+            self._unindex_position(new_node)
+            with self.lock:
+                del self.nodes[new_node_id]
+                del self.node_ports[new_node_id]
+            new_node.running = False
+            return {"status": "failure", "message": "No bootstrap node answered."}
+
+        closest_neighborhood_set = response["neighborhood_set"]
+        new_node.peer_positions.update(response["positions"])
+        new_node.membership.learn(response["ports"])
         print(f"The topologically closest node is {closest_node_id}")
         print(f"The topologically closest neigborhood is {closest_neighborhood_set}")
 
@@ -77,18 +158,23 @@ class PastryNetwork:
         join_request = {
             "operation": "NODE_JOIN",
             "joining_node_id": new_node_id,
-            "common_prefix_len": common_prefix_length(new_node_id, closest_node_id),
+            "joining_node_port": new_node.port,
+            "common_prefix_len": self.common_prefix_length(new_node_id, closest_node_id),
             "hops": [],  # Initialize an empty hops list
         }
         print(f"\nForwarding JOIN_NETWORK request to the closest node {closest_node_id}...")
         with self.lock:
-            response = new_node.send_request(self.node_ports[closest_node_id], join_request)
+            response = new_node.send_request(closest_node_id, join_request)
 
         # Extract and print the hop count from the response
         if response and "hops" in response:
             hop_count = len(response["hops"])
             print(f"\nHops during node join for {new_node_id}: {hop_count}")
             print(f"Full hops list: {response['hops']}")
+
+        # Install the routing table rows and leaf set collected along the route
+        if response and response.get("status") == "success":
+            new_node.install_join_state(response)
         else:
             print(f"Failed to retrieve hop count for {new_node_id}. Response: {response}")
 
@@ -121,54 +207,72 @@ class PastryNetwork:
             }
 
         leaving_node = self.nodes[leaving_node_id]
-        keys_to_store = []
+        rows_to_store = None
 
         with leaving_node.lock:
             # Extract keys from the KDTree of the leaving node
-            if not leaving_node.kd_tree or not leaving_node.kd_tree.points.size:
+            if not leaving_node.kd_tree or not leaving_node.kd_tree.size:
                 print(f"Network: Node {leaving_node_id} has no keys to store.")
             else:
-                # Extract points, reviews, and countries from the KDTree
-                keys_to_store = [
-                    {
-                        "key": country_key,
-                        "position": point,
-                        "review": review,
-                        "country": country,
-                    }
-                    for country_key, point, review, country in zip(
-                        leaving_node.kd_tree.country_keys,
-                        leaving_node.kd_tree.points,
-                        leaving_node.kd_tree.reviews,
-                        leaving_node.kd_tree.countries,  # Use the original country
-                    )
-                ]
-                print(f"Network: Stored {len(keys_to_store)} keys from Node {leaving_node_id}.")
+                # Keep the points, reviews, and countries of the KDTree in columnar form
+                rows_to_store = dict(leaving_node.kd_tree.snapshot().rows())
+                print(
+                    f"Network: Stored {len(rows_to_store['points'])} keys from Node {leaving_node_id}."
+                )
 
         # Remove the leaving node from the network
         print(f"Network: Removing Node {leaving_node_id} from the network.")
         del self.nodes[leaving_node_id]
         del self.node_ports[leaving_node_id]
+        self._unindex_position(leaving_node)
         leaving_node.running = False  # Stop the node's server
+        leaving_node.cancel_timers()
 
-        # Notify remaining nodes about the departure
+        # Notify the nodes that refer to the leaving node, and the nodes it refers to
         print(f"Network: Notifying affected nodes about Node {leaving_node_id}'s departure.")
-        available_nodes = list(self.nodes.keys())
-        node_positions = {node_id: self.nodes[node_id].position for node_id in self.nodes}
-
-        for node_id in available_nodes:
-            leave_request = {
-                "operation": "NODE_LEAVE",
-                "leaving_node_id": leaving_node_id,
-                "available_nodes": available_nodes,
-                "node_positions": node_positions,
-                "hops": hops,  # Pass the hops list
-            }
-            response = self.nodes[node_id].send_request(self.node_ports[node_id], leave_request)
+        # The leaving node may not have heard yet of nodes that left before it
+        available_nodes = [
+            node_id for node_id in leaving_node.membership.alive_members() if node_id in self.nodes
+        ]
+        affected_nodes = []
+        for node_id in [
+            *leaving_node.referrers,
+            *leaving_node.Lmin,
+            *leaving_node.Lmax,
+            *leaving_node.neighborhood_set,
+            *leaving_node.routing_table.node_ids(),
+        ]:
+            if (
+                node_id
+                and node_id not in affected_nodes
+                and leaving_node.membership.is_alive(node_id)
+            ):
+                affected_nodes.append(node_id)
+
+        # The leaving node's leaf and neighborhood sets are the replacement candidates
+        candidates = leaving_node.Lmin + leaving_node.Lmax + leaving_node.neighborhood_set
+        leave_request = {
+            "operation": "NODE_LEAVE",
+            "leaving_node_id": leaving_node_id,
+            "replacements": {
+                "Lmin": leaving_node.Lmin,
+                "Lmax": leaving_node.Lmax,
+                "neighborhood_set": leaving_node.neighborhood_set,
+                "positions": {
+                    node_id: leaving_node.peer_positions[node_id]
+                    for node_id in candidates
+                    if node_id in leaving_node.peer_positions
+                },
+                "ports": leaving_node.membership.known_ports(candidates),
+            },
+            "hops": [],
+        }
+        responses = leaving_node.fan_out([(node_id, leave_request) for node_id in affected_nodes])
 
-            # Update the hops list from the response
+        # Collect the hops of every notification
+        for response in responses:
             if response and "hops" in response:
-                hops = response["hops"]
+                hops.extend(response["hops"])
 
         # Check if there are any available nodes for reinsertion
         if not available_nodes:
@@ -179,34 +283,59 @@ class PastryNetwork:
                 "hops": hops,
             }
 
-        # Reinsert stored keys using the network-level insert_key function
-        print(f"Network: Reinserting stored keys into the network.")
+        # Migrate the stored keys, one bulk transfer per destination node
+        print(f"Network: Migrating stored keys into the network.")
         reinserted_count = 0
-        for key_data in keys_to_store:
-            key = key_data["key"]
-            position = key_data["position"]
-            review = key_data["review"]
-            country = key_data["country"]  # Original country
-
-            # Find the node with the minimum subtraction value from the key
-            closest_node_id = min(
-                available_nodes, key=lambda node_id: abs(int(node_id, 16) - int(key, 16))
-            )
-
-            try:
-                print(
-                    f"Network: Redirecting key {key} (Country: {country}) from Node: {node_id}  to Node {closest_node_id}."
+        retried_count = 0  # Shed by their destination, sent again later
+        num_keys_to_store = 0
+        if rows_to_store is not None:
+            num_keys_to_store = len(rows_to_store["points"])
+
+            # Send each unique key to the node that routing would deliver it to:
+            # longest common prefix first, then minimum distance around the ID ring
+            destinations = {}
+            for key in np.unique(rows_to_store["country_keys"]):
+                closest_node_id = min(
+                    available_nodes,
+                    key=lambda node_id: (
+                        -self.id_distance(node_id, key)[0],
+                        self.id_distance(node_id, key)[1],
+                    ),
                 )
-                self.nodes[closest_node_id].insert_key(key, position, review, country)
-                reinserted_count += 1
-            except Exception as e:
+                destinations.setdefault(closest_node_id, []).append(str(key))
+
+            for closest_node_id, keys in destinations.items():
+                mask = np.isin(rows_to_store["country_keys"], keys)
+                migrate_request = {
+                    "operation": "MIGRATE_KEYS",
+                    "keys": keys,
+                    "points": rows_to_store["points"][mask],
+                    "reviews": rows_to_store["reviews"][mask],
+                    "country_keys": rows_to_store["country_keys"][mask],
+                    "countries": rows_to_store["countries"][mask],
+                    "hops": [],
+                }
                 print(
-                    f"Network: Failed to redirect key {key} to Node {closest_node_id}. Error: {e}"
+                    f"Network: Redirecting keys {keys} from Node: {leaving_node_id} to Node {closest_node_id}."
+                )
+
+                def report_failure(response, keys=keys, closest_node_id=closest_node_id):
+                    print(
+                        f"Network: Failed to redirect keys {keys} to Node {closest_node_id}. Response: {response}"
+                    )
+
+                response = leaving_node.send_transfer(
+                    closest_node_id, migrate_request, report_failure
                 )
+                if response and response["status"] == "success":
+                    reinserted_count += int(mask.sum())
+                elif is_overloaded(response):
+                    retried_count += int(mask.sum())
 
-        skipped_count = len(keys_to_store) - reinserted_count
+        skipped_count = num_keys_to_store - reinserted_count - retried_count
         print(
-            f"Network: Successfully reinserted {reinserted_count} keys. Skipped {skipped_count} keys."
+            f"Network: Successfully reinserted {reinserted_count} keys. Retrying {retried_count} keys. "
+            f"Skipped {skipped_count} keys."
         )
 
         print(f"Network: Node {leaving_node_id} has successfully left the network.")
@@ -235,6 +364,8 @@ class PastryNetwork:
 
         # Remove the node from the network **without notifying others**
         self.nodes[failing_node_id].running = False  # Stop the node's server
+        self.nodes[failing_node_id].cancel_timers()
+        self._unindex_position(self.nodes[failing_node_id])
         del self.nodes[failing_node_id]
         del self.node_ports[failing_node_id]
 
@@ -242,32 +373,25 @@ class PastryNetwork:
 
         return {"status": "success", "message": f"Node {failing_node_id} has failed unexpectedly."}
 
-    def _find_topologically_closest_node(self, new_node, existing_nodes):
+    def _find_topologically_closest_nodes(self, position, count):
         """
-        Find the topologically closest node from a precomputed list of existing nodes.
+        Find the `count` nodes closest to a position, closest first, with a binary search of the
+        position index. Returns an empty list if the network has no other nodes.
         """
-        closest_node_id = None
-        closest_neighborhood_set = None
-        min_distance = float("inf")
-        for existing_node_id in existing_nodes:
-            # Skip the new node
-            if existing_node_id == new_node.node_id:
-                continue
-
-            dist_request = {
-                "operation": "DISTANCE",
-                "node_position": new_node.position,
-                "hops": [],
-            }
-            response = new_node.send_request(self.node_ports[existing_node_id], dist_request)
+        idx = bisect.bisect_left(self.position_index, (position,))
+        # Only the `count` entries on each side of the position can be among the closest
+        neighbors = self.position_index[max(idx - count, 0) : idx + count]
+        neighbors.sort(key=lambda entry: topological_distance(entry[0], position))
+        return [node_id for _, node_id in neighbors[:count]]
 
-            distance = response["distance"]
-            neighborhood_set = response["neighborhood_set"]
-            if distance < min_distance:
-                closest_node_id = existing_node_id
-                closest_neighborhood_set = neighborhood_set
-                min_distance = distance
-        return closest_node_id, closest_neighborhood_set
+    def _unindex_position(self, node):
+        """
+        Remove a node from the position index.
+        """
+        with self.lock:
+            idx = bisect.bisect_left(self.position_index, (node.position, node.node_id))
+            if idx < len(self.position_index) and self.position_index[idx][1] == node.node_id:
+                del self.position_index[idx]
 
     def build(self, predefined_ids=None, node_num=None, dataset_path=None):
         """
@@ -318,7 +442,7 @@ class PastryNetwork:
         df["review_date"] = pd.to_datetime(df["review_date"], format="%B %Y").dt.year
 
         # Extract loc_country as keys
-        keys = df["loc_country"].apply(hash_key)
+        keys = df["loc_country"].apply(self.hash_key)
 
         # Extract data points (review_date, rating, 100g_USD)
         points = df[["review_date", "rating", "100g_USD"]].to_numpy()
@@ -1,12 +1,18 @@
+import bisect
+import collections
+import copy
+import uuid
 import threading
+import time
 import socket
 import pickle
-from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import subprocess  # for running netsh to get excluded ports on Windows
 import re
 import platform  # for system identification to get excluded ports
 import struct
+from concurrent.futures import FIRST_COMPLETED, wait
+from queue import Empty, Queue
 
 
 from constants import *
@@ -15,9 +21,14 @@ from helper_functions import *
 from Multidimensional_Data_Structures.kd_tree import KDTree
 from Multidimensional_Data_Structures.lsh import LSH
 from sklearn.feature_extraction.text import TfidfVectorizer
+from peer_stats import PeerStats
+from request_server import RequestServer
+from request_pool import is_overloaded
+from .membership import SwimMembership
+from .routing_table import RoutingTable
 
 
-class PastryNode:
+class PastryNode(RequestServer):
 
     def __init__(self, network, node_id=None):
         """
@@ -25,27 +36,52 @@ class PastryNode:
         """
         self.network = network  # Reference to the DHT network
         self.running = True
-        self.port = self._generate_port()  # IP = (127.0.0.1, Port)
+        self.port = self.network.transport.allocate_port(self)  # IP = (127.0.0.1, Port)
 
         self.node_id = node_id if node_id is not None else self._generate_id(self.port)
+        self.node_int = int(self.node_id, 16)  # Integer form of the ID used by routing
+        self.id_digits = self.network.id_digits  # Number of base 2^b digits in a node ID
+        self.b = self.network.b  # Bits per digit
+        self.id_bits = self.network.id_bits  # Bits per ID, the ring has 2^id_bits IDs
+        self.membership = SwimMembership(self)  # Address book and liveness of the other nodes
+        # Round-trip times, timeouts and circuit breakers of the requests to each peer
+        self.peer_stats = PeerStats(self.network.scheduler.clock)
         self.position = None  # Position will be generated by the network
+        # Dictionary. Keys are node IDs, values are the positions this node has learned
+        self.peer_positions = {}
+        # IDs of the nodes whose state (leaf set, neighborhood set, routing table) refers to this node
+        self.referrers = set()
         self.kd_tree = None  # Centralized KD-Tree object
 
         # 2D Routing Table
-        self.routing_table = [[None for j in range(pow(2, b))] for i in range(HASH_HEX_DIGITS)]
+        self.routing_table = RoutingTable(self.id_digits, pow(2, self.b))
 
         # Leaf Set
         self.Lmin = [None for x in range(L // 2)]
         self.Lmax = [None for x in range(L // 2)]
+        # Sorted integer IDs of the leaf set and the matching node IDs, searched with bisect
+        self.leaf_index = ([], [])
+        # Ring distances from this node to its farthest leaf below (Lmin) and above (Lmax) it
+        self.leaf_extent = (-1, -1)
 
         # Nearby nodes
         # self.neighborhood_set = [None for x in range(np.floor(np.sqrt(N)).astype(int))]
         self.neighborhood_set = [None for x in range(NEIGHBORHOOD_SIZE)]
 
         self.lock = threading.Lock()  # Lock for thread safety
+        self.timers = []  # Maintenance timers on the network's scheduler
+        self.pending_repairs = set()  # Failed nodes whose repair is queued or running
+        self.repair_lock = threading.Lock()
+        self.maintenance_row = 0  # Next routing table row to improve
+        # Recent latencies of forwarded requests, the hedging delay is a percentile of them
+        self.forward_latencies = collections.deque(maxlen=HEDGE_LATENCY_WINDOW)
+        # IDs of the hedged requests whose work this node has started, oldest first. A second
+        # copy of one of them (the primary or the hedge) is cancelled
+        self.claimed_requests = collections.OrderedDict()
+        self.claim_lock = threading.Lock()
 
         # Create a thread pool for handling requests to limit the number of concurrent threads
-        self.thread_pool = ThreadPoolExecutor(max_workers=10)
+        self.thread_pool = self.network.transport.create_thread_pool()
 
     # Initialization Methods
 
@@ -116,10 +152,10 @@ class PastryNode:
 
     def _generate_id(self, port):
         """
-        Generate a unique node ID by hashing the port.
+        Generate a unique node ID by hashing the address (IP and port).
         """
-        port_str = f"{port}"
-        node_id = hash_key(port_str)
+        address_str = f"127.0.0.1:{port}"
+        node_id = self.network.hash_key(address_str)
         return node_id
 
     # State Inspection
@@ -160,10 +196,11 @@ class PastryNode:
 
         # KD Tree Information
         state_info.append("\nKD Tree:\nUnique Country Keys:")
-        if not self.kd_tree or self.kd_tree.country_keys.size == 0:
+        snapshot = self.kd_tree.snapshot() if self.kd_tree else None
+        if not snapshot or snapshot.size == 0:
             state_info.append("[]")  # Empty KD Tree
         else:
-            unique_keys, counts = np.unique(self.kd_tree.country_keys, return_counts=True)
+            unique_keys, counts = np.unique(snapshot.country_keys, return_counts=True)
             state_info.append(f"{list(map(str, unique_keys))}")
 
             # Country count table
@@ -171,7 +208,7 @@ class PastryNode:
             state_info.append(f"{'Country Key':<12} | {'Country Name':<14} | {'Count':<6}")
             state_info.append("-" * 38)
 
-            country_map = dict(zip(self.kd_tree.country_keys, self.kd_tree.countries))
+            country_map = dict(zip(snapshot.country_keys, snapshot.countries))
             for key, count in zip(unique_keys, counts):
                 state_info.append(f"{key:<12} | {country_map[key]:<14} | {count:<6}")
 
@@ -189,8 +226,23 @@ class PastryNode:
         """
         Start the server thread to listen for incoming requests.
         """
-        server_thread = threading.Thread(target=self._server, daemon=True)
-        server_thread.start()
+        self.network.transport.start(self.port, self)
+
+        # Periodic routing table maintenance and membership probes on the network's shared scheduler
+        self.timers = [
+            self.network.scheduler.call_every(
+                ROUTING_MAINTENANCE_INTERVAL, self.improve_routing_table
+            ),
+            self.network.scheduler.call_every(SWIM_PROTOCOL_PERIOD, self.membership.probe),
+        ]
+
+    def cancel_timers(self):
+        """
+        Cancel the node's periodic tasks on the network's scheduler.
+        """
+        for timer in self.timers:
+            self.network.scheduler.cancel(timer)
+        self.timers = []
 
     def _server(self):
         """
@@ -220,7 +272,7 @@ class PastryNode:
                         if not self.running:  # If shutting down, close connection
                             conn.close()
                             break
-                        self.thread_pool.submit(self._handle_request, conn)
+                        self._admit_request(conn)
                     except socket.timeout:
                         continue  # Check `self.running` flag again
                     except OSError as e:
@@ -232,132 +284,327 @@ class PastryNode:
                 self.thread_pool.shutdown(wait=False)
                 print(f"Node {self.node_id} server shutting down.")
 
-    def _handle_request(self, conn):
-        try:
-            # Receive the length of the incoming data (first 4 bytes)
-            length_data = conn.recv(4)
-            if not length_data:
-                return
-            data_length = struct.unpack(">I", length_data)[0]
+    def _process_request(self, request):
+        """
+        Dispatch a deserialized request to its handler and return the response.
+        """
+        operation = request["operation"]
+        hops = request.get("hops", [])
 
-            # Receive the actual data
-            data = b""
-            while len(data) < data_length:
-                chunk = conn.recv(min(data_length - len(data), 1024 * 1024))
-                if not chunk:
-                    break
-                data += chunk
+        # The sender is alive, learn its address
+        if request.get("sender"):
+            self.membership.add(*request["sender"])
+
+        response = None
+
+        # Append the current node to the hops list only in main operations
+        if operation in main_operations:
+            hops.append(self.node_id)
+            print(f"Node {self.node_id}: Handling Request: {request}")
+
+        if operation == "NODE_JOIN":
+            response = self._handle_join_request(request)
+        elif operation == "NODE_LEAVE":
+            response = self._handle_leave_request(request)
+        elif operation == "INSERT_KEY":
+            response = self._handle_insert_key_request(request)
+        elif operation == "UPDATE_KEY":
+            response = self._handle_update_key_request(request)
+        elif operation == "DELETE_KEY":
+            response = self._handle_delete_key_request(request)
+        elif operation == "LOOKUP":
+            response = self._handle_lookup_request(request)
+        elif operation == "UPDATE_PRESENCE":
+            response = self._handle_update_presence_request(request)
+        elif operation == "UPDATE_ROUTING_TABLE_ENTRY":
+            response = self.update_routing_table_entry(request)
+        elif operation == "DISTANCE":
+            distance = topological_distance(self.position, request["node_position"])
+            response = {
+                "distance": distance,
+                "neighborhood_set": self.neighborhood_set,
+                "hops": hops,
+            }
+        elif operation == "GET_LEAF_SET":
+            response = {
+                "status": "success",
+                "leaf_set": {"Lmin": self.Lmin, "Lmax": self.Lmax},
+                "ports": self.membership.known_ports(self.Lmin + self.Lmax),
+                "hops": hops,
+            }
+        elif operation == "GET_NEIGHBORHOOD_SET":  # New operation
+            response = self._handle_get_neighborhood_set(request)
+
+            print(response)
+        elif operation == "REQUEST_NEXT_HOP":
+            failed_node_id = request["failed_node_id"]
+            next_hop = self._find_next_hop(failed_node_id)  # Perform find_next_hop
+            response = {"status": "success" if next_hop else "failure", "next_hop": next_hop}
+        elif operation == "GET_POSITION":
+            response = {"status": "success", "position": self.position}
+        elif operation == "SWIM_PING":
+            response = self.membership.handle_ping(request)
+        elif operation == "SWIM_PING_REQ":
+            response = self.membership.handle_ping_req(request)
+        elif operation == "ADD_REFERENCE":
+            self.referrers.add(request["node_id"])
+            response = {"status": "success"}
+        elif operation == "GET_ROUTING_TABLE_ROW":
+            row_idx = request["row_idx"]
+            row = self.routing_table.row(row_idx)
+            response = {
+                "status": "success",
+                "row": row,
+                "positions": self._known_positions(row),
+                "ports": self.membership.known_ports(row),
+            }
+        elif operation == "GET_KEYS":
+            response = self._handle_get_keys_request(request)
+        elif operation == "MIGRATE_KEYS":
+            response = self._handle_migrate_keys_request(request)
+        else:
+            response = {"status": "failure", "message": "Unknown operation", "hops": hops}
 
-            request = pickle.loads(data)  # Deserialize the request
-            operation = request["operation"]
-            hops = request.get("hops", [])
+        return response
 
-            response = None
+    def send_request(self, node_id, request, return_overload=False, max_timeout=None):
+        """
+        Send a request to a node at the address this node's membership knows for it.
+        The timeout is estimated from the node's round-trip times (at most max_timeout seconds,
+        if given), and the request fails fast while the node's circuit is open. If the node does not reply, the membership probes it.
+        If the node sheds the request, it is routed around for a while and None is returned,
+        or the overload response with return_overload=True.
+        """
+        port = self.membership.port(node_id)
+        if port is None:
+            print(f"Node {self.node_id}: No address known for node {node_id}.")
+            return None
+
+        if not self.peer_stats.allow(node_id):
+            print(f"Node {self.node_id}: Circuit to node {node_id} is open. Request not sent.")
+            return None
+
+        request["sender"] = (self.node_id, self.port)
+        operation = request["operation"]
+        start = self.network.scheduler.clock()
+        timeout = self.peer_stats.timeout(node_id, operation)
+        if max_timeout is not None:
+            timeout = min(timeout, max_timeout)
+        response = self.network.transport.send_request(port, request, timeout)
+        if response is None:
+            self.peer_stats.record_failure(node_id)
+            self.membership.record_failure(node_id)
+        elif is_overloaded(response):
+            print(f"Node {self.node_id}: {response['message']}")
+            self.peer_stats.record_overload(node_id)
+            return response if return_overload else None
+        else:
+            self.peer_stats.record_reply(node_id, operation, self.network.scheduler.clock() - start)
+        return response
 
-            # Append the current node to the hops list only in main operations
-            if operation in main_operations:
-                hops.append(self.node_id)
-                print(f"Node {self.node_id}: Handling Request: {request}")
-
-            if operation == "NODE_JOIN":
-                response = self._handle_join_request(request)
-            elif operation == "NODE_LEAVE":
-                response = self._handle_leave_request(request)
-            elif operation == "INSERT_KEY":
-                response = self._handle_insert_key_request(request)
-            elif operation == "UPDATE_KEY":
-                response = self._handle_update_key_request(request)
-            elif operation == "DELETE_KEY":
-                response = self._handle_delete_key_request(request)
-            elif operation == "LOOKUP":
-                response = self._handle_lookup_request(request)
-            elif operation == "UPDATE_PRESENCE":
-                response = self._handle_update_presence_request(request)
-            elif operation == "UPDATE_ROUTING_TABLE_ROW":
-                response = self.update_routing_table_row(request)
-            elif operation == "UPDATE_ROUTING_TABLE_ENTRY":
-                response = self.update_routing_table_entry(request)
-            elif operation == "UPDATE_LEAF_SET":
-                response = self.update_leaf_set(request)
-            elif operation == "REBUILD_NODE_STATE":
-                response = self._rebuild_node_state(request)
-            elif operation == "DISTANCE":
-                distance = topological_distance(self.position, request["node_position"])
-                response = {
-                    "distance": distance,
-                    "neighborhood_set": self.neighborhood_set,
-                    "hops": hops,
-                }
-            elif operation == "GET_LEAF_SET":
-                response = {
-                    "status": "success",
-                    "leaf_set": {"Lmin": self.Lmin, "Lmax": self.Lmax},
-                    "hops": hops,
-                }
-            elif operation == "GET_NEIGHBORHOOD_SET":  # New operation
-                response = self._handle_get_neighborhood_set(request)
-
-                print(response)
-            elif operation == "REQUEST_NEXT_HOP":
-                failed_node_id = request["failed_node_id"]
-                next_hop = self._find_next_hop(failed_node_id)  # Perform find_next_hop
-                response = {"status": "success" if next_hop else "failure", "next_hop": next_hop}
-            elif operation == "GET_POSITION":
-                response = {"status": "success", "position": self.position}
-            elif operation == "GET_KEYS":
-                response = self._handle_get_keys_request(request)
-            else:
-                response = {"status": "failure", "message": "Unknown operation", "hops": hops}
+    def send_transfer(self, node_id, request, on_failure, attempt=0):
+        """
+        Send a request that moves data to a node and return the response of this attempt.
+        A shed request was not processed, so it is sent again OVERLOAD_BACKOFF seconds later,
+        up to OVERLOAD_RETRIES times. The retries run on the network's scheduler, so the calling
+        thread (often a request worker) is not held meanwhile.
+        on_failure(response) is called once the data cannot reach the node: the response is None
+        if the node did not reply, the overload response if it shed every attempt, or the failure
+        response of the node.
+        """
+        response = self.send_request(node_id, request, return_overload=True)
+        if is_overloaded(response) and attempt < OVERLOAD_RETRIES:
+            self.network.scheduler.call_later(
+                OVERLOAD_BACKOFF, self.send_transfer, node_id, request, on_failure, attempt + 1
+            )
+        elif not response or response["status"] != "success":
+            on_failure(response)
+        return response
+
+    def fan_out(self, messages, timeout=FAN_OUT_TIMEOUT):
+        """
+        Send several requests concurrently on the network's fan-out pool.
 
-            # Serialize the response
-            response_data = pickle.dumps(response)
+        Args:
+            messages (list): (node ID, request) pairs. The same node may appear more than once.
+            timeout (float): Seconds each request may take, from when it is submitted. A request
+                that fails, times out, or targets a node that is not in the network gets a None
+                response. A request still waiting for a thread at its deadline is not sent, and
+                one being sent is given only the time left as its timeout, so the pool's threads
+                are not held past the deadline.
 
-            # Send the length of the response first (4 bytes)
-            conn.sendall(struct.pack(">I", len(response_data)))
+        Returns:
+            list: The responses, in the order of the messages.
+        """
+        responses = [None] * len(messages)
+        queue = [
+            (idx, node_id, request)
+            for idx, (node_id, request) in enumerate(messages)
+            if self.membership.is_alive(node_id)
+        ]
+        queue.reverse()  # Pop from the end in message order
+
+        in_flight = {}  # Dictionary. Keys are futures, values are (message index, deadline)
+        while queue or in_flight:
+            # Keep at most FAN_OUT_PARALLELISM requests in flight
+            while queue and len(in_flight) < FAN_OUT_PARALLELISM:
+                idx, node_id, request = queue.pop()
+                deadline = time.monotonic() + timeout
+                future = self.network.fan_out_pool.submit(
+                    self._send_before, node_id, request, deadline
+                )
+                in_flight[future] = (idx, deadline)
 
-            # Send the actual response
-            conn.sendall(response_data)
-        except Exception as e:
-            print(f"Error handling request: {e}")
-        finally:
-            conn.close()
+            next_deadline = min(deadline for _, deadline in in_flight.values())
+            wait(
+                in_flight,
+                timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+
+            now = time.monotonic()
+            for future, (idx, deadline) in list(in_flight.items()):
+                if future.done():
+                    try:
+                        responses[idx] = future.result()
+                    except Exception as e:
+                        print(f"Node {self.node_id}: Request to {messages[idx][0]} failed: {e}")
+                    del in_flight[future]
+                elif deadline <= now:
+                    print(f"Node {self.node_id}: Request to {messages[idx][0]} timed out.")
+                    future.cancel()  # Not sent yet if it still waits for a thread
+                    del in_flight[future]
+
+        return responses
+
+    def _send_before(self, node_id, request, deadline):
+        """
+        Send a request of a fan-out with the time left until its deadline as the timeout.
+        """
+        time_left = deadline - time.monotonic()
+        if time_left <= 0:
+            return None
+        return self.send_request(node_id, request, max_timeout=time_left)
 
-    def send_request(self, port, request):
+    def forward_request(self, next_hop_id, key, request):
         """
-        Send a request to a specified node. If the node is missing, trigger repair.
+        Forward a routed request to the next hop and return its response.
+
+        Operations in HEDGED_OPERATIONS are hedged by the node that started the request: if the
+        next hop has not replied within the hedging delay (or has failed), the request is also
+        sent to a second candidate for the key and the first reply is used. Both copies carry
+        the same request ID. The first one to reach the node that stores the key claims it, and
+        the other copy is cancelled there before any search is done (see _claim_request).
+        The other nodes of the route do not hedge, they only route around a next hop that
+        failed or is busy, so the work is not multiplied at every hop.
+
+        A next hop that sheds the request (or has recently shed one) is routed around through
+        the same second candidate. The shed request was not processed, so any operation may
+        be sent again.
+
+        Keys in the leaf set range are neither hedged nor routed around, the next hop is the node
+        that stores the key and any other candidate would forward the request to it as well.
         """
+        if self._in_leaf_set(key):
+            return self.send_request(next_hop_id, request)
+
+        if self.peer_stats.is_busy(next_hop_id):
+            next_hop_id = self._find_hedge_hop(key, next_hop_id) or next_hop_id
+
+        hedged = request["operation"] in HEDGED_OPERATIONS
+        if not hedged or request.get("origin") != self.node_id:
+            response = self.send_request(next_hop_id, request)
+            # Hedged operations are idempotent, so they may also be sent again after a failure
+            if response is None and (hedged or self.peer_stats.is_busy(next_hop_id)):
+                retry_id = self._find_hedge_hop(key, next_hop_id)
+                if retry_id is not None:
+                    print(f"Node {self.node_id}: Sending the request to node {retry_id} instead...")
+                    response = self.send_request(retry_id, request)
+            return response
+
+        start = time.monotonic()
+        replies = Queue()
+        self._send_async(next_hop_id, request, replies)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(120)  # Timeout to avoid long delays
-                s.connect(("localhost", port))
-
-                # Serialize the request
-                data = pickle.dumps(request)
-
-                # Send the length of the data first (4 bytes)
-                s.sendall(struct.pack(">I", len(data)))
-
-                # Send the actual data
-                s.sendall(data)
-
-                # Receive the response length
-                response_length_data = s.recv(4)
-                if not response_length_data:
-                    return None
-                response_length = struct.unpack(">I", response_length_data)[0]
-
-                # Receive the response data
-                response_data = b""
-                while len(response_data) < response_length:
-                    chunk = s.recv(min(response_length - len(response_data), 1024 * 1024))
-                    if not chunk:
-                        break
-                    response_data += chunk
-
-                return pickle.loads(response_data)
-        except (socket.error, EOFError, pickle.PickleError) as e:
-            print(f"Network: Failed to send request to node at port {port}. Error: {e}")
-            return None  # Return None to indicate failure
+            response = self._usable_reply(replies.get(timeout=self._hedge_delay()))
+            pending = 0
+        except Empty:
+            response = None
+            pending = 1  # The next hop is slow
+
+        if response is None:
+            hedge_id = self._find_hedge_hop(key, next_hop_id)
+            if hedge_id is not None:
+                print(
+                    f"Node {self.node_id}: No reply from {next_hop_id} yet. Hedging {request['operation']} to node {hedge_id}..."
+                )
+                # The hedge gets its own copy, the request may still be in use by the primary
+                self._send_async(hedge_id, copy.deepcopy(request), replies)
+                pending += 1
+
+            # Use the first reply
+            while response is None and pending:
+                response = self._usable_reply(replies.get())
+                pending -= 1
+
+        # Only the latency of the reply that was used is recorded, an abandoned request
+        # to a slow node would otherwise raise the delay of every later request
+        if response is not None:
+            self.forward_latencies.append(time.monotonic() - start)
+        return response
+
+    def _send_async(self, node_id, request, replies):
+        """
+        Send a request on the hedge pool and put the response in the replies queue.
+        When every thread of the pool is busy, the request is sent on the calling thread instead.
+        Waiting for a free thread could deadlock, as the hops of a route hold threads of the
+        same pool while they wait for the next hop.
+        """
+        if not self.network.hedge_slots.acquire(blocking=False):
+            replies.put(self.send_request(node_id, request))
+            return
+
+        def send():
+            try:
+                replies.put(self.send_request(node_id, request))
+            finally:
+                self.network.hedge_slots.release()
+
+        self.network.hedge_pool.submit(send)
+
+    def _usable_reply(self, response):
+        """
+        Return the reply of a hedged request, or None if that copy was cancelled.
+        """
+        if response is not None and response.get("status") == "cancelled":
+            return None
+        return response
+
+    def _claim_request(self, request):
+        """
+        Claim a hedged request before the expensive work of its handler. Returns False if
+        another copy of the request has been claimed already, this copy must then stop.
+        Requests without an ID are not hedged and are always claimed.
+        """
+        request_id = request.get("request_id")
+        if request_id is None:
+            return True
+        with self.claim_lock:
+            if request_id in self.claimed_requests:
+                return False
+            self.claimed_requests[request_id] = True
+            if len(self.claimed_requests) > HEDGE_CLAIMED_REQUESTS:
+                self.claimed_requests.popitem(last=False)
+        return True
+
+    def _hedge_delay(self):
+        """
+        Seconds to wait for the next hop before hedging a request.
+        """
+        latencies = list(self.forward_latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        return max(float(np.percentile(latencies, HEDGE_PERCENTILE)), HEDGE_MIN_DELAY)
 
     def repair_node_failure(self, failed_node_id):
         """
@@ -382,7 +629,7 @@ class PastryNode:
             "failed_node_id": failed_node_id,
             "hops": [],  # Initialize hops tracking
         }
-        response = self.send_request(self.network.node_ports[closest_node_id], repair_request)
+        response = self.send_request(closest_node_id, repair_request)
 
         # Ensure a structured response is always returned
         if response is None:
@@ -401,6 +648,8 @@ class PastryNode:
             return {
                 "status": "success",
                 "neighborhood_set": self.neighborhood_set,
+                "positions": self._known_positions(self.neighborhood_set),
+                "ports": self.membership.known_ports(self.neighborhood_set),
             }
         except Exception as e:
             print(f"Node {self.node_id}: Error responding to GET_NEIGHBORHOOD_SET request: {e}")
@@ -409,6 +658,30 @@ class PastryNode:
                 "message": f"Error: {e}",
             }
 
+    def schedule_repair(self, failed_node_id):
+        """
+        Queue the repair of the state that refers to a failed node as a background task.
+        A node that is already queued, or that this node does not refer to, is not queued.
+        """
+        if failed_node_id not in self._referenced_nodes():
+            return
+        with self.repair_lock:
+            if failed_node_id in self.pending_repairs:
+                return
+            self.pending_repairs.add(failed_node_id)
+        print(f"Node {self.node_id}: Scheduling the repair of failed node {failed_node_id}.")
+        self.network.scheduler.call_later(0, self._repair_failed_node, failed_node_id)
+
+    def _repair_failed_node(self, failed_node_id):
+        try:
+            if self.running:
+                self._repair_routing_table_entry(failed_node_id)
+                self._repair_leaf_set(failed_node_id)
+                self._repair_neighborhood_set(failed_node_id)
+        finally:
+            with self.repair_lock:
+                self.pending_repairs.discard(failed_node_id)
+
     def _repair_routing_table_entry(self, failed_node_id):
         """
         Repair a missing routing table entry for a failed node.
@@ -417,94 +690,27 @@ class PastryNode:
         print(
             f"Node {self.node_id}: Repairing routing table entry for failed node {failed_node_id}."
         )
-        repair_hops = []  # Track hops specific to the repair process
-
-        row_idx = common_prefix_length(self.node_id, failed_node_id)
-        col_idx = int(failed_node_id[row_idx], 16)
+        row_idx = self.network.common_prefix_length(self.node_id, failed_node_id)
+        col_idx = self.network.digit(failed_node_id, row_idx)
 
         # Step 1: Remove failed entry
-        self.routing_table[row_idx][col_idx] = None
+        self.routing_table.set(row_idx, col_idx, None)
 
-        # Step 2: Try to get a replacement from another node in the same row
-        for entry in self.routing_table[row_idx]:
-            if entry and entry != failed_node_id:
-                try:
-                    request = {
-                        "operation": "GET_ROUTING_TABLE_ENTRY",
-                        "row_idx": row_idx,
-                        "col_idx": col_idx,
-                    }
-                    response = self.send_request(self.network.node_ports[entry], request)
-                    if response["status"] == "success" and response.get("entry"):
-                        replacement = response["entry"]
-
-                        if (
-                            replacement != failed_node_id
-                            and common_prefix_length(self.node_id, replacement) == row_idx
-                        ):
-                            self.routing_table[row_idx][col_idx] = replacement
-                            repair_hops.append(entry)  # Add hop to repair_hops
-                            print(
-                                f"Node {self.node_id}: Repaired routing table entry {failed_node_id} using {replacement}."
-                            )
-                            print(f"Repair Hops: {repair_hops}")  # Log repair hops
-                            return replacement
-                except Exception as e:
-                    print(
-                        f"Node {self.node_id}: Error contacting {entry} for routing table repair: {e}"
-                    )
-
-        # Step 3: Attempt progressive repair using _find_next_hop
-        visited_nodes = set()
-        next_hop_id = self._find_next_hop(failed_node_id)
-
-        while next_hop_id and next_hop_id not in visited_nodes:
-            visited_nodes.add(next_hop_id)
-            repair_hops.append(next_hop_id)  # Track repair hops
-            print(f"Node {self.node_id}: Requesting {next_hop_id} to perform _find_next_hop.")
-
-            try:
-                repair_request = {"operation": "REQUEST_NEXT_HOP", "failed_node_id": failed_node_id}
-                response = self.send_request(self.network.node_ports[next_hop_id], repair_request)
-
-                if response["status"] == "success" and response.get("next_hop"):
-                    replacement = response["next_hop"]
-
-                if replacement != failed_node_id:
-                    replacement_prefix_length = common_prefix_length(self.node_id, replacement)
-
-                    if replacement_prefix_length == row_idx:  # Ensure prefix length matches row
-                        if row_idx == 0:  # If first digit (row 0), match based on column directly
-                            if int(replacement[0], 16) == col_idx:
-                                self.routing_table[row_idx][col_idx] = replacement
-                                print(
-                                    f"Node {self.node_id}: Successfully repaired routing table with {replacement}."
-                                )
-                                print(f"Repair Hops: {repair_hops}")  # Log repair hops
-                                return replacement
-                        else:  # For deeper rows, ensure the replacement's next hex digit matches column
-                            if int(replacement[row_idx], 16) == col_idx:
-                                self.routing_table[row_idx][col_idx] = replacement
-                                print(
-                                    f"Node {self.node_id}: Successfully repaired routing table with {replacement}."
-                                )
-                                print(f"Repair Hops: {repair_hops}")  # Log repair hops
-                                return replacement
-
-                # Continue searching if no valid replacement is found
-                next_hop_id = response.get("next_hop", None)
-
-            except Exception as e:
-                print(
-                    f"Node {self.node_id}: Failed to request routing repair from {next_hop_id}: {e}"
-                )
-                next_hop_id = None  # Break out of the loop on failure
+        # Step 2: Look up a node with this node's prefix up to the row and the column's digit
+        replacement = self.membership.index.first_with_prefix(self.node_id, row_idx, col_idx)
+        if replacement is None or replacement == failed_node_id:
+            # Step 3: If no such node exists, leave the entry as None
+            print(
+                f"Node {self.node_id}: Could not find a suitable replacement for {failed_node_id}."
+            )
+            return None
 
-        # Step 4: If no replacement is found, leave the entry as None
-        print(f"Node {self.node_id}: Could not find a suitable replacement for {failed_node_id}.")
-        print(f"Repair Hops: {repair_hops}")  # Log repair hops
-        self.routing_table[row_idx][col_idx] = None  # Explicitly set to None
-        return None
+        self.routing_table.set(row_idx, col_idx, replacement)
+        self._announce_references({replacement}, max_timeout=MAINTENANCE_TIMEOUT)
+        print(
+            f"Node {self.node_id}: Repaired routing table entry {failed_node_id} using {replacement}."
+        )
+        return replacement
 
     def _repair_neighborhood_set(self, failed_node_id):
         """
@@ -550,29 +756,35 @@ class PastryNode:
 
                     # Get neighborhood set
                     neighbor_response = self.send_request(
-                        self.network.node_ports[current_node], neighbor_request
+                        current_node, neighbor_request, max_timeout=MAINTENANCE_TIMEOUT
                     )
                     if neighbor_response["status"] == "success":
+                        self.membership.learn(neighbor_response["ports"])
                         neighbors = neighbor_response["neighborhood_set"]
                         nodes_to_visit.extend(neighbors)  # Expand search through neighbors
 
                     # Get leaf set
                     leafset_response = self.send_request(
-                        self.network.node_ports[current_node], leafset_request
+                        current_node, leafset_request, max_timeout=MAINTENANCE_TIMEOUT
                     )
                     if leafset_response["status"] == "success":
+                        self.membership.learn(leafset_response["ports"])
                         leaf_nodes = (
                             leafset_response["leaf_set"]["Lmin"]
                             + leafset_response["leaf_set"]["Lmax"]
                         )
                         nodes_to_visit.extend(leaf_nodes)
 
-                    # Get position of the current node
-                    position_response = self.send_request(
-                        self.network.node_ports[current_node], position_request
-                    )
-                    if position_response["status"] == "success":
-                        all_candidates[current_node] = position_response["position"]
+                    # Get position of the current node, unless it is already cached
+                    if current_node in self.peer_positions:
+                        all_candidates[current_node] = self.peer_positions[current_node]
+                    else:
+                        position_response = self.send_request(
+                            current_node, position_request, max_timeout=MAINTENANCE_TIMEOUT
+                        )
+                        if position_response["status"] == "success":
+                            all_candidates[current_node] = position_response["position"]
+                            self.peer_positions[current_node] = position_response["position"]
 
                 except Exception as e:
                     print(
@@ -613,21 +825,10 @@ class PastryNode:
             )
             return None  # Gracefully handle invalid input
 
-        min_distance = float("inf")
-        closest_node_id = None
-
-        # Iterate through all known nodes
-        for node_id in self.network.node_ports.keys():  # Replace with actual available nodes logic
-            if node_id == failed_node_id:
-                continue  # Skip the failed node
-
-            try:
-                distance = abs(int(node_id, 16) - int(failed_node_id, 16))
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_node_id = node_id
-            except ValueError as e:
-                print(f"Node {self.node_id}: Failed to compute distance for node_id {node_id}: {e}")
+        # The node sharing the longest prefix with the failed node, numerically closest among them
+        closest_node_id = self.membership.index.longest_prefix_match(
+            failed_node_id, exclude=(failed_node_id,)
+        )
 
         if closest_node_id:
             print(
@@ -646,72 +847,48 @@ class PastryNode:
         new_node_id = request["joining_node_id"]
         hops = request.get("hops", [])
 
+        # Learn the new node's address and disseminate its arrival
+        self.membership.add(new_node_id, request["joining_node_port"], gossip=True)
+
         # Special Case: If the closest node has a common prefix with the new node,
-        # update the new nodes routing table up to the common prefix row
+        # contribute the routing table rows up to the common prefix row
         if "common_prefix_len" in request and request["common_prefix_len"] > 0:
-            i = request["common_prefix_len"]
-            for row in range(i + 1):
-                update_R_request = {
-                    "operation": "UPDATE_ROUTING_TABLE_ROW",
-                    "row_idx": row,
-                    "received_row": self.routing_table[row],
-                    "hops": hops,  # Include the updated hops list
-                }
-                print(
-                    f"Node {self.node_id}: Updating the new node's Routing Table Row {row} with node's {self.node_id} row {row}..."
-                )
-                self.send_request(self.network.node_ports[new_node_id], update_R_request)
-
+            rows = range(request["common_prefix_len"] + 1)
         else:
             # General case: The closest nodes doesn't have a common prefix with the new
             # and every node in the routing process provides its routing table row at the common prefix
-
-            # Determine the routing table row to update
-            i = common_prefix_length(self.node_id, new_node_id)
-
-            # Update the new node's Routing Table row
-            update_R_request = {
-                "operation": "UPDATE_ROUTING_TABLE_ROW",
-                "row_idx": i,
-                "received_row": self.routing_table[i],
-                "hops": hops,  # Include the updated hops list
-            }
+            rows = [self.network.common_prefix_length(self.node_id, new_node_id)]
+
+        # Append the rows to the join message, the new node installs them from the final reply
+        routing_rows = request.setdefault("routing_rows", [])
+        positions = request.setdefault("positions", {})
+        ports = request.setdefault("ports", {})
+        for row_idx in rows:
+            row = self.routing_table.row(row_idx)
             print(
-                f"Node {self.node_id}: Updating the new node's Routing Table Row {i} with node's {self.node_id} row {i}..."
+                f"Node {self.node_id}: Adding routing table row {row_idx} to the join message of {new_node_id}..."
             )
-            self.send_request(self.network.node_ports[new_node_id], update_R_request)
+            routing_rows.append((row_idx, row))
+            positions.update(self._known_positions(row))
+            ports.update(self.membership.known_ports(row))
 
-        next_hop_id = self._find_next_hop(new_node_id)
+        next_hop_id = self._find_live_next_hop(new_node_id)
 
         if next_hop_id == self.node_id:
-            # If the next hop is the current node, update the new node's Leaf Set
+            # If the next hop is the current node, reply with the collected state and the leaf set
             print(
-                f"Node {self.node_id}: This node is the numerically closest node to the new node.\nUpdating the new node's Leaf Set..."
+                f"Node {self.node_id}: This node is the numerically closest node to the new node.\nReplying with the new node's initial state..."
             )
-            update_L_request = {
-                "operation": "UPDATE_LEAF_SET",
-                "Lmin": self.Lmin,
-                "Lmax": self.Lmax,
-                "key": self.node_id,
-                "hops": hops,  # Include the updated hops list
-            }
-            self.send_request(self.network.node_ports[new_node_id], update_L_request)
-
+            ports.update(self.membership.known_ports(self.Lmin + self.Lmax))
             return {
                 "status": "success",
+                "routing_rows": routing_rows,
+                "positions": positions,
+                "ports": ports,
+                "leaf_set": {"Lmin": self.Lmin, "Lmax": self.Lmax, "key": self.node_id},
                 "hops": hops,  # Include the final hops list in the response
             }
 
-        # Check if the next hop node is alive before forwarding
-        if next_hop_id not in self.network.node_ports:
-            print(
-                f"Node {self.node_id}: Detected failure of node {next_hop_id}. Repairing before forwarding..."
-            )
-            self._repair_routing_table_entry(next_hop_id)
-            self._repair_leaf_set(next_hop_id)
-            self._repair_neighborhood_set(next_hop_id)
-            next_hop_id = self._find_next_hop(new_node_id)  # Retry with repaired network
-
         if not next_hop_id:
             print(f"Node {self.node_id}: No available nodes to forward JOIN_NETWORK request.")
             return {
@@ -723,7 +900,7 @@ class PastryNode:
         if "common_prefix_len" in request:
             del request["common_prefix_len"]
         print(f"\nNode: {self.node_id} Forwarding JOIN_NETWORK request to node {next_hop_id}...")
-        response = self.send_request(self.network.node_ports[next_hop_id], request)
+        response = self.forward_request(next_hop_id, new_node_id, request)
         return response
 
     def _handle_insert_key_request(self, request):
@@ -734,23 +911,11 @@ class PastryNode:
         key = request["key"]
         hops = request.get("hops", [])
 
-        next_hop_id = self._find_next_hop(key)
-        # print(f"Node {self.node_id}: Next hop for key {key} is {next_hop_id}")
-
-        # Detect if the next hop is missing
-        if next_hop_id and next_hop_id not in self.network.node_ports:
-            print(f"Node {self.node_id}: Detected failed node {next_hop_id}. Initiating repair...")
-
-            # Repair routing table before proceeding
-            self._repair_routing_table_entry(next_hop_id)
-            self._repair_leaf_set(next_hop_id)
-            self._repair_neighborhood_set(next_hop_id)
-
-            # After repair, find a new next hop
-            next_hop_id = self._find_next_hop(key)
+        # Route around a failed next hop, its repair runs in the background
+        next_hop_id = self._find_live_next_hop(key)
 
         # If this node is responsible for storing the key, insert it
-        if self._in_leaf_set(key) or next_hop_id == self.node_id:
+        if next_hop_id == self.node_id:
             with self.lock:
                 if not self.kd_tree:
                     """print(
@@ -759,14 +924,19 @@ class PastryNode:
                     self.kd_tree = KDTree(
                         points=np.array([request["point"]]),
                         reviews=np.array([request["review"]]),
-                        country_keys=np.array([hash_key(request["country"])]),
+                        country_keys=np.array([self.network.hash_key(request["country"])]),
                         countries=np.array([request["country"]]),
                     )
                 else:
 
-                    self.kd_tree.add_point(request["point"], request["review"], request["country"])
+                    self.kd_tree.add_point(
+                        request["point"],
+                        request["review"],
+                        request["country"],
+                        self.network.hash_key(request["country"]),
+                    )
                     print(
-                        f"\nNode {self.node_id}: Inserted {key} into KDTree. Points now: {self.kd_tree.points.shape}"
+                        f"\nNode {self.node_id}: Inserted {key} into KDTree. Points now: {self.kd_tree.size}"
                     )
 
             """print(f"\nInserted Key: {key}")
@@ -785,13 +955,15 @@ class PastryNode:
         # Step 3: If forwarding, inform upstream node about the missing entry
         if next_hop_id:
             request["hops"] = hops
-            response = self.send_request(self.network.node_ports[next_hop_id], request)
+            response = self.forward_request(next_hop_id, key, request)
 
             # If the downstream node finds a replacement, update the routing table
             if response and response.get("replacement"):
-                self.routing_table[common_prefix_length(self.node_id, next_hop_id)][
-                    int(next_hop_id[0], 16)
-                ] = response["replacement"]
+                self.routing_table.set(
+                    self.network.common_prefix_length(self.node_id, next_hop_id),
+                    self.network.digit(next_hop_id, 0),
+                    response["replacement"],
+                )
                 print(
                     f"Node {self.node_id}: Updated routing table with replacement from {next_hop_id}."
                 )
@@ -805,29 +977,18 @@ class PastryNode:
         key = request["key"]
         hops = request.get("hops", [])  # Retrieve the current hops list
 
-        next_hop_id = self._find_next_hop(key)
-        # print(f"next hop is: {next_hop_id}")
-        # Step 1: Detect if the next hop is missing
-        if next_hop_id and next_hop_id not in self.network.node_ports:
-            print(f"Node {self.node_id}: Detected failed node {next_hop_id}. Initiating repair...")
-
-            # Repair routing table before proceeding
-            self._repair_routing_table_entry(next_hop_id)
-            self._repair_leaf_set(next_hop_id)
-            self._repair_neighborhood_set(next_hop_id)
-
-            # After repair, find a new next hop
-            next_hop_id = self._find_next_hop(key)
+        # Route around a failed next hop, its repair runs in the background
+        next_hop_id = self._find_live_next_hop(key)
 
         # If the key belongs to this node (based on leaf set), delete it from the KDTree
-        if self._in_leaf_set(key) or next_hop_id == self.node_id:
+        if next_hop_id == self.node_id:
             with self.lock:
                 if not self.kd_tree:
                     print(f"\nNode {self.node_id}: No data for key {key}.")
                     return {"status": "failure", "message": f"No data for key {key}.", "hops": hops}
 
                 # Delete the key from the KDTree if it exists
-                if key in self.kd_tree.country_keys:
+                if key in self.kd_tree:
                     print(f"\nNode {self.node_id}: Deleting key {key}...")
                     self.kd_tree.delete_points(key)
                 else:
@@ -843,7 +1004,7 @@ class PastryNode:
 
         # Otherwise, forward the request to the next node
         print(f"Node: {self.node_id} Forwarding DELETE_KEY Request: {hops}")
-        response = self.send_request(self.network.node_ports[next_hop_id], request)
+        response = self.forward_request(next_hop_id, key, request)
 
         # Ensure the hops list is returned in the response
         return response
@@ -860,38 +1021,34 @@ class PastryNode:
 
             hops = request.get("hops", [])  # Retrieve the current hops list
 
-            next_hop_id = self._find_next_hop(key)
+            # Route around a failed next hop, its repair runs in the background
+            next_hop_id = self._find_live_next_hop(key)
 
-            # Step 1: Detect if the next hop is missing
-            if next_hop_id and next_hop_id not in self.network.node_ports:
-                print(
-                    f"Node {self.node_id}: Detected failed node {next_hop_id}. Initiating repair..."
-                )
+            # If this key is found in the leaf set or the next hop is the current node, the lookup is successful
+            if next_hop_id == self.node_id:
+                print(f"\nNode {self.node_id}: Lookup Key {key} Found.")
+                if not self._claim_request(request):
+                    print(f"Node {self.node_id}: Another copy of this LOOKUP is served. Cancelled.")
+                    return {
+                        "status": "cancelled",
+                        "message": f"Another copy of the request is served by {self.node_id}.",
+                        "hops": hops,
+                    }
 
-                # Repair routing table before proceeding
-                self._repair_routing_table_entry(next_hop_id)
-                self._repair_leaf_set(next_hop_id)
-                self._repair_neighborhood_set(next_hop_id)
+                # Read the current version of the KD-Tree, without waiting for writers
+                snapshot = self.kd_tree.snapshot() if self.kd_tree else None
 
-                # After repair, find a new next hop
-                next_hop_id = self._find_next_hop(key)
+                # Check that the kd tree exists and contains data
+                if not snapshot or not snapshot.size:
+                    print(f"Node {self.node_id}: No data for key {key}.")
+                    return {
+                        "status": "failure",
+                        "message": f"No data for key {key}.",
+                        "hops": hops,
+                    }
 
-            # If this key is found in the leaf set or the next hop is the current node, the lookup is successful
-            if self._in_leaf_set(key) or next_hop_id == self.node_id:
-                print(f"\nNode {self.node_id}: Lookup Key {key} Found.")
-                with self.lock:
-                    # Check that the kd tree exists and contains data
-                    if not self.kd_tree or not self.kd_tree.points.size:
-                        print(f"Node {self.node_id}: No data for key {key}.")
-                        return {
-                            "status": "failure",
-                            "message": f"No data for key {key}.",
-                            "hops": hops,
-                        }
-
-                    # KD-Tree Range Search
-                    # print(f"Stored points: {self.kd_tree.points}")
-                    points, reviews = self.kd_tree.search(key, lower_bounds, upper_bounds)
+                # KD-Tree Range Search
+                points, reviews = snapshot.search(key, lower_bounds, upper_bounds)
                 print(f"Node {self.node_id}: Found {len(points)} matching points.")
 
                 if len(reviews) == 0:
@@ -939,7 +1096,7 @@ class PastryNode:
 
             # Forward the request to the next node
             print(f"Node: {self.node_id} Forwarding LOOKUP Request: {hops}")
-            response = self.send_request(self.network.node_ports[next_hop_id], request)
+            response = self.forward_request(next_hop_id, key, request)
 
             # Ensure the hops list is returned in the response
             return response  # The `hops` list will already be included in the forwarded response.
@@ -957,25 +1114,14 @@ class PastryNode:
         update_fields = request["data"]  # Update fields for the KDTree
         hops = request.get("hops", [])
 
-        next_hop_id = self._find_next_hop(key)
-
-        # Step 1: Detect if the next hop is missing
-        if next_hop_id and next_hop_id not in self.network.node_ports:
-            print(f"Node {self.node_id}: Detected failed node {next_hop_id}. Initiating repair...")
-
-            # Repair routing table before proceeding
-            self._repair_routing_table_entry(next_hop_id)
-            self._repair_leaf_set(next_hop_id)
-            self._repair_neighborhood_set(next_hop_id)
-
-            # After repair, find a new next hop
-            next_hop_id = self._find_next_hop(key)
+        # Route around a failed next hop, its repair runs in the background
+        next_hop_id = self._find_live_next_hop(key)
 
         # If this node is responsible for the key
-        if self._in_leaf_set(key) or next_hop_id == self.node_id:
+        if next_hop_id == self.node_id:
             with self.lock:
                 # Check if the key exists in this node's data structure
-                if self.kd_tree and key in self.kd_tree.country_keys:
+                if self.kd_tree and key in self.kd_tree:
                     # Update the data in the KDTree
                     self.kd_tree.update_points(
                         country_key=key,
@@ -994,7 +1140,7 @@ class PastryNode:
 
         # Forward the request to the next hop
         print(f"Node: {self.node_id} Forwarding UPDATE_KEY Request: {hops}")
-        response = self.send_request(self.network.node_ports[next_hop_id], request)
+        response = self.forward_request(next_hop_id, key, request)
 
         # Ensure the hops list is returned in the response
         return response
@@ -1017,6 +1163,7 @@ class PastryNode:
             self.Lmin = [node for node in self.Lmin if node != failed_node_id]
         if was_in_lmax:
             self.Lmax = [node for node in self.Lmax if node != failed_node_id]
+        self._index_leaf_set()
 
         # Step 2: If the node was not in either set, no further action is needed
         if not was_in_lmin and not was_in_lmax:
@@ -1025,87 +1172,95 @@ class PastryNode:
             )
             return
 
-        # Step 3: Query all nodes in the current leaf set (Lmin or Lmax) for their leaf sets
-        all_candidates = []
-        leaf_set_to_query = self.Lmin + self.Lmax  # Query both Lmin and Lmax
-
-        for node in leaf_set_to_query:
-            if node and node != failed_node_id:  # Exclude failed node
-                try:
-                    request = {"operation": "GET_LEAF_SET"}
-                    response = self.send_request(self.network.node_ports[node], request)
-                    if response["status"] == "success":
-                        all_candidates.extend(response["leaf_set"]["Lmin"])
-                        all_candidates.extend(response["leaf_set"]["Lmax"])
-                except Exception as e:
-                    print(f"Node {self.node_id}: Error querying {node} for leaf set: {e}")
-
-        # Step 4: Add current leaf set to the candidates and exclude duplicates, self, and failed node
-        all_candidates.extend(leaf_set_to_query)  # Include existing leaf set
-        all_candidates = list(set(all_candidates))  # Remove duplicates
-        all_candidates = [
-            node
-            for node in all_candidates
-            if node and node != self.node_id and node != failed_node_id
-        ]  # Exclude self and failed node
-
-        # Sort candidates by numerical distance to the current node ID
-        all_candidates.sort(key=lambda n: abs(int(n, 16) - int(self.node_id, 16)))
-
-        # Step 5: Rebuild the relevant set (Lmin or Lmax)
+        # Step 3: Rebuild the relevant set (Lmin or Lmax) from the nearest nodes in the network
+        referenced_before = self._referenced_nodes()
         if was_in_lmin:
-            self.Lmin = [node for node in all_candidates if node < self.node_id][: L // 2]
-            self.Lmin += [None] * (L // 2 - len(self.Lmin))  # Pad with None if not enough nodes
+            self.Lmin = self._find_closest_lower_nodes()
             print(f"Node {self.node_id}: Rebuilt Lmin: {self.Lmin}")
         if was_in_lmax:
-            self.Lmax = [node for node in all_candidates if node > self.node_id][: L // 2]
-            self.Lmax += [None] * (L // 2 - len(self.Lmax))  # Pad with None if not enough nodes
+            self.Lmax = self._find_closest_higher_nodes()
             print(f"Node {self.node_id}: Rebuilt Lmax: {self.Lmax}")
+        self._index_leaf_set()
+        self._announce_references(self._referenced_nodes() - referenced_before)
 
         print(f"Node {self.node_id}: Updated Leaf Set - Lmin: {self.Lmin}, Lmax: {self.Lmax}")
 
     def _handle_leave_request(self, request):
         """
         Handle a NODE_LEAVE operation to process the departure of a node.
+        The leaving node sends its leaf set, neighborhood set and their positions along as
+        replacement candidates for the entries that referred to it.
         """
         leaving_node_id = request["leaving_node_id"]
-        available_nodes = request.get("available_nodes", [])
-        node_positions = request.get("node_positions", {})
+        replacements = request.get("replacements", {})
         hops = request.get("hops", [])  # Retrieve the current hops list
 
         print(f"Node {self.node_id}: Handling NODE_LEAVE for {leaving_node_id}.")
 
-        # Remove the leaving node from local data structures
-        with self.lock:
-            self.Lmin = [node for node in self.Lmin if node != leaving_node_id]
-            self.Lmax = [node for node in self.Lmax if node != leaving_node_id]
-            self.neighborhood_set = [
-                node for node in self.neighborhood_set if node != leaving_node_id
-            ]
-
-        # Prepare rebuild request
-        rebuild_request = {
-            "operation": "REBUILD_NODE_STATE",
-            "Lmin": self.Lmin,
-            "Lmax": self.Lmax,
-            "routing_table": self.routing_table,
-            "neighborhood_set": self.neighborhood_set,
-            "leaving_node_id": leaving_node_id,
-            "available_nodes": available_nodes,
-            "node_positions": node_positions,
-            "hops": hops,  # Include the updated hops list
-        }
+        self.referrers.discard(leaving_node_id)
+        self.membership.remove(leaving_node_id)
+        self.membership.learn(replacements.get("ports", {}))
+        referenced_before = self._referenced_nodes()
+        self.peer_positions.update(replacements.get("positions", {}))
+        self.peer_positions.pop(leaving_node_id, None)
+
+        # Replacement candidates that are still in the network
+        candidates = [
+            node_id
+            for node_id in set(
+                self.Lmin
+                + self.Lmax
+                + self.neighborhood_set
+                + replacements.get("Lmin", [])
+                + replacements.get("Lmax", [])
+                + replacements.get("neighborhood_set", [])
+            )
+            if node_id is not None
+            and node_id not in (self.node_id, leaving_node_id)
+            and self.membership.is_alive(node_id)
+        ]
 
-        # Notify affected nodes
-        affected_nodes = set(self.Lmin + self.Lmax + self.neighborhood_set)
+        with self.lock:
+            # Rebuild the leaf set from its remaining nodes and the leaving node's leaf set
+            if leaving_node_id in self.Lmin or leaving_node_id in self.Lmax:
+                self.Lmin = self._find_closest_lower_nodes()
+                self.Lmax = self._find_closest_higher_nodes()
+                self._index_leaf_set()
+                print(f"Node {self.node_id}: Lmin: {self.Lmin}, Lmax: {self.Lmax}")
+
+            # Rebuild the neighborhood set from the candidates with known positions
+            if leaving_node_id in self.neighborhood_set:
+                node_positions = {self.node_id: self.position}
+                for node_id in candidates:
+                    if node_id in self.peer_positions:
+                        node_positions[node_id] = self.peer_positions[node_id]
+                self.neighborhood_set = self._update_closest_neighbors(
+                    [node_id for node_id in candidates if node_id in node_positions],
+                    node_positions,
+                )
+                print(f"Node {self.node_id}: Updated neighborhood_set: {self.neighborhood_set}")
 
-        # Ensure the affected nodes are still in the network
-        affected_nodes = [node for node in affected_nodes if node in available_nodes]
+        # Remove entries for the leaving node and fill them with the closest matching candidate
+        cleared_positions = self.routing_table.remove(leaving_node_id)
+        for row_idx, col_idx in cleared_positions:
+            for node_id in candidates:
+                if (
+                    self.network.common_prefix_length(self.node_id, node_id) == row_idx
+                    and self.network.digit(node_id, row_idx) == col_idx
+                ):
+                    self._consider_routing_entry(row_idx, col_idx, node_id)
+            if self.routing_table.get(row_idx, col_idx) is None:
+                replacement = self.membership.index.first_with_prefix(
+                    self.node_id, row_idx, col_idx
+                )
+                if replacement is not None and replacement != leaving_node_id:
+                    self.routing_table.set(row_idx, col_idx, replacement)
+            print(
+                f"Node {self.node_id}: Replaced entry at Row {row_idx}, Column {col_idx} with {self.routing_table.get(row_idx, col_idx)}."
+            )
 
-        for neighbor_id in affected_nodes:
-            if neighbor_id and neighbor_id != self.node_id:
-                print(f"Node {self.node_id}: Sending REBUILD_NODE_STATE to {neighbor_id}.")
-                self.send_request(self.network.node_ports[neighbor_id], rebuild_request)
+        # Tell the nodes that replaced the leaving node that this node now refers to them
+        self._announce_references(self._referenced_nodes() - referenced_before)
 
         print(f"Node {self.node_id}: Finished processing NODE_LEAVE for {leaving_node_id}.")
         return {
@@ -1114,116 +1269,25 @@ class PastryNode:
             "hops": hops,
         }
 
-    def _rebuild_node_state(self, request):
+    def _find_closest_lower_nodes(self):
         """
-        Rebuild the Lmin, Lmax, neighborhood_set, and routing_table of this node.
+        Find the closest numerically lower nodes in the network to populate Lmin.
         """
-        print(f"Node {self.node_id}: Rebuilding state.")
-
-        # Get available nodes and their positions from the request
-        available_nodes = request.get("available_nodes", [])
-        node_positions = request.get("node_positions", {})
-        leaving_node_id = request.get("leaving_node_id", None)
-
-        if not available_nodes or not node_positions:
-            print(f"Node {self.node_id}: Missing available nodes or positions in the request.")
-            return {"status": "failure", "message": "Missing available nodes or positions."}
-
-        # Remove the leaving node from the available nodes
-        if leaving_node_id in available_nodes:
-            available_nodes.remove(leaving_node_id)
-
-        print(
-            f"Node {self.node_id}: Available nodes after removing {leaving_node_id}: {available_nodes}"
-        )
-
-        # Rebuild Lmin and Lmax
-        self.Lmin = self._find_closest_lower_nodes(available_nodes)
-        self.Lmax = self._find_closest_higher_nodes(available_nodes)
-        print(f"Node {self.node_id}: Lmin: {self.Lmin}, Lmax: {self.Lmax}")
-
-        # Rebuild neighborhood_set
-        self.neighborhood_set = self._update_closest_neighbors(available_nodes, node_positions)
-        print(f"Node {self.node_id}: Updated neighborhood_set: {self.neighborhood_set}")
-
-        # Remove entries for the leaving node and track cleared positions
-        cleared_positions = []
-        for row_idx, row in enumerate(self.routing_table):
-            for col_idx, entry in enumerate(row):
-                if entry == leaving_node_id:
-                    self.routing_table[row_idx][col_idx] = None
-                    cleared_positions.append((row_idx, col_idx))
-
-        print(
-            f"Node {self.node_id}: Cleared routing table entries for {leaving_node_id}. Cleared positions: {cleared_positions}"
-        )
-
-        # Attempt to replace cleared positions
-        for row_idx, col_idx in cleared_positions:
-            for node_id in available_nodes:
-                # Check if the node_id matches the prefix required for this position
-                if common_prefix_length(self.node_id, node_id) == row_idx:
-                    try:
-                        # Verify the column matches the expected digit
-                        if int(node_id[row_idx], 16) == col_idx:
-                            self.routing_table[row_idx][col_idx] = node_id
-                            print(
-                                f"Node {self.node_id}: Replaced entry at Row {row_idx}, Column {col_idx} with {node_id}."
-                            )
-                            break  # Stop looking once a replacement is found
-                    except (IndexError, ValueError) as e:
-                        print(
-                            f"Node {self.node_id}: Skipping invalid node_id {node_id} due to error: {e}"
-                        )
-
-        print(f"Node {self.node_id}: Updated routing table: {self.routing_table}")
-        return {"status": "success", "message": "Rebuilt node state successfully."}
-
-    def _find_closest_lower_nodes(self, available_nodes):
-        """
-        Find the closest numerically lower nodes to populate Lmin.
-        """
-        print(f"\nNode {self.node_id}: Finding closest numerically lower nodes.")
-        print(f"Available nodes: {available_nodes}")
-
-        # Filter nodes that are numerically lower than the current node
-        lower_nodes = [n for n in available_nodes if int(n, 16) < int(self.node_id, 16)]
-
-        # Compute distances for debugging
-        distances = {n: int(self.node_id, 16) - int(n, 16) for n in lower_nodes}
-
-        # Sort nodes by distance
-        lower_nodes.sort(key=lambda n: distances[n])
-
-        # Ensure Lmin has exactly L // 2 nodes (fill with None if not enough nodes)
         lmin_size = L // 2
-        result = lower_nodes[:lmin_size] + [None] * (lmin_size - len(lower_nodes))
+        lower_nodes = self.membership.index.lower(self.node_id, lmin_size)
 
-        print(f"Node {self.node_id}: Closest numerically lower nodes: {result}")
-        return result
+        # Ensure Lmin has exactly L // 2 nodes (fill with None if not enough nodes)
+        return lower_nodes + [None] * (lmin_size - len(lower_nodes))
 
-    def _find_closest_higher_nodes(self, available_nodes):
+    def _find_closest_higher_nodes(self):
         """
-        Find the closest numerically higher nodes to populate Lmax.
+        Find the closest numerically higher nodes in the network to populate Lmax.
         """
-        print(f"\nNode {self.node_id}: Finding closest numerically higher nodes.")
-        print(f"Available nodes: {available_nodes}")
-
-        # Filter nodes that are numerically higher than the current node
-        higher_nodes = [n for n in available_nodes if int(n, 16) > int(self.node_id, 16)]
-
-        # Compute distances for debugging
-        distances = {n: int(n, 16) - int(self.node_id, 16) for n in higher_nodes}
-
-        # Sort nodes by distance
-        higher_nodes.sort(key=lambda n: distances[n])
-
-        # Ensure Lmax has exactly L // 2 nodes (fill with None if not enough nodes)
         lmax_size = L // 2
-        result = higher_nodes[:lmax_size] + [None] * (lmax_size - len(higher_nodes))
+        higher_nodes = self.membership.index.higher(self.node_id, lmax_size)
 
-        print(f"Node {self.node_id}: Closest numerically higher nodes: {result}")
-        return result
+        # Ensure Lmax has exactly L // 2 nodes (fill with None if not enough nodes)
+        return higher_nodes + [None] * (lmax_size - len(higher_nodes))
 
     def _update_closest_neighbors(self, available_nodes, node_positions):
         print(f"Updating closest neighbors for Node {self.node_id}")
@@ -1253,44 +1317,62 @@ class PastryNode:
         """
         request_node_id = request["node_id"]
 
-        if not self.kd_tree or self.kd_tree.country_keys.size == 0:
+        if not self.kd_tree or self.kd_tree.size == 0:
             return {"status": "failure", "message": "No keys stored in this node."}
 
         keys_to_move = []
 
         # Check if any country_keys should be moved to the requesting node
-        for country_key in np.unique(self.kd_tree.country_keys):
-            l = common_prefix_length(self.node_id, country_key)  # Use the correct key
+        country_keys, _ = self.kd_tree.get_unique_country_keys()
+        for country_key in country_keys:
+            l = self.network.common_prefix_length(self.node_id, country_key)  # Use the correct key
             if self._is_closer_node(request_node_id, country_key, l, self.node_id):
                 keys_to_move.append(country_key)
 
-        for country_key in keys_to_move:
-            # Get the corresponding points, reviews, and countries indices
-            indices = np.where(self.kd_tree.country_keys == country_key)[0]
-
-            if len(indices) == 0:
-                continue  # Skip if no matching indices were found
-
-            for idx in indices:
-                point = self.kd_tree.points[idx]
-                review = self.kd_tree.reviews[idx]
-                country = self.kd_tree.countries[idx]
-
-                # Insert the key and data into the requesting node's KDTree
-                insert_request = {
-                    "operation": "INSERT_KEY",
-                    "key": country_key,
-                    "country": country,
-                    "point": point,
-                    "review": review,
-                    "hops": [],
-                }
-                self.send_request(self.network.node_ports[request_node_id], insert_request)
-                print(f"Node {self.node_id}: Moved Key {country_key} to {request_node_id}.")
+        if not keys_to_move:
+            print(f"\nNode {self.node_id}: Moved 0 keys to {request_node_id}.")
+            return {"status": "success", "message": f"Moved 0 keys to {request_node_id}."}
+
+        # Remove the keys and data from the current node's KDTree in one pass
+        with self.lock:
+            rows = self.kd_tree.extract_points(keys_to_move)
+
+        # Ship all the rows to the requesting node in a single columnar message
+        migrate_request = {
+            "operation": "MIGRATE_KEYS",
+            "keys": keys_to_move,
+            "points": rows["points"],
+            "reviews": rows["reviews"],
+            "country_keys": rows["country_keys"],
+            "countries": rows["countries"],
+            "hops": [],
+        }
 
-            # Remove the key and data from the current node's KDTree
-            print(f"Node {self.node_id}: Deleted Key {country_key}.")
-            self.kd_tree.delete_points(country_key)
+        def keep_rows(response):
+            # The rows did not reach the requesting node, keep them here
+            with self.lock:
+                self.kd_tree.add_rows(
+                    rows["points"], rows["reviews"], rows["country_keys"], rows["countries"]
+                )
+            print(
+                f"\nNode {self.node_id}: Failed to move keys {keys_to_move} to {request_node_id}. "
+                f"Response: {response}"
+            )
+
+        response = self.send_transfer(request_node_id, migrate_request, keep_rows)
+        if is_overloaded(response):
+            print(
+                f"\nNode {self.node_id}: Moving {len(keys_to_move)} keys to {request_node_id} later."
+            )
+            return {
+                "status": "success",
+                "message": f"Moving {len(keys_to_move)} keys to {request_node_id} later.",
+            }
+        if not response or response["status"] != "success":
+            return {
+                "status": "failure",
+                "message": f"Failed to move keys to {request_node_id}.",
+            }
 
         print(f"\nNode {self.node_id}: Moved {len(keys_to_move)} keys to {request_node_id}.")
         return {
@@ -1298,6 +1380,38 @@ class PastryNode:
             "message": f"Moved {len(keys_to_move)} keys to {request_node_id}.",
         }
 
+    def _handle_migrate_keys_request(self, request):
+        """
+        Handle a MIGRATE_KEYS operation by merging a batch of rows into the KDTree at once.
+        """
+        points = request["points"]
+        reviews = request["reviews"]
+        country_keys = request["country_keys"]
+        countries = request["countries"]
+
+        if len(points) == 0:
+            return {"status": "success", "message": "No rows to migrate.", "hops": request["hops"]}
+
+        with self.lock:
+            if not self.kd_tree:
+                self.kd_tree = KDTree(
+                    points=np.array(points),
+                    reviews=np.array(reviews),
+                    country_keys=np.array(country_keys),
+                    countries=np.array(countries),
+                )
+            else:
+                self.kd_tree.add_rows(points, reviews, country_keys, countries)
+
+        print(
+            f"Node {self.node_id}: Migrated {len(points)} rows for keys {request['keys']} into KDTree."
+        )
+        return {
+            "status": "success",
+            "message": f"Migrated {len(points)} rows to {self.node_id}.",
+            "hops": request["hops"],
+        }
+
     def insert_key(self, key, point, review, country):
         """
         Initiate the INSERT_KEY operation for a given key, point, and review.
@@ -1356,6 +1470,8 @@ class PastryNode:
             "upper_bounds": upper_bounds,
             "N": N,
             "hops": [],  # Initialize hops tracking
+            "origin": self.node_id,  # Only this node hedges the request
+            "request_id": uuid.uuid4().hex,  # Shared by the copies of a hedged request
         }
         print(f"Node {self.node_id}: Initiating LOOKUP Request: {request}")
 
@@ -1406,33 +1522,33 @@ class PastryNode:
         """
         Move keys from nodes in the leaf set if necessary.
         """
-        for node_id in self.Lmin + self.Lmax:
-            if node_id is not None:
-                request = {"operation": "GET_KEYS", "node_id": self.node_id, "hops": []}
-                self.send_request(self.network.node_ports[node_id], request)
+        request = {"operation": "GET_KEYS", "node_id": self.node_id, "hops": []}
+        leaves = [node_id for node_id in set(self.Lmin + self.Lmax) if node_id is not None]
+        self.fan_out([(node_id, request) for node_id in leaves])
 
     def _find_next_hop(self, key):
         """
         Find the next hop to forward a request based on the node ID.
         """
-        # Check if the key is in the leaf set
+        # Check if the key falls within the range of the leaf set
         if self._in_leaf_set(key):
-            # If the node_id is in the leaf set
+            # Deliver directly to the numerically closest leaf (or this node)
             closest_leaf_id = self._find_closest_leaf_id(key)
             return closest_leaf_id
 
-        # If the key is not in the leaf set, check the routing table
-        else:
-            i = common_prefix_length(self.node_id, key)
-            next_hop = self.routing_table[i][int(key[i], 16)]
+        # If the key is outside the leaf set range, check the routing table
+        key_int = id_int(key)
+        i = prefix_length(self.node_int, key_int, self.id_digits, self.b)
+        if i == self.id_digits:
+            return self.node_id  # The key is this node's ID
 
-            if next_hop is not None:
-                return next_hop
-            # If the routing table entry is empty,
-            # scan all the nodes in the network
-            else:
-                next_hop = self._find_closest_node_id_all(key)
-                return next_hop
+        next_hop = self.routing_table.get(i, digit_at(key_int, i, self.id_digits, self.b))
+        if next_hop is not None:
+            return next_hop
+
+        # If the routing table entry is empty,
+        # scan all the nodes in the network
+        return self._find_closest_node_id_all(key)
 
     def transmit_state(self):
         """
@@ -1441,60 +1557,61 @@ class PastryNode:
         request = {
             "operation": "UPDATE_PRESENCE",
             "joining_node_id": self.node_id,
+            "position": self.position,
             "hops": [],
         }
 
-        nodes_updated = set()
-
-        def __update_presence(node_id):
-            """Helper function to send request and track updates."""
-            if node_id and node_id not in nodes_updated and node_id in self.network.node_ports:
-                try:
-                    self.send_request(self.network.node_ports[node_id], request)
-                    nodes_updated.add(node_id)
-                except Exception as e:
-                    print(f"Error updating presence for {node_id}: {e}")
-
-        # Update the Neighborhood Set (M) nodes
-        for node_id in self.neighborhood_set:
-            if node_id in self.network.node_ports:  # Ensure node is alive
-                __update_presence(node_id)
-
-        # Update the Routing Table (R) nodes
-        for row in self.routing_table:
-            for node_id in row:
-                if node_id in self.network.node_ports:  # Ensure node is alive
-                    __update_presence(node_id)
-
-        # Update the Leaf Set (L) nodes
-        for node_id in self.Lmin:
-            if node_id in self.network.node_ports:  # Ensure node is alive
-                __update_presence(node_id)
-
-        for node_id in self.Lmax:
-            if node_id in self.network.node_ports:  # Ensure node is alive
-                __update_presence(node_id)
+        # Neighborhood Set (M), Routing Table (R) and Leaf Set (L) nodes, each updated only once
+        targets = []
+        for node_id in [
+            *self.neighborhood_set,
+            *self.routing_table.node_ids(),
+            *self.Lmin,
+            *self.Lmax,
+        ]:
+            if node_id and node_id not in targets and self.membership.is_alive(node_id):
+                targets.append(node_id)
+
+        # Update all of them concurrently
+        responses = self.fan_out([(node_id, request) for node_id in targets])
+        for node_id, response in zip(targets, responses):
+            if response and response.get("referenced"):
+                self.referrers.add(node_id)
 
     # Data Structure Updates
 
-    def update_routing_table_row(self, request):
+    def install_join_state(self, response):
         """
-        Update the routing table of the current node with the received row.
+        Install the routing table rows and the leaf set collected along the route of this node's
+        join. The new state is built aside and replaces the current one at once.
         """
-        row_idx = request["row_idx"]
-        received_row = request["received_row"]
+        self.peer_positions.update(response.get("positions", {}))
+        self.membership.learn(response.get("ports", {}))
 
-        for col_idx in range(len(received_row)):
-            entry = received_row[col_idx]
-            if entry is None:
-                continue
-            # Skip if the entry's hex digit at row_idx matches this node's ID at the same index.
-            # This avoids conflicts in the routing table.
-            if entry[row_idx] == self.node_id[row_idx]:
-                continue
-            # Update the routing table with the received entry if the current entry is empty
-            if self.routing_table[row_idx][col_idx] is None:
-                self.routing_table[row_idx][col_idx] = received_row[col_idx]
+        routing_table = RoutingTable(self.id_digits, pow(2, self.b))
+        for row_idx, received_row in response["routing_rows"]:
+            for col_idx, entry in enumerate(received_row):
+                if entry is None:
+                    continue
+                # Skip if the entry's digit at row_idx matches this node's ID at the same index.
+                # This avoids conflicts in the routing table.
+                if self.network.digit(entry, row_idx) == self.network.digit(self.node_id, row_idx):
+                    continue
+                # Keep the received entry if the current entry is empty or farther away
+                self._consider_routing_entry(row_idx, col_idx, entry, routing_table)
+
+        # Copy the leaf set of the numerically closest node and add that node to it
+        leaf_set = response["leaf_set"]
+        Lmin = leaf_set["Lmin"].copy()
+        Lmax = leaf_set["Lmax"].copy()
+        key = leaf_set["key"]
+        # The ring wraps around, so the node may precede and follow this one at once
+        self._update_leaf_list(Lmax, key, clockwise=True)
+        self._update_leaf_list(Lmin, key, clockwise=False)
+
+        self.routing_table = routing_table
+        self.Lmin, self.Lmax = Lmin, Lmax
+        self._index_leaf_set()
 
     def update_routing_table_entry(self, request):
         """
@@ -1502,11 +1619,15 @@ class PastryNode:
         """
         idx = request["row_idx"]
         node_id = request["node_id"]
+        if request.get("position") is not None:
+            self.peer_positions[node_id] = request["position"]
+
+        # Update the routing table entry if it is empty or the node is closer
+        col_idx = self.network.digit(node_id, idx)
+        if self._consider_routing_entry(idx, col_idx, node_id):
+            print(f"Node {self.node_id}: Updated Routing Table Entry with node {node_id}.")
 
-        # Update the routing table entry if it is empty
-        if self.routing_table[idx][int(node_id[idx], 16)] is None:
-            print(f"Node {self.node_id}: Updating Routing Table Entry for new node {node_id}...")
-            self.routing_table[idx][int(node_id[idx], 16)] = node_id
+        return {"status": "success", "referenced": self._refers_to(node_id)}
 
     def initialize_neighborhood_set(self, close_node_id, close_node_neighborhood_set):
         """
@@ -1534,15 +1655,7 @@ class PastryNode:
         max_dist = -1
         idx = -1
         for i in range(len(self.neighborhood_set)):
-            dist_request = {
-                "operation": "DISTANCE",
-                "node_position": self.position,
-                "hops": [],
-            }
-            response = self.send_request(
-                self.network.node_ports[self.neighborhood_set[i]], dist_request
-            )
-            dist = response["distance"]
+            dist = self._proximity(self.neighborhood_set[i])
 
             if dist > max_dist:
                 max_dist = dist
@@ -1563,226 +1676,377 @@ class PastryNode:
         # Initialize variables to find the farthest node in the neighborhood set
         max_dist, replace_idx = -1, -1
 
-        # Find the farthest node from the current node in its neighborhood set
+        # Find the farthest node from the current node in its neighborhood set (cached positions)
         for i, neighbor_id in enumerate(self.neighborhood_set):
-            dist_request = {
-                "operation": "DISTANCE",
-                "node_position": self.position,
-                "hops": [],
-            }
-            response = self.send_request(self.network.node_ports[neighbor_id], dist_request)
-            dist = response["distance"]
+            dist = self._proximity(neighbor_id)
             if dist > max_dist:
                 max_dist, replace_idx = dist, i
 
         # Check if the new node is closer than the farthest node
-        dist_request = {
-            "operation": "DISTANCE",
-            "node_position": self.position,
-            "hops": [],
-        }
-        response = self.send_request(self.network.node_ports[key], dist_request)
-        key_curr_node_dist = response["distance"]
+        key_curr_node_dist = self._proximity(key)
         if key_curr_node_dist < max_dist:
             # Replace the farthest node with the new node
             self.neighborhood_set[replace_idx] = key
 
-    def update_leaf_set(self, request):
-        """
-        Update the leaf set of the current node based on the provided Lmin, Lmax,
-        and key of the node that triggered the update.
-        """
-        Lmin = request["Lmin"]
-        Lmax = request["Lmax"]
-        key = request["key"]
-
-        self.Lmin = Lmin.copy()
-        self.Lmax = Lmax.copy()
-
-        if hex_compare(key, self.node_id):
-            # If key >= this node's ID, update Lmax
-            self._update_leaf_list(self.Lmax, key)
-        else:
-            # Else update Lmin
-            self._update_leaf_list(self.Lmin, key)
-
     def _handle_update_presence_request(self, request):
         """
         Update the presence of a node in all the data structures of this node.
         """
         key = request["joining_node_id"]
+        if request.get("position") is not None:
+            self.peer_positions[key] = request["position"]
+        # Presence is only sent to the nodes in the new node's state
+        self.referrers.add(key)
 
         # Update Neighborhood Set (M)
         if key not in self.neighborhood_set:
             self._update_neighborhood_set(key)
 
         # Update Routing Table (R)
-        idx = common_prefix_length(key, self.node_id)
+        idx = self.network.common_prefix_length(key, self.node_id)
 
-        # If the entry in the routing table is empty, update it with the key
+        # If the entry in the routing table is empty or farther away, update it with the key
+        col_idx = self.network.digit(key, idx)
         print(
-            f"Node {self.node_id}: Updating Routing Table Entry {idx, int(key[idx], 16)} for new node {key}..."
+            f"Node {self.node_id}: Updating Routing Table Entry {idx, col_idx} for new node {key}..."
         )
-        if self.routing_table[idx][int(key[idx], 16)] is None:
-            self.routing_table[idx][int(key[idx], 16)] = key
+        self._consider_routing_entry(idx, col_idx, key)
 
         # Update the new node's routing table with the current node's ID
         request = {
             "operation": "UPDATE_ROUTING_TABLE_ENTRY",
             "row_idx": idx,
             "node_id": self.node_id,
+            "position": self.position,
             "hops": [],
         }
-        self.send_request(self.network.node_ports[key], request)
+        response = self.send_request(key, request)
+        if response and response.get("referenced"):
+            self.referrers.add(key)
 
         # Update Leaf Set (Lmin, Lmax)
         print(f"Node {self.node_id}: Updating Leaf Set for new node {key}...")
 
-        if key >= self.node_id:
-            self._update_leaf_list(self.Lmax, key)
-        else:
-            self._update_leaf_list(self.Lmin, key)
+        self._update_leaf_list(self.Lmax, key, clockwise=True)
+        self._update_leaf_list(self.Lmin, key, clockwise=False)
+
+        return {"status": "success", "referenced": self._refers_to(key)}
+
+    def improve_routing_table(self):
+        """
+        Periodic routing table maintenance (proximity neighbor selection).
+        Ask a random entry of one row for its own row, whose entries also qualify for this row,
+        and keep the topologically closer node in every entry. Rows are visited in turn.
+        """
+        if not self.running:
+            self.cancel_timers()
+            return
+
+        rows = sorted(self.routing_table.entries)
+        if not rows:
+            return
+        row_idx = rows[self.maintenance_row % len(rows)]
+        self.maintenance_row += 1
+
+        peers = [
+            peer
+            for peer in self.routing_table.row(row_idx)
+            if peer is not None and self.membership.is_alive(peer)
+        ]
+        if not peers:
+            return
+        peer = peers[np.random.randint(len(peers))]
+
+        request = {"operation": "GET_ROUTING_TABLE_ROW", "row_idx": row_idx}
+        response = self.send_request(peer, request, max_timeout=MAINTENANCE_TIMEOUT)
+        if not response or response.get("status") != "success":
+            return
+
+        self.peer_positions.update(response["positions"])
+        self.membership.learn(response["ports"])
+        adopted = set()
+        for col_idx, entry in enumerate(response["row"]):
+            if (
+                entry is not None
+                and self.network.common_prefix_length(self.node_id, entry) == row_idx
+                and entry != self.routing_table.get(row_idx, col_idx)
+                and self._consider_routing_entry(row_idx, col_idx, entry)
+            ):
+                adopted.add(entry)
+        self._announce_references(adopted, max_timeout=MAINTENANCE_TIMEOUT)
 
     # Helper Methods
 
-    def _in_leaf_set(self, node_id):
+    def _consider_routing_entry(self, row_idx, col_idx, node_id, routing_table=None):
         """
-        Check if a node ID is in the leaf set.
+        Offer a node for a routing table entry (of this node's table unless another is given).
+        An empty entry takes it, an occupied one keeps the topologically closer of the two nodes.
+        Nodes without a known address (unknown or dead) are refused.
+        Returns True if the entry now holds the node.
         """
-        if node_id in self.Lmin or node_id in self.Lmax:
+        if routing_table is None:
+            routing_table = self.routing_table
+        if self.membership.port(node_id) is None:
+            return False  # Unknown or dead node
+        current = routing_table.get(row_idx, col_idx)
+        if current == node_id:
             return True
-        else:
-            return False
+        if current is None or self._proximity(node_id) < self._proximity(current):
+            routing_table.set(row_idx, col_idx, node_id)
+            return True
+        return False
+
+    def _proximity(self, node_id):
+        """
+        Topological distance to a node, from its cached position.
+        An unknown position is fetched once with GET_POSITION.
+        """
+        position = self.peer_positions.get(node_id)
+        if position is None:
+            if not self.membership.is_alive(node_id):
+                return float("inf")
+            request = {"operation": "GET_POSITION"}
+            response = self.send_request(node_id, request)
+            if not response or response.get("position") is None:
+                return float("inf")
+            position = self.peer_positions[node_id] = response["position"]
+        return topological_distance(self.position, position)
+
+    def _refers_to(self, node_id):
+        """
+        Check if the leaf set, neighborhood set or routing table of this node holds node_id.
+        """
+        return (
+            node_id in self.Lmin
+            or node_id in self.Lmax
+            or node_id in self.neighborhood_set
+            or node_id in self.routing_table
+        )
+
+    def _referenced_nodes(self):
+        """
+        Return the IDs of all the nodes in the leaf set, neighborhood set and routing table.
+        """
+        node_ids = set(self.Lmin + self.Lmax + self.neighborhood_set)
+        node_ids.update(self.routing_table.node_ids())
+        node_ids.discard(None)
+        return node_ids
+
+    def _announce_references(self, node_ids, max_timeout=None):
+        """
+        Add this node to the referrers of nodes that entered its state without being told.
+        """
+        request = {"operation": "ADD_REFERENCE", "node_id": self.node_id}
+        for node_id in node_ids:
+            if self.membership.is_alive(node_id):
+                self.send_request(node_id, request, max_timeout=max_timeout)
+
+    def _known_positions(self, node_ids):
+        """
+        Return the cached positions of the given nodes (and this node) to ship along with them.
+        """
+        positions = {self.node_id: self.position}
+        for node_id in node_ids:
+            if node_id in self.peer_positions:
+                positions[node_id] = self.peer_positions[node_id]
+        return positions
+
+    def _index_leaf_set(self):
+        """
+        Rebuild the sorted integer index of the leaf set and the extent of the range it covers.
+        Call after every change to Lmin or Lmax.
+        """
+        leaves = sorted(
+            (id_int(leaf), leaf) for leaf in set(self.Lmin + self.Lmax) if leaf is not None
+        )
+        self.leaf_index = ([leaf_int for leaf_int, _ in leaves], [leaf for _, leaf in leaves])
+        self.leaf_extent = (
+            max(
+                (self._leaf_distance(id_int(leaf), False) for leaf in self.Lmin if leaf),
+                default=-1,
+            ),
+            max(
+                (self._leaf_distance(id_int(leaf), True) for leaf in self.Lmax if leaf),
+                default=-1,
+            ),
+        )
+
+    def _leaf_distance(self, node_int, clockwise):
+        """
+        Distance around the ring from this node to another one, going up (clockwise=True)
+        or down from this node and wrapping around from the highest ID to the lowest one.
+        """
+        if clockwise:
+            return (node_int - self.node_int) % (1 << self.id_bits)
+        return (self.node_int - node_int) % (1 << self.id_bits)
+
+    def _in_leaf_set(self, key):
+        """
+        Check if a key falls within the range covered by the leaf set: the arc of the ring from
+        the farthest leaf of Lmin, through this node, to the farthest leaf of Lmax.
+        """
+        lower_extent, higher_extent = self.leaf_extent
+        key_int = id_int(key)
+        return (
+            self._leaf_distance(key_int, False) <= lower_extent
+            or self._leaf_distance(key_int, True) <= higher_extent
+        )
+
+    def _closeness(self, node_int, key_int):
+        """
+        Rank a node by its closeness to a key, lower is closer: longest common prefix first,
+        then shortest distance around the ring.
+        """
+        return (
+            -prefix_length(node_int, key_int, self.id_digits, self.b),
+            ring_distance(node_int, key_int, self.id_bits),
+        )
 
     def _find_closest_leaf_id(self, key):
-        closest_diff_dig_idx, closest_dist = hex_distance(self.node_id, key)
+        """
+        Find the node of the leaf set (this node included) with the longest common prefix with the key,
+        breaking ties by distance around the ring.
+        """
+        leaf_ints, leaf_ids = self.leaf_index
+        key_int = id_int(key)
 
         closest_leaf_id = self.node_id
+        closest = self._closeness(self.node_int, key_int)
 
-        # Check Lmin for closer nodes
-        for leaf in self.Lmin:
-            if leaf is not None:
-                key_leaf_diff_dig_idx, key_leaf_dist = hex_distance(leaf, key)
-
-                # Update if the different digit index is grater
-                # or if its the same but this node is numerically closer
-                if (key_leaf_diff_dig_idx > closest_diff_dig_idx) or (
-                    key_leaf_diff_dig_idx == closest_diff_dig_idx and key_leaf_dist < closest_dist
-                ):
-                    closest_leaf_id = leaf
-                    closest_diff_dig_idx = key_leaf_diff_dig_idx
-                    closest_dist = key_leaf_dist
-
-        # Check Lmax for closer nodes
-        for leaf in self.Lmax:
-            if leaf is not None:
-                key_leaf_diff_dig_idx, key_leaf_dist = hex_distance(leaf, key)
-
-                # Apply the same update logic
-                if (key_leaf_diff_dig_idx > closest_diff_dig_idx) or (
-                    key_leaf_diff_dig_idx == closest_diff_dig_idx and key_leaf_dist < closest_dist
-                ):
-                    closest_leaf_id = leaf
-                    closest_diff_dig_idx = key_leaf_diff_dig_idx
-                    closest_dist = key_leaf_dist
+        # IDs that share a longer prefix with the key lie in a narrower range around it,
+        # so only the leaves right below and right above the key (wrapping around the ends
+        # of the ring) can be the closest
+        idx = bisect.bisect_left(leaf_ints, key_int)
+        for neighbor in {(idx - 1) % len(leaf_ints), idx % len(leaf_ints)} if leaf_ints else ():
+            leaf = self._closeness(leaf_ints[neighbor], key_int)
+            if leaf < closest:
+                closest_leaf_id, closest = leaf_ids[neighbor], leaf
 
         return closest_leaf_id
 
-    def _find_closest_node_id_all(self, key):
+    def _find_live_next_hop(self, key):
+        """
+        Find the next hop for a key. If it has failed, queue its repair and fall back to the
+        closest live leaf when the key is in the leaf set range, or else to any live node that
+        shares a longer prefix with the key or is numerically closer to it than this node.
+        """
+        next_hop_id = self._find_next_hop(key)
+        if not next_hop_id or self.membership.is_alive(next_hop_id):
+            return next_hop_id
+
+        # Suspects are only avoided, the state that refers to dead nodes is repaired
+        print(f"Node {self.node_id}: Detected failed node {next_hop_id}. Routing around it...")
+        if self.membership.port(next_hop_id) is None:
+            self.schedule_repair(next_hop_id)
+
+        if self._in_leaf_set(key):
+            # Rank the live leaves like _find_closest_leaf_id does, so the key is stored where
+            # later requests for it are routed: longest common prefix first, then ring distance
+            key_int = id_int(key)
+            candidates = [leaf for leaf in self.leaf_index[1] if self.membership.is_alive(leaf)]
+            return min(
+                [self.node_id, *candidates],
+                key=lambda node_id: (*self._closeness(id_int(node_id), key_int), node_id),
+            )
+        return self._find_closest_node_id_all(key, alive_only=True)
+
+    def _find_closest_node_id_all(self, key, alive_only=False):
         """
         Scan all the nodes in the network to find the closest node to the given node ID.
+        With alive_only=True, suspected and dead nodes are skipped.
         """
-        l = common_prefix_length(self.node_id, key)
-
-        # Check Lmin
-        for idx in range(len(self.Lmin)):
-            if self.Lmin[idx] is not None:
-                if self._is_closer_node(self.Lmin[idx], key, l, self.node_id):
-                    return self.Lmin[idx]
-
-        # Check Lmax
-        for idx in range(len(self.Lmax)):
-            if self.Lmax[idx] is not None:
-                if self._is_closer_node(self.Lmax[idx], key, l, self.node_id):
-                    return self.Lmax[idx]
-
-        # Check neighborhood set (M)
-        for idx in range(len(self.neighborhood_set)):
-            if self.neighborhood_set[idx] is not None:
-                if self._is_closer_node(self.neighborhood_set[idx], key, l, self.node_id):
-                    return self.neighborhood_set[idx]
-
-        # Check routing table (R)
-        for row in range(len(self.routing_table)):
-            for col in range(len(self.routing_table[0])):
-                if self.routing_table[row][col] is not None:
-                    if self._is_closer_node(self.routing_table[row][col], key, l, self.node_id):
-                        return self.routing_table[row][col]
+        key_int = id_int(key)
+
+        # A candidate is closer if it shares a longer prefix with the key than this node,
+        # or the same prefix length but is closer around the ring
+        closest = self._closeness(self.node_int, key_int)
+
+        # Check Lmin, Lmax, the neighborhood set (M) and the routing table (R) in this order
+        for node_ids in (
+            self.Lmin,
+            self.Lmax,
+            self.neighborhood_set,
+            self.routing_table.node_ids(),
+        ):
+            for node_id in node_ids:
+                if node_id is None or (alive_only and not self.membership.is_alive(node_id)):
+                    continue
+                if self._closeness(id_int(node_id), key_int) < closest:
+                    return node_id
 
         # If no node is found, return the current node ID
         return self.node_id
 
+    def _find_hedge_hop(self, key, next_hop_id):
+        """
+        Find a second candidate to send a routed request to: the live, not overloaded node of the
+        leaf set, neighborhood set or routing table, other than the next hop, that shares the
+        longest prefix with the key (the closest around the ring if several do). Returns None if no
+        such node is closer to the key than this node.
+        """
+        key_int = id_int(key)
+
+        hedge_id, closest = None, self._closeness(self.node_int, key_int)
+        for node_ids in (
+            self.Lmin,
+            self.Lmax,
+            self.neighborhood_set,
+            self.routing_table.node_ids(),
+        ):
+            for node_id in node_ids:
+                if node_id is None or node_id == next_hop_id:
+                    continue
+                if not self.membership.is_alive(node_id) or self.peer_stats.is_busy(node_id):
+                    continue
+                candidate = self._closeness(id_int(node_id), key_int)
+                if candidate < closest:
+                    hedge_id, closest = node_id, candidate
+
+        return hedge_id
+
     def _is_closer_node(self, target_node_id, key, l, curr_node_id):
         """
         Custom condition to compare the target and current nodes based on topological and numerical closeness to the key.
         """
-        # Calculate the common prefix length between the target node and the key
-        i = common_prefix_length(target_node_id, key)
+        key_int = id_int(key)
+        target_int = id_int(target_node_id)
+        curr_int = id_int(curr_node_id)
 
-        # Calculate the first different digit index between the target node id and the key
-        # and the numerical distance between the target node and the key
-        target_key_diff_dig_idx, target_key_num_dist = hex_distance(target_node_id, key)
+        # The common prefix length between the target node and the key is also
+        # the index of the first digit where they differ
+        i = prefix_length(target_int, key_int, self.id_digits, self.b)
+        if i < l:
+            return False
 
         # Do the same for the current node and the key
-        curr_node_key_diff_dig_idx, curr_node_key_num_dist = hex_distance(curr_node_id, key)
+        curr_i = prefix_length(curr_int, key_int, self.id_digits, self.b)
 
         # Determine if the target node is a better candidate than the current node
-        if (i >= l) and (
-            (target_key_diff_dig_idx > curr_node_key_diff_dig_idx)
-            or (
-                target_key_diff_dig_idx == curr_node_key_diff_dig_idx
-                and target_key_num_dist < curr_node_key_num_dist
-            )
-        ):
-            return True
-        else:
-            return False
+        return i > curr_i or (
+            i == curr_i
+            and ring_distance(target_int, key_int, self.id_bits)
+            < ring_distance(curr_int, key_int, self.id_bits)
+        )
 
-    def _update_leaf_list(self, leaf_list, key):
+    def _update_leaf_list(self, leaf_list, key, clockwise):
         """
-        Update the specified leaf list (Lmin or Lmax) with the given key.
-        Ensures it remains sorted and does not contain duplicates.
+        Offer a node to one side of the leaf set: Lmax (clockwise=True) keeps the nodes that
+        follow this node around the ring, Lmin the ones that precede it. The node takes a free
+        slot, or replaces the farthest leaf of that side if it is closer.
         """
-        if key in self.Lmin or key in self.Lmax:
-            return  # Key is already in the leaf set
+        if key == self.node_id or key in leaf_list:
+            return  # Key is already on this side of the leaf set
 
         # Find an empty slot
         for i in range(len(leaf_list)):
             if leaf_list[i] is None:
                 leaf_list[i] = key
+                self._index_leaf_set()
                 return
 
         # If no empty slot, find the farthest node and replace it if the key is closer
-        far_diff_dig_idx = HASH_HEX_DIGITS
-        max_num_dist = -1
-        replace_index = -1
-
-        for i in range(len(leaf_list)):
-            diff_dig_idx, num_dist = hex_distance(leaf_list[i], self.node_id)
-
-            # Replace the farthest node (numerical distance or digit index)
-            if (diff_dig_idx < far_diff_dig_idx) or (
-                diff_dig_idx == far_diff_dig_idx and num_dist > max_num_dist
-            ):
-                far_diff_dig_idx = diff_dig_idx
-                max_num_dist = num_dist
-                replace_index = i
-
-        # Calculate the numerical distance for the new key
-        diff_dig_idx, num_dist = hex_distance(key, self.node_id)
-
-        # Replace if the key is closer than the farthest node
-        if (diff_dig_idx > far_diff_dig_idx) or (
-            diff_dig_idx == far_diff_dig_idx and num_dist < max_num_dist
-        ):
+        distances = [self._leaf_distance(id_int(leaf), clockwise) for leaf in leaf_list]
+        replace_index = max(range(len(leaf_list)), key=distances.__getitem__)
+        if self._leaf_distance(id_int(key), clockwise) < distances[replace_index]:
             leaf_list[replace_index] = key
+            self._index_leaf_set()
@@ -112,10 +112,20 @@ class PastryDashboard(Dashboard):
         self.ax_topology.spines["left"].set_visible(False)
         self.ax_topology.spines["right"].set_visible(False)
 
+    def hash_key(self, country):
+        return self.network.hash_key(country)
+
+    def node_label(self, node_id):
+        """
+        Label of a node in the plots. Long IDs are shortened to their first digits,
+        which are the digits Pastry routes on.
+        """
+        return node_id if len(node_id) <= 8 else f"{node_id[:6]}.."
+
     def visualize_network(self, threshold=0.3):
         """
         Visualizes the Pastry network by placing nodes on a circular ring
-        based on their 4-digit hex ID. Lower values are at the top (12 o'clock),
+        based on their hex ID. Lower values are at the top (12 o'clock),
         and values increase clockwise.
 
         Nodes that are too close together will be moved slightly.
@@ -148,7 +158,7 @@ class PastryDashboard(Dashboard):
 
         # Arrange nodes based on their numerical value
         for node_id in sorted_nodes:
-            angle = 2 * np.pi * (int(node_id, 16) / 0xFFFF)
+            angle = 2 * np.pi * (int(node_id, 16) / 2**self.network.id_bits)
             base_x, base_y = radius * np.sin(angle), radius * np.cos(angle)
 
             # Check for overlap within the threshold distance
@@ -184,7 +194,7 @@ class PastryDashboard(Dashboard):
             self.ax_ring.text(
                 text_x,
                 text_y,
-                node_id,
+                self.node_label(node_id),
                 fontsize=10,
                 ha=ha,
                 va=va,
@@ -227,7 +237,7 @@ class PastryDashboard(Dashboard):
             self.ax_topology.text(
                 x,
                 0.025,
-                node.node_id,
+                self.node_label(node.node_id),
                 fontsize=10,
                 ha="center",
                 va="center",
@@ -249,7 +259,11 @@ class PastryDashboard(Dashboard):
         join_window.title("Node Join")
         join_window.geometry("300x150")
 
-        tk.Label(join_window, text="Enter 4-digit hex ID:", font=("Arial", 14)).pack(pady=10)
+        tk.Label(
+            join_window,
+            text=f"Enter {self.network.hash_hex_digits}-digit hex ID:",
+            font=("Arial", 14),
+        ).pack(pady=10)
 
         entry = tk.Entry(join_window, width=20)
         entry.pack(pady=2)
@@ -269,7 +283,9 @@ class PastryDashboard(Dashboard):
             print("\nNode join canceled.")
             return
 
-        if len(new_node_id) != 4 or not all(c in "0123456789abcdefABCDEF" for c in new_node_id):
+        if len(new_node_id) != self.network.hash_hex_digits or not all(
+            c in "0123456789abcdefABCDEF" for c in new_node_id
+        ):
             print("Invalid Node ID.")
             return
 
@@ -0,0 +1,105 @@
+import threading
+from array import array
+
+
+class RoutingTable:
+    """
+    Compact, sparse Pastry routing table.
+
+    Each row is an integer array of cols entries, allocated the first time one of its entries is
+    set, so the rows that no node can fill (long IDs, small networks) cost nothing. Each entry is
+    the index of the node ID in a list of interned peer IDs, or EMPTY if the entry is not set, so a
+    lookup is a single array access and the same ID string is shared by every entry that refers to
+    that peer.
+    """
+
+    EMPTY = -1
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.entries = {}  # Dictionary. Keys are row indexes, values are arrays of peer indexes
+
+        self.peers = []  # Interned node IDs
+        self.peer_index = {}  # Dictionary. Keys are node IDs, values are indexes in peers
+        self.lock = threading.Lock()  # Entries may be offered by concurrent requests
+
+    def get(self, row, col):
+        """
+        Return the node ID at (row, col), or None if the entry is empty.
+        """
+        entries = self.entries.get(row)
+        if entries is None or entries[col] == self.EMPTY:
+            return None
+        return self.peers[entries[col]]
+
+    def set(self, row, col, node_id):
+        """
+        Set the entry at (row, col). Setting it to None clears it.
+        """
+        entries = self.entries.get(row)
+        if entries is None:
+            if node_id is None:
+                return
+            entries = self.entries.setdefault(row, array("i", [self.EMPTY]) * self.cols)
+        entries[col] = self._intern(node_id)
+
+    def row(self, row):
+        """
+        Return a row as a list of node IDs (None for empty entries).
+        """
+        return [self.get(row, col) for col in range(self.cols)]
+
+    def remove(self, node_id):
+        """
+        Clear every entry that points to node_id and return the cleared (row, col) positions.
+        """
+        peer = self.peer_index.get(node_id)
+        if peer is None:
+            return []
+
+        cleared_positions = []
+        for row in sorted(self.entries):
+            entries = self.entries[row]
+            for col, entry in enumerate(entries):
+                if entry == peer:
+                    entries[col] = self.EMPTY
+                    cleared_positions.append((row, col))
+        return cleared_positions
+
+    def __contains__(self, node_id):
+        peer = self.peer_index.get(node_id)
+        return peer is not None and any(peer in entries for entries in self.entries.values())
+
+    def node_ids(self):
+        """
+        Yield the node ID of every non-empty entry in row-major order.
+        """
+        for row in sorted(self.entries):
+            for peer in self.entries[row]:
+                if peer != self.EMPTY:
+                    yield self.peers[peer]
+
+    def to_list(self):
+        """
+        Return the table as a list of rows, the format used in messages and state dumps.
+        Rows after the last allocated row are left out.
+        """
+        return [self.row(row) for row in range(max(self.entries, default=-1) + 1)]
+
+    def _intern(self, node_id):
+        if node_id is None:
+            return self.EMPTY
+        with self.lock:
+            peer = self.peer_index.get(node_id)
+            if peer is None:
+                peer = len(self.peers)
+                self.peers.append(node_id)
+                self.peer_index[node_id] = peer
+        return peer
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __repr__(self):
+        return repr(self.to_list())
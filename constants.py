@@ -15,6 +15,81 @@ predefined_ids = [
     "d3ad",
 ]
 
+"""------------ Request Constants ------------"""
+# Timeouts of the requests between nodes, estimated per peer (Jacobson/Karels)
+RTO_INITIAL = 1.0  # Seconds to wait for a peer with no round-trip time samples yet
+RTO_MIN = 0.5  # Lower bound of the estimated timeout, in seconds
+RTO_MAX = 60.0  # Upper bound of the estimated timeout, in seconds
+RTO_K = 4  # Weight of the round-trip time variation in the timeout
+RTT_ALPHA = 1 / 8  # Gain of the smoothed round-trip time
+RTT_BETA = 1 / 4  # Gain of the round-trip time variation
+
+# Routed operations, bulk transfers and requests whose handler waits on another request.
+# Their reply time depends on work done beyond the peer, so they wait REQUEST_TIMEOUT instead.
+# SWIM_PING_REQ also waits on a ping, but it is a control request whose sender caps the wait
+# at SWIM_PING_TIMEOUT
+LONG_OPERATIONS = [
+    "NODE_JOIN",
+    "NODE_LEAVE",
+    "INSERT_KEY",
+    "DELETE_KEY",
+    "UPDATE_KEY",
+    "LOOKUP",
+    "FIND_SUCCESSOR",
+    "DELETE_SUCCESSOR_KEYS",
+    "RESTORATION",
+    "SET_BACKUP",
+    "GET_KEYS",
+    "MIGRATE_KEYS",
+    "UPDATE_PRESENCE",
+]
+REQUEST_TIMEOUT = 120.0  # Seconds to wait for a long operation
+# Upper bound of the timeout of the requests sent by periodic maintenance tasks, so that a slow
+# or failed peer holds a worker of the shared scheduler for a short while only
+MAINTENANCE_TIMEOUT = 0.5
+
+# Circuit breakers. Requests to a peer fail fast after BREAKER_THRESHOLD consecutive failures
+BREAKER_THRESHOLD = 3  # Consecutive failures that open the circuit of a peer
+BREAKER_BACKOFF = 1.0  # Seconds an open circuit waits before a trial request
+BREAKER_MAX_BACKOFF = 30.0  # The wait doubles after each failed trial, up to this many seconds
+
+# Admission control of the requests a node receives over sockets
+REQUEST_WORKERS = 10  # Worker threads of each node
+# Membership, stabilization and maintenance requests, served first
+CONTROL_OPERATIONS = [
+    "GET_STATUS",
+    "GET_SUCCESSOR_LIST",
+    "GET_FINGER_TABLE",
+    "GET_MEMBERSHIP",
+    "SET_SUCCESSOR",
+    "SET_PREDECESSOR",
+    "SWIM_PING",
+    "SWIM_PING_REQ",
+    "GET_LEAF_SET",
+    "GET_ROUTING_TABLE_ROW",
+    "GET_NEIGHBORHOOD_SET",
+    "GET_POSITION",
+    "DISTANCE",
+    "ADD_REFERENCE",
+    "UPDATE_ROUTING_TABLE_ENTRY",
+    "REQUEST_NEXT_HOP",
+]
+# Every operation has one timeout rule: a control operation is never a long one
+assert not set(LONG_OPERATIONS) & set(
+    CONTROL_OPERATIONS
+), "An operation is both a long and a control operation."
+# Routed membership requests, the presence updates of a join and key location.
+# Every other operation is a data operation
+ROUTING_OPERATIONS = ["FIND_SUCCESSOR", "NODE_JOIN", "NODE_LEAVE", "UPDATE_PRESENCE"]
+REQUEST_QUEUE_LIMITS = {"control": 64, "routing": 32, "data": 32}  # Requests waiting per class
+REQUEST_WORKER_LIMITS = {"control": 10, "routing": 8, "data": 6}  # Workers per class at once
+# Workers that routing and data requests together never occupy, so control requests are served
+REQUEST_CONTROL_RESERVED = 2
+REQUEST_MAX_QUEUE_WAIT = 5.0  # Seconds a request may wait for a worker before it is shed
+OVERLOAD_BACKOFF = 0.5  # Seconds a peer that shed a request is routed around
+OVERLOAD_RETRIES = 3  # Times a shed data transfer is sent again, OVERLOAD_BACKOFF seconds apart
+RECEIVE_TIMEOUT = 5.0  # Seconds the server waits for the bytes of a request
+
 """------------ Chord Constants ------------"""
 # Number of hex digits in a Node ID
 HASH_HEX_DIGITS = 4
@@ -24,6 +99,15 @@ M = 16  # Bit size for the hash space (e.g. if M=4, 2^4 = 16 nodes)
 R = 2**M  # Max possible number of nodes in the network
 S = 4  # Number of successors for each node
 
+STABILIZE_INTERVAL = 0.5  # Seconds between successor list updates
+FIX_FINGERS_INTERVAL = 1.5  # Seconds between finger table updates
+FINGERS_PER_TICK = 2  # Number of fingers refreshed with a lookup on each finger table update
+SUSPECT_PROBE_INTERVAL = 1.0  # Seconds before the first liveness probe of a suspected peer
+SUSPECT_PROBE_MAX_INTERVAL = 8.0  # Cap of the probe interval, doubled after each failed probe
+SUSPECT_PROBE_RETRIES = 2  # Failed probes that confirm a suspected peer is dead
+KEY_CACHE_SIZE = 64  # Number of key locations cached by each node
+MEMBERSHIP_LOG_SIZE = 256  # Membership changes each node keeps to serve as deltas to clients
+
 # Operations for testing
 chord_operations = ["Node Join", "Insert Keys", "Delete Keys", "Update Keys", "Lookup Keys"]
 
@@ -43,6 +127,32 @@ L = 2 * r
 # Number of nodes to store in the neighbourhood set
 NEIGHBORHOOD_SIZE = 3
 
+JOIN_BOOTSTRAP_CANDIDATES = 3  # Topologically closest nodes a joining node tries to contact
+ROUTING_MAINTENANCE_INTERVAL = 5.0  # Seconds between proximity improvements of the routing table
+FAN_OUT_PARALLELISM = 8  # Requests of a single fan-out in flight at once
+FAN_OUT_TIMEOUT = 30.0  # Seconds each request of a fan-out may take
+ID_CACHE_SIZE = 4096  # Hex IDs and keys whose integer form is kept for routing
+
+# SWIM membership. A failed node is declared dead within about
+# SWIM_PROTOCOL_PERIOD * (number of peers) + 2 * SWIM_PING_TIMEOUT + SWIM_SUSPECT_TIMEOUT seconds
+SWIM_PROTOCOL_PERIOD = 1.0  # Seconds between the pings of each node
+SWIM_PING_TIMEOUT = 0.5  # Seconds to wait for a direct or an indirect ping
+SWIM_INDIRECT_PROBES = 3  # Members asked to ping a peer that did not answer
+SWIM_SUSPECT_TIMEOUT = 3.0  # Seconds a suspect has to refute the suspicion
+GOSSIP_MAX_UPDATES = 8  # Membership updates piggybacked on a single message
+GOSSIP_RETRANSMIT_MULT = 3  # Each update is sent about GOSSIP_RETRANSMIT_MULT * log2(N) times
+
+# Hedged requests. A routed request that the next hop has not answered within the
+# HEDGE_PERCENTILE of this node's recent forwarding latencies is also sent to a second candidate
+HEDGED_OPERATIONS = ["LOOKUP"]  # Only idempotent operations are hedged, empty to disable
+HEDGE_PERCENTILE = 95  # Percentile of the recent latencies used as the hedging delay
+HEDGE_LATENCY_WINDOW = 200  # Recent forwarding latencies kept by each node
+HEDGE_MIN_SAMPLES = 10  # Latencies needed before the percentile is used
+HEDGE_INITIAL_DELAY = 0.1  # Seconds to wait before hedging until then
+HEDGE_MIN_DELAY = 0.01  # Lower bound of the hedging delay, in seconds
+HEDGE_MAX_THREADS = 32  # Forwarded requests sent in the background at once, by all the nodes
+HEDGE_CLAIMED_REQUESTS = 256  # Hedged request IDs each node remembers, to cancel second copies
+
 # The main operations
 main_operations = ["NODE_JOIN", "NODE_LEAVE", "INSERT_KEY", "LOOKUP", "UPDATE_KEY", "DELETE_KEY"]
 
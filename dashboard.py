@@ -120,6 +120,10 @@ class Dashboard(ABC):
         self.info_text.insert(tk.END, node.get_state())
         self.info_text.config(font=("Courier", 11), state=tk.DISABLED)
 
+    # Key of a country in the DHT
+    def hash_key(self, country):
+        return hash_key(country)
+
     # Common select country window
     def select_country_window(self):
         # Get unique countries from the KD Tree of the selected node
@@ -395,7 +399,7 @@ class Dashboard(ABC):
             )
 
             # Generate a key for the country (adjust this if needed)
-            key = hash_key(country)
+            key = self.hash_key(country)
             point = [year, rating, price]
             # Insert the new key into the selected node
             self.selected_node.insert_key(key, point, review, country)
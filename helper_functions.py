@@ -1,17 +1,18 @@
+import functools
 import hashlib
 import matplotlib.pyplot as plt
 
-from constants import R
+from constants import HASH_HEX_DIGITS, ID_CACHE_SIZE, R, b
 
 """---Helper function for the Pasrty Implementation---"""
 
 
-def hash_key(value):
+def hash_key(value, digits=4):
     """
-    Hash the input value and return the last 4 hex digits.
+    Hash the input value and return the last `digits` hex digits (at most 40, the width of SHA-1).
     """
     sha1_hash = hashlib.sha1(value.encode()).hexdigest()
-    return sha1_hash[-4:]
+    return sha1_hash[-digits:]
 
 
 def topological_distance(pos1, pos2):
@@ -21,28 +22,53 @@ def topological_distance(pos1, pos2):
     return abs(pos1 - pos2)
 
 
+@functools.lru_cache(maxsize=ID_CACHE_SIZE)
+def id_int(node_id):
+    """
+    Integer form of a hex node ID or key. Routing compares the same IDs over and over, so the
+    parsed values are kept instead of calling int(node_id, 16) on every comparison.
+    """
+    return int(node_id, 16)
+
+
+def prefix_length(int1, int2, digits=HASH_HEX_DIGITS, bits=b):
+    """
+    Number of leading digits (of `bits` bits each) shared by two integer IDs of `digits` digits.
+    """
+    return digits - ((int1 ^ int2).bit_length() + bits - 1) // bits
+
+
+def ring_distance(int1, int2, id_bits):
+    """
+    Distance between two integer IDs on the ring of 2^id_bits IDs, in the shorter direction.
+    """
+    distance = abs(int1 - int2)
+    return min(distance, (1 << id_bits) - distance)
+
+
+def digit_at(id_int, idx, digits=HASH_HEX_DIGITS, bits=b):
+    """
+    Return the digit at position idx (0 = most significant) of an integer ID.
+    """
+    return (id_int >> (bits * (digits - 1 - idx))) & ((1 << bits) - 1)
+
+
 def common_prefix_length(id1, id2):
     """
     Compute the length of the common prefix between two node IDs.
     """
-    for i in range(len(id1)):
-        if id1[i] != id2[i]:
-            return i
-    return len(id1)
+    return prefix_length(id_int(id1), id_int(id2), len(id1), 4)
 
 
 def hex_distance(id1, id2):
     """
     Calculate the distance between two hexadecimal IDs.
+    Returns the index of the first differing digit (len(id1) if the IDs are identical)
+    and the numerical distance between the two IDs around the ID ring.
     """
-    # Iterate through each character in the IDs
-    for i in range(len(id1)):
-        # Check if the characters at the current position are different
-        if id1[i] != id2[i]:
-            # Return the index of the first differing character and the absolute difference between the two IDs
-            return i, abs(int(id1[i:], 16) - int(id2[i:], 16))
-    # If the IDs are identical, the different digit is set to len(id1) and the distance is 0
-    return len(id1), 0
+    int1 = id_int(id1)
+    int2 = id_int(id2)
+    return prefix_length(int1, int2, len(id1), 4), ring_distance(int1, int2, 4 * len(id1))
 
 
 def hex_compare(id1, id2, equality=True):
@@ -50,30 +76,20 @@ def hex_compare(id1, id2, equality=True):
     Check if id1 >= id2 if equality=True
     or id1 > id2 if equality=False
     """
-    if id1 == id2:
-        if equality:
-            return True
-        return False
-
-    int1 = int(id1, 16)
-    int2 = int(id2, 16)
-    dist = int1 - int2
-    if dist > 0:
-        return True
-    else:
-        return False
+    int1 = id_int(id1)
+    int2 = id_int(id2)
+    return int1 >= int2 if equality else int1 > int2
 
 
-def distance(hex1, hex2):
-    [n1, n2] = [int(str(hex1), 16), int(str(hex2), 16)]
-    if n1 <= n2:
-        return n2 - n1
-    else:
-        return R - n1 + n2
+def distance(id1, id2, ring_size=R):
+    """
+    Clockwise distance from integer ID id1 to integer ID id2 on a ring of ring_size IDs.
+    """
+    return (id2 - id1) % ring_size
 
 
-def int_to_hex(num):
-    return hex(num)[2:].rjust(4, "0")
+def int_to_hex(num, digits=4):
+    return hex(num)[2:].rjust(digits, "0")
 
 
 def plot_hops(hops_counts):
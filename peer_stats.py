@@ -0,0 +1,162 @@
+# (Per-peer request statistics shared by Chord and Pastry nodes)
+import threading
+
+from constants import *
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class PeerStats:
+    """
+    Round-trip times and circuit breakers of the requests a node sends to each of its peers.
+
+    The timeout of a request is the peer's retransmission timeout (RTO), estimated from the
+    replies with the Jacobson/Karels algorithm: SRTT + RTO_K * RTTVAR, between RTO_MIN and
+    RTO_MAX. A failed request doubles the RTO until the next reply (Karn's backoff).
+    Requests in LONG_OPERATIONS wait REQUEST_TIMEOUT instead and are not sampled, their reply
+    time depends on work done beyond the peer (routing, range searches, bulk transfers).
+
+    After BREAKER_THRESHOLD consecutive failures the peer's circuit opens and requests to it
+    fail fast. Once the backoff has passed a single trial request is let through (half-open):
+    a reply closes the circuit, a failure opens it again for twice as long.
+
+    A peer that sheds a request with an overload response is alive, but it is marked busy for
+    OVERLOAD_BACKOFF seconds so that routing can send requests elsewhere meanwhile.
+    """
+
+    def __init__(self, clock):
+        """
+        Args:
+            clock (callable): Returns the current time in seconds (the scheduler's clock, so
+                simulated networks measure virtual time).
+        """
+        self.clock = clock
+        self.peers = {}  # Dictionary. Keys are peer IDs, values are dictionaries of statistics
+        self.lock = threading.Lock()
+
+    def allow(self, peer_id):
+        """
+        Check if a request may be sent to the peer. An open circuit rejects requests until its
+        backoff has passed, then lets a single trial request through.
+        """
+        with self.lock:
+            peer = self._peer(peer_id)
+            peer["requests"] += 1
+            if peer["state"] == CLOSED:
+                return True
+            if peer["state"] == OPEN and self.clock() >= peer["retry_at"]:
+                peer["state"] = HALF_OPEN
+                return True
+            peer["rejected"] += 1
+            return False
+
+    def retry_delay(self, peer_id):
+        """
+        Return the seconds until the peer's circuit lets a request through, 0 if it does now.
+        """
+        peer = self.peers.get(peer_id)
+        if peer is None or peer["state"] != OPEN:
+            return 0
+        return max(peer["retry_at"] - self.clock(), 0)
+
+    def timeout(self, peer_id, operation):
+        """
+        Return the seconds to wait for the reply of a request to the peer.
+        """
+        if operation in LONG_OPERATIONS:
+            return REQUEST_TIMEOUT
+        peer = self.peers.get(peer_id)
+        return peer["rto"] if peer is not None else RTO_INITIAL
+
+    def record_reply(self, peer_id, operation, rtt):
+        """
+        The peer replied after rtt seconds. Update its RTT estimate and close its circuit.
+        """
+        with self.lock:
+            peer = self._peer(peer_id)
+            if operation not in LONG_OPERATIONS:
+                if peer["srtt"] is None:
+                    peer["srtt"] = rtt
+                    peer["rttvar"] = rtt / 2
+                else:
+                    peer["rttvar"] += RTT_BETA * (abs(peer["srtt"] - rtt) - peer["rttvar"])
+                    peer["srtt"] += RTT_ALPHA * (rtt - peer["srtt"])
+                rto = peer["srtt"] + RTO_K * peer["rttvar"]
+                peer["rto"] = min(max(rto, RTO_MIN), RTO_MAX)
+
+            peer["consecutive_failures"] = 0
+            peer["state"] = CLOSED
+            peer["backoff"] = BREAKER_BACKOFF
+
+    def record_failure(self, peer_id):
+        """
+        A request to the peer failed or timed out. Back off its RTO and open its circuit after
+        BREAKER_THRESHOLD consecutive failures, or at once if the failed request was a trial.
+        """
+        with self.lock:
+            peer = self._peer(peer_id)
+            peer["failures"] += 1
+            peer["consecutive_failures"] += 1
+            peer["rto"] = min(peer["rto"] * 2, RTO_MAX)
+
+            if peer["state"] == HALF_OPEN:
+                peer["backoff"] = min(peer["backoff"] * 2, BREAKER_MAX_BACKOFF)
+            elif peer["state"] == OPEN or peer["consecutive_failures"] < BREAKER_THRESHOLD:
+                return
+            peer["state"] = OPEN
+            peer["retry_at"] = self.clock() + peer["backoff"]
+
+    def record_overload(self, peer_id):
+        """
+        The peer replied that it is overloaded. It is alive, but mark it busy for a while.
+        """
+        with self.lock:
+            peer = self._peer(peer_id)
+            peer["overloaded"] += 1
+            peer["busy_until"] = self.clock() + OVERLOAD_BACKOFF
+            peer["consecutive_failures"] = 0
+            peer["state"] = CLOSED
+            peer["backoff"] = BREAKER_BACKOFF
+
+    def is_busy(self, peer_id):
+        """
+        Check if the peer has recently shed a request.
+        """
+        peer = self.peers.get(peer_id)
+        return (
+            peer is not None
+            and peer["busy_until"] is not None
+            and (self.clock() < peer["busy_until"])
+        )
+
+    def stats(self, peer_id=None):
+        """
+        Return a copy of the statistics of a peer, or of every peer as a dictionary keyed by ID.
+        """
+        with self.lock:
+            if peer_id is not None:
+                peer = self.peers.get(peer_id)
+                return dict(peer) if peer is not None else None
+            return {peer_id: dict(peer) for peer_id, peer in self.peers.items()}
+
+    def _peer(self, peer_id):
+        peer = self.peers.get(peer_id)
+        if peer is None:
+            peer = {
+                "srtt": None,  # Smoothed round-trip time
+                "rttvar": None,  # Round-trip time variation
+                "rto": RTO_INITIAL,  # Timeout of the next request
+                "state": CLOSED,  # Circuit breaker state
+                "backoff": BREAKER_BACKOFF,  # Seconds the circuit stays open
+                "retry_at": None,  # Time of the next trial request while the circuit is open
+                "requests": 0,  # Requests attempted, including rejected ones
+                "failures": 0,  # Requests that failed or timed out
+                "consecutive_failures": 0,
+                "rejected": 0,  # Requests failed fast by the open circuit
+                "overloaded": 0,  # Requests shed by the peer
+                "busy_until": None,  # Time until which the peer is routed around
+            }
+            self.peers[peer_id] = peer
+        return peer
@@ -0,0 +1,165 @@
+# (Admission control for the requests a node receives over sockets)
+import threading
+from collections import deque
+
+from constants import *
+
+CONTROL = "control"
+ROUTING = "routing"
+DATA = "data"
+PRIORITIES = [CONTROL, ROUTING, DATA]  # Highest priority first
+
+
+def request_class(operation):
+    """
+    Return the class of an operation: control (membership and maintenance), routing, or data.
+    """
+    if operation in CONTROL_OPERATIONS:
+        return CONTROL
+    if operation in ROUTING_OPERATIONS:
+        return ROUTING
+    return DATA
+
+
+def overload_response(node_id, operation):
+    """
+    The reply of a node that sheds a request. The request was not processed, so the sender
+    may retry it elsewhere or later.
+    """
+    return {
+        "status": "overloaded",
+        "message": f"Node {node_id} is overloaded. {operation} request not processed.",
+    }
+
+
+def is_overloaded(response):
+    """
+    Check if a response is the reply of a node that shed the request.
+    """
+    return isinstance(response, dict) and response.get("status") == "overloaded"
+
+
+class RequestPool:
+    """
+    Worker pool of a node with one bounded queue per request class.
+
+    Idle workers take the oldest request of the highest priority class (control, then routing,
+    then data) that is below its worker limit, so control requests never wait behind a burst of
+    data requests. Routing and data requests together occupy at most max_workers - control_reserved
+    workers, so the reserved workers are always free for control traffic.
+    A request whose class queue is full is rejected at once instead of waiting, and the node
+    replies with an overload response.
+    """
+
+    def __init__(
+        self,
+        max_workers=REQUEST_WORKERS,
+        queue_limits=REQUEST_QUEUE_LIMITS,
+        worker_limits=REQUEST_WORKER_LIMITS,
+        control_reserved=REQUEST_CONTROL_RESERVED,
+    ):
+        """
+        Args:
+            max_workers (int): Number of worker threads, started as requests arrive.
+            queue_limits (dict): Requests of each class that may wait for a worker.
+            worker_limits (dict): Workers that the requests of each class may occupy at once.
+            control_reserved (int): Workers that only control requests may occupy.
+        """
+        if not 0 < control_reserved < max_workers:
+            raise ValueError("control_reserved must leave workers for routing and data requests.")
+        self.max_workers = max_workers
+        self.queue_limits = queue_limits
+        self.worker_limits = worker_limits
+        self.shared_limit = max_workers - control_reserved  # Routing and data workers at once
+
+        self.queues = {request_class: deque() for request_class in PRIORITIES}
+        self.running = {request_class: 0 for request_class in PRIORITIES}
+        # Dictionary. Keys are request classes, values are the number of requests shed
+        self.rejected = {request_class: 0 for request_class in PRIORITIES}
+        self.condition = threading.Condition()
+        self.shutting_down = False
+
+        self.workers = []
+        self.idle = 0  # Workers waiting for a request
+
+    def submit(self, request_class, fn, *args):
+        """
+        Queue fn(*args) in the queue of the request class.
+        Returns False if the queue is full (or the pool is shut down) and the call was not queued.
+        """
+        with self.condition:
+            queue = self.queues[request_class]
+            if self.shutting_down or len(queue) >= self.queue_limits[request_class]:
+                self.rejected[request_class] += 1
+                return False
+            queue.append((fn, args))
+            if self.idle == 0 and len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.condition.notify()
+        return True
+
+    def shutdown(self, wait=False):
+        """
+        Stop taking requests. Queued requests are dropped, running ones finish.
+        """
+        with self.condition:
+            self.shutting_down = True
+            for queue in self.queues.values():
+                queue.clear()
+            self.condition.notify_all()
+        if wait:
+            for worker in list(self.workers):
+                worker.join()
+
+    def stats(self):
+        """
+        Return the queued, running and rejected requests of each class.
+        """
+        with self.condition:
+            return {
+                request_class: {
+                    "queued": len(self.queues[request_class]),
+                    "running": self.running[request_class],
+                    "rejected": self.rejected[request_class],
+                }
+                for request_class in PRIORITIES
+            }
+
+    def _next(self):
+        """
+        Pop the next request to run, or return None if no class may run one now.
+        """
+        shared = self.running[ROUTING] + self.running[DATA]
+        for request_class in PRIORITIES:
+            if (
+                self.queues[request_class]
+                and self.running[request_class] < self.worker_limits[request_class]
+                and (request_class == CONTROL or shared < self.shared_limit)
+            ):
+                self.running[request_class] += 1
+                return request_class, self.queues[request_class].popleft()
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                task = self._next()
+                while task is None and not self.shutting_down:
+                    self.idle += 1
+                    self.condition.wait()
+                    self.idle -= 1
+                    task = self._next()
+                if task is None:
+                    return
+
+            request_class, (fn, args) = task
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error handling request: {e}")
+            finally:
+                with self.condition:
+                    self.running[request_class] -= 1
+                    self.condition.notify()
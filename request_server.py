@@ -0,0 +1,62 @@
+# (Serving the requests a node receives over sockets through its request pool)
+import time
+
+from constants import *
+from request_pool import overload_response, request_class
+from transport import receive_message, send_message
+
+
+class RequestServer:
+    """
+    Mixin for the DHT nodes that accept requests on a socket server.
+
+    The node provides node_id, thread_pool (a RequestPool) and _process_request(request), which
+    dispatches a request to its handler and returns the response.
+    """
+
+    def _admit_request(self, conn):
+        """
+        Read an incoming request and queue it by class (control, routing or data).
+        If the queue of its class is full, reply at once with an overload response.
+        A request that waits in the queue for more than REQUEST_MAX_QUEUE_WAIT seconds is shed
+        when it reaches a worker.
+        """
+        try:
+            conn.settimeout(RECEIVE_TIMEOUT)
+            request = receive_message(conn)
+            conn.settimeout(None)
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            conn.close()
+            return
+        if request is None:
+            conn.close()
+            return
+
+        operation = request.get("operation")
+        if self.thread_pool.submit(
+            request_class(operation), self._handle_request, conn, request, time.monotonic()
+        ):
+            return
+
+        print(f"Node {self.node_id}: Overloaded. Shedding {operation} request.")
+        try:
+            send_message(conn, overload_response(self.node_id, operation))
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            conn.close()
+
+    def _handle_request(self, conn, request, queued_at):
+        try:
+            operation = request.get("operation")
+            if time.monotonic() - queued_at > REQUEST_MAX_QUEUE_WAIT:
+                print(f"Node {self.node_id}: Overloaded. Shedding {operation} request.")
+                response = overload_response(self.node_id, operation)
+            else:
+                response = self._process_request(request)
+            send_message(conn, response)
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            conn.close()
@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StabilizationScheduler:
+    """
+    Process-wide scheduler for the periodic maintenance tasks of every DHT node.
+
+    A single dispatcher thread keeps a heap of timers ordered by due time and hands every due
+    task to a small, fixed worker pool. A periodic task is rescheduled only after its run
+    finishes, so runs of the same task never overlap, and every period is jittered so that the
+    ticks of different nodes do not line up.
+
+    The workers are shared by every node, so tasks must not block for long. The requests they
+    send wait at most MAINTENANCE_TIMEOUT seconds for a reply.
+    """
+
+    def __init__(self, max_workers=4, jitter=0.1):
+        """
+        Args:
+            max_workers (int): Number of worker threads that run the tasks.
+            jitter (float): Maximum relative deviation of each period (0.1 = +-10%).
+        """
+        self.jitter = jitter
+        self.random = random.Random()
+
+        self.events = []  # Heap of (due time, sequence, timer) entries
+        self._sequence = itertools.count()
+        self.condition = threading.Condition()
+
+        self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def call_every(self, interval, callback, *args):
+        """
+        Run callback(*args) every `interval` seconds until the timer is cancelled.
+        The first run happens at a random point of the first period.
+        """
+        timer = {"callback": callback, "args": args, "interval": interval, "cancelled": False}
+        self._push(time.monotonic() + self.random.uniform(0, interval), timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run callback(*args) once after `delay` seconds.
+        """
+        timer = {"callback": callback, "args": args, "interval": None, "cancelled": False}
+        self._push(time.monotonic() + delay, timer)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel a timer. A run that is already in progress finishes, but no new run starts.
+        """
+        timer["cancelled"] = True
+
+    def clock(self):
+        """
+        Return the current time in seconds, the time base of the timers.
+        """
+        return time.monotonic()
+
+    def lock(self):
+        """
+        Return a lock for node state that a task may hold while it waits for a response.
+        """
+        return threading.Lock()
+
+    def _push(self, when, timer):
+        with self.condition:
+            heapq.heappush(self.events, (when, next(self._sequence), timer))
+            self.condition.notify()
+
+    def _dispatch(self):
+        """
+        Wait for the earliest timer to become due and submit it to the worker pool.
+        """
+        while True:
+            with self.condition:
+                while not self.events:
+                    self.condition.wait()
+
+                when, _, timer = self.events[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(timeout=delay)
+                    continue  # An earlier timer may have been pushed meanwhile
+
+                heapq.heappop(self.events)
+
+            if not timer["cancelled"]:
+                self.thread_pool.submit(self._run, timer)
+
+    def _run(self, timer):
+        if timer["cancelled"]:
+            return
+        try:
+            timer["callback"](*timer["args"])
+        except Exception as e:
+            print(f"Scheduler: Task {timer['callback'].__name__} failed. Error: {e}")
+        finally:
+            if timer["interval"] is not None and not timer["cancelled"]:
+                period = timer["interval"] * (1 + self.random.uniform(-self.jitter, self.jitter))
+                self._push(time.monotonic() + period, timer)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Return the stabilization scheduler shared by all the Chord and Pastry nodes of this process.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = StabilizationScheduler()
+        return _scheduler
@@ -0,0 +1,186 @@
+# (Common transports for delivering requests between Chord and Pastry nodes)
+import copy
+import itertools
+import pickle
+import socket
+import struct
+import threading
+
+from request_pool import RequestPool
+
+
+def receive_message(conn):
+    """
+    Read a length-prefixed pickle from a socket.
+    Returns None if the connection is closed before a message arrives.
+    """
+    # Receive the length of the incoming data (first 4 bytes)
+    length_data = conn.recv(4)
+    if not length_data:
+        return None
+    data_length = struct.unpack(">I", length_data)[0]
+
+    # Receive the actual data
+    data = b""
+    while len(data) < data_length:
+        chunk = conn.recv(min(data_length - len(data), 1024 * 1024))
+        if not chunk:
+            break
+        data += chunk
+
+    return pickle.loads(data)  # Deserialize the message
+
+
+def send_message(conn, message):
+    """
+    Write a message to a socket as a length-prefixed pickle.
+    """
+    data = pickle.dumps(message)
+
+    # Send the length of the data first (4 bytes), then the data
+    conn.sendall(struct.pack(">I", len(data)))
+    conn.sendall(data)
+
+
+class SocketTransport:
+    """
+    Deliver requests over loopback TCP sockets as length-prefixed pickles.
+    Every node runs its own socket server and its own thread pool.
+    """
+
+    def allocate_port(self, node):
+        """
+        Reserve a free local port for the node.
+        """
+        return node._generate_port()
+
+    def create_thread_pool(self):
+        """
+        Create the worker pool that handles the node's incoming requests,
+        with a bounded queue per request class.
+        """
+        return RequestPool()
+
+    def start(self, port, node):
+        """
+        Start the socket server thread of the node.
+        """
+        server_thread = threading.Thread(target=node._server, daemon=True)
+        server_thread.start()
+
+    def stop(self, port, node):
+        """
+        Stop handing requests to the node's thread pool.
+        """
+        node.thread_pool.shutdown(wait=False)
+
+    def send_request(self, port, request, timeout=120):
+        """
+        Send a request to the node listening on the given port and wait for its response.
+        The timeout (in seconds) applies to the connection and to every read of the response.
+        """
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.settimeout(timeout)  # Timeout to avoid long delays
+                s.connect(("localhost", port))
+
+                # Serialize the request
+                data = pickle.dumps(request)
+
+                # Send the length of the data first (4 bytes)
+                s.sendall(struct.pack(">I", len(data)))
+
+                # Send the actual data
+                s.sendall(data)
+
+                # Receive the response length
+                response_length_data = s.recv(4)
+                if not response_length_data:
+                    return None
+                response_length = struct.unpack(">I", response_length_data)[0]
+
+                # Receive the response data
+                response_data = b""
+                while len(response_data) < response_length:
+                    chunk = s.recv(min(response_length - len(response_data), 1024 * 1024))
+                    if not chunk:
+                        break
+                    response_data += chunk
+
+                return pickle.loads(response_data)
+        except (socket.error, EOFError, pickle.PickleError) as e:
+            print(f"Network: Failed to send request to node at port {port}. Error: {e}")
+            return None  # Return None to indicate failure
+
+
+class InProcessTransport:
+    """
+    Deliver requests by dispatching them directly into the receiving node's request handler.
+    No sockets or pickling are involved, so large networks can be simulated in one process.
+
+    Handlers run synchronously in the sender's thread and there is no thread pool. A routed
+    request is handled by every hop of its route on the same thread, so handing hops to a
+    bounded pool could deadlock once every worker waits for a queued hop. Requests are
+    therefore neither queued nor shed, and a slow handler blocks its sender.
+    """
+
+    def __init__(self, copy_payloads=True):
+        """
+        Args:
+            copy_payloads (bool): Deep copy requests and responses so that nodes never share
+                mutable state (what pickling does in the socket transport).
+        """
+        self.copy_payloads = copy_payloads
+        self.nodes = {}  # Dictionary. Keys are ports, values are Node objects
+        self.lock = threading.Lock()
+        self._ports = itertools.count(1024)
+
+    def allocate_port(self, node):
+        """
+        Hand out a virtual port. No real socket is bound.
+        """
+        with self.lock:
+            port = next(self._ports)
+            node.network.used_ports.append(port)
+        return port
+
+    def create_thread_pool(self):
+        """
+        No pool is needed, requests are handled in the sender's thread.
+        """
+        return None
+
+    def start(self, port, node):
+        """
+        Register the node so that requests to its port are dispatched to it.
+        """
+        self.nodes[port] = node
+
+    def stop(self, port, node):
+        """
+        Unregister the node. Requests to its port fail from now on.
+        """
+        self.nodes.pop(port, None)
+
+    def send_request(self, port, request, timeout=None):
+        """
+        Dispatch a request to the node registered on the given port and return its response.
+        The request runs inline in the caller's thread, so the timeout is not enforced.
+        """
+        node = self.nodes.get(port)
+        if node is None or not node.running:
+            print(f"Network: Failed to send request to node at port {port}. Error: node is down")
+            return None
+
+        if self.copy_payloads:
+            request = copy.deepcopy(request)
+
+        try:
+            response = node._process_request(request)
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            return None
+
+        if self.copy_payloads:
+            response = copy.deepcopy(response)
+        return response